@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+import time
 from photutils import CircularAperture, CircularAnnulus, aperture_photometry
 from photutils.detection import DAOStarFinder
 from photutils.background import MedianBackground
@@ -9,9 +10,15 @@ from skimage.feature import blob_log
 from skimage.color import rgb2gray
 from skimage.util import img_as_float
 from scipy.ndimage import gaussian_filter
+from bufferpool import BufferPool
+from regions import make_regions, region_slices
+
+# gamma 3.5 brightening of the star crop in calculate_profile
+GAMMA_LUT = ((np.arange(256) / 255.0) ** (1.0 / 3.5) * 255).astype(np.uint8)
 
 class Analyzer:
     _instance = None
+    WINDOW_PAD = 32     # windowed detection: pixels added to max_distance so star and centroid crop fit the window
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -21,6 +28,7 @@ class Analyzer:
     def __init__(self):
         if not hasattr(self, '_initialized'):
             self._initialized = True
+            self.pool = BufferPool("analyzer")     # grayscale conversions of color frames
 
 #       How It Works
 #       Initial Centroid:
@@ -38,72 +46,138 @@ class Analyzer:
 #       Adds the crop’s top-left corner (x0, y0) to the weighted centroid (cx_weighted, cy_weighted) to get full-image coordinates (cx_full, cy_full).
 #       Returns as a tuple of floats for sub-pixel precision.
 
-    def detect_stars(self, frame, search_near=None, gray_threshold=128, star_size=2, max_distance=10):
+    def detect_stars(self, frame, search_near=None, gray_threshold=128, star_size=2, max_distance=10, thresh_out=None, trace=None,
+                     windowed=False, diagnostics=True):
+        # thresh_out: optional uint8 buffer of the frame size the threshold image is written to
+        # trace: optional metadata record of the frame, gets the detection time stamped into it
+        # windowed: with search_near, only convert, threshold and search windows of max_distance + WINDOW_PAD
+        #   around the search points; the threshold image is black elsewhere. A star is only matched within
+        #   max_distance of its search point, which the window always covers, so a star not found in its
+        #   window is lost the same way as in a full-frame search.
+        # diagnostics: False skips the star profile image (detail is None) and, in windowed detection, the
+        #   full-frame threshold image (thresh is None); only the centroids and focus metric are computed
+        start = time.perf_counter()
+        gray_buf = None
+        if len(frame.shape) == 3:
+            gray_buf = self.pool.acquire(frame.shape[:2], frame.dtype)
+        if thresh_out is not None and thresh_out.shape != frame.shape[:2]:
+            thresh_out = None
+        windows = None
+        if windowed and search_near:
+            windows = make_regions(search_near, int(max_distance) + self.WINDOW_PAD, frame.shape[0], frame.shape[1]) or None
+        try:
+            return self._detect_stars(frame, gray_buf, search_near, gray_threshold, star_size, max_distance, thresh_out,
+                                      diagnostics, windows)
+        finally:
+            if gray_buf is not None:
+                gray_buf.release()     # results never reference gray, see _detect_star
+            if trace is not None:
+                trace["detect_time"] = time.perf_counter() - start
+                trace["detected"] = time.time()
+
+    def _detect_stars(self, frame, gray_buf, search_near, gray_threshold, star_size, max_distance, thresh_out, diagnostics,
+                      windows=None):
         result = []
         enhanced_with_profile = None
         thresh = None
         focus_metric = 0
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
-        _, thresh = cv2.threshold(gray, gray_threshold, 255, cv2.THRESH_BINARY)
-        # Pre-filter small contours with morphological opening
-        #kernel_size = int(np.sqrt(star_size) / 2) * 2 + 1  # Rough estimate, ensure odd
-        #kernel = np.ones((kernel_size, kernel_size), np.uint8)
-        #thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        gray, thresh, contours = self._threshold(frame, gray_buf, gray_threshold, thresh_out, windows, diagnostics)
+        if not contours and search_near is not None:
+            result = [None] * len(search_near)      # every star lost
         if contours:
+            moments, areas, positions = self._contour_table(contours)
             if search_near is None:
                 # Find the largest contour if no search_near provided
-                centroid, enhanced_with_profile, thresh, focus_metric = self._detect_star(frame, thresh, gray, contours, search_near=None, gray_threshold=gray_threshold, star_size=star_size,max_distance=max_distance)
-                result.append(centroid)
+                matches = [int(np.argmax(areas))]
             else:
-                for near in search_near:
-                    if enhanced_with_profile is None:
-                        centroid, enhanced_with_profile, thresh, focus_metric = self._detect_star(frame, thresh, gray, contours, search_near=near, gray_threshold=gray_threshold, star_size=star_size, max_distance=max_distance)
-                    else:
-                        centroid, _, _, _ = self._detect_star(frame, thresh, gray, contours, search_near=near, gray_threshold=gray_threshold, star_size=star_size, max_distance=max_distance)
-                    result.append(centroid)
+                matches = self._match_contours(areas, positions, search_near, star_size, max_distance)
+            for match in matches:
+                if match is None or areas[match] <= star_size:
+                    #print(f"No valid star found, elements={len(contours)}")
+                    result.append(None)
+                    continue
+                # the profile is only shown for the first star found
+                centroid, enhanced, thresh, metric = self._detect_star(thresh, gray, moments[match], areas[match],
+                                                                       profile=diagnostics and enhanced_with_profile is None)
+                if enhanced_with_profile is None:
+                    enhanced_with_profile, focus_metric = enhanced, metric
+                result.append(centroid)
+        if not diagnostics:
+            enhanced_with_profile = None
         
         return result, enhanced_with_profile, thresh, focus_metric
 
-    def _detect_star(self, frame, thresh, gray, contours, search_near=None, gray_threshold=128, star_size=2, max_distance=10):
-        
-        # Find the largest or nearest contour with size > star_size
-        largest = None
-        if search_near is not None:
-            # Calculate all distances first
-            distance_data = []
-            search_near = np.array(search_near)
-            for c in contours:
-                if len(c) > 0:
-                    mean_pos = np.mean(c, axis=0)[0]
-                    distance = np.linalg.norm(mean_pos - search_near)
-                    distance_data.append((distance, c))
-            
-            if distance_data:
-                # Sort by distance
-                distance_data.sort(key=lambda x: x[0])
-                # Check areas in order until we find one > star_size
-                for distance, contour in distance_data:
-                    area = cv2.contourArea(contour)
-                    if area > star_size and distance < max_distance:
-                        largest = contour
-                        break
-        else:
-            largest = max(contours, key=cv2.contourArea)
-
-        if largest is None:
-            #print("No valid star found")
-            return None, None, thresh, 0
-        
-        # Check if contour is large enough
-        size = cv2.contourArea(largest)
-        if size <= star_size:
-            #print(f"Size too small {size}, elements={len(contours)}")
-            return None, None, thresh, 0
-
-        # Initial unweighted centroid and moments
-        M = cv2.moments(largest)
+    def _threshold(self, frame, gray_buf, gray_threshold, thresh_out, windows, diagnostics=True):
+        # gray and threshold image of the whole frame or only of the (y0, y1, x0, x1) windows, and the contours in them
+        # without diagnostics the windows are thresholded into pool buffers of their own and thresh is None
+        # frame may be uint8, float32 in 0..255 units (integrated) or full range uint16
+        level = float(gray_threshold * 257 if frame.dtype == np.uint16 else gray_threshold)
+        if windows is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray_buf.array) if gray_buf is not None else frame
+            # 255 above level, 0 elsewhere, directly as the 8-bit image findContours needs
+            thresh = cv2.compare(gray, level, cv2.CMP_GT, dst=thresh_out)
+            # Pre-filter small contours with morphological opening
+            #kernel_size = int(np.sqrt(star_size) / 2) * 2 + 1  # Rough estimate, ensure odd
+            #kernel = np.ones((kernel_size, kernel_size), np.uint8)
+            #thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            return gray, thresh, contours
+
+        # the crops are views, OpenCV writes into them in place and offset= maps contours to frame coordinates
+        gray = gray_buf.array if gray_buf is not None else frame
+        thresh = None
+        if diagnostics:
+            thresh = thresh_out if thresh_out is not None else np.empty(frame.shape[:2], dtype=np.uint8)
+            thresh.fill(0)
+        contours = []
+        for rows, cols in region_slices(windows):
+            if gray_buf is not None:
+                cv2.cvtColor(frame[rows, cols], cv2.COLOR_BGR2GRAY, dst=gray[rows, cols])
+            window_buf = None
+            if thresh is not None:
+                window = thresh[rows, cols]
+            else:
+                window_buf = self.pool.acquire((rows.stop - rows.start, cols.stop - cols.start), np.uint8)
+                window = window_buf.array
+            cv2.compare(gray[rows, cols], level, cv2.CMP_GT, dst=window)
+            found, _ = cv2.findContours(window, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(cols.start, rows.start))
+            contours.extend(found)
+            if window_buf is not None:
+                window_buf.release()    # contours are arrays of their own
+        return gray, thresh, contours
+
+    @staticmethod
+    def _contour_table(contours):
+        # moments, areas and mean point positions of all contours, computed once per frame
+        moments = [cv2.moments(c) for c in contours]
+        areas = np.array([M["m00"] for M in moments])          # m00 of a contour is its area
+        lengths = np.array([len(c) for c in contours])
+        points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        positions = np.add.reduceat(points, starts, axis=0) / lengths[:, None]
+        return moments, areas, positions
+
+    @staticmethod
+    def _match_contours(areas, positions, search_near, star_size, max_distance):
+        # index of the nearest contour larger than star_size within max_distance, per search point (None = no match)
+        valid = [i for i, near in enumerate(search_near) if near is not None]
+        matches = [None] * len(search_near)
+        if not valid:
+            return matches
+        near = np.array([search_near[i] for i in valid], dtype=np.float64)
+        distances = np.linalg.norm(positions[None, :, :] - near[:, None, :], axis=2)     # (points, contours)
+        distances[:, areas <= star_size] = np.inf
+        distances[distances >= max_distance] = np.inf
+        nearest = np.argmin(distances, axis=1)
+        found = np.isfinite(distances[np.arange(len(valid)), nearest])
+        for i, index, ok in zip(valid, nearest, found):
+            if ok:
+                matches[i] = int(index)
+        return matches
+
+    def _detect_star(self, thresh, gray, M, size, profile=True):
+        # Centroid of the contour with moments M and area size, refined on the gray image
         if M["m00"] == 0:
             return None, None, thresh, size
         cx = int(M["m10"] / M["m00"])
@@ -132,7 +206,10 @@ class Analyzer:
 
         # Optional: Background subtraction
         background = np.median(star_region)
-        star_region = cv2.subtract(star_region, int(background))
+        if np.issubdtype(star_region.dtype, np.integer):
+            star_region = cv2.subtract(star_region, int(background))   # saturates at 0
+        else:
+            star_region = np.maximum(star_region - np.float32(background), 0)
         
         
         # Make a copy of star_region
@@ -153,6 +230,10 @@ class Analyzer:
 
         # Calculate profile and focus metric
         focus_metric = float(np.std(enhanced_star_region))  # Standard deviation as focus metric
+        if enhanced_star_region.dtype == np.uint16:
+            focus_metric /= 257                             # in 8-bit units like the thresholds
+        if not profile:
+            return (cx_full, cy_full), enhanced_star_region, thresh, focus_metric
         enhanced_with_profile = self.calculate_profile(enhanced_star_region, cx_weighted, cy_weighted)
         #print(f"Found precise centroid: {cx_full}, {cy_full}")
 
@@ -162,12 +243,8 @@ class Analyzer:
     def calculate_profile(self, enhanced_star_region, cx_weighted, cy_weighted):
         # Calculate horizontal intensity profile (left to right)
         h, w = enhanced_star_region.shape
-        profile = np.zeros(w, dtype=np.float32)  # One value per column
-
         # Average intensity across each column
-        for x in range(w):
-            column = enhanced_star_region[:, x]
-            profile[x] = np.mean(column) if column.size > 0 else 0
+        profile = enhanced_star_region.mean(axis=0, dtype=np.float64).astype(np.float32) if h > 0 else np.zeros(w, dtype=np.float32)
 
         # Normalize profile to fit image height (0 to h-1)
         profile_max = np.max(profile)
@@ -178,25 +255,29 @@ class Analyzer:
             profile_normalized = np.zeros_like(profile)  # Flat line if no variation
 
         # Convert to BGR for yellow plotting
+        if enhanced_star_region.dtype != np.uint8:
+            scale = 1 / 257 if enhanced_star_region.dtype == np.uint16 else 1
+            enhanced_star_region = np.clip(enhanced_star_region * scale, 0, 255).astype(np.uint8)
         # Apply gamma correction with gamma = 3.5
-        gamma = 3.5
-        inv_gamma = 1.0 / gamma
-        lut = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
-        enhanced_star_region = cv2.LUT(enhanced_star_region, lut)
+        enhanced_star_region = cv2.LUT(enhanced_star_region, GAMMA_LUT)
 
         enhanced_star_region_bgr = cv2.cvtColor(enhanced_star_region, cv2.COLOR_GRAY2BGR)
         yellow = (0, 255, 255)  # BGR: Yellow
 
-        # Plot profile as a line graph from left to right
-        for x in range(w - 1):
-            y1 = int(h - 1 - profile_normalized[x])  # Invert y (0 at bottom)
-            y2 = int(h - 1 - profile_normalized[x + 1])
-            cv2.line(enhanced_star_region_bgr, (x, y1), (x + 1, y2), yellow, 1)
+        # Plot profile as a line graph from left to right, y inverted (0 at bottom)
+        points = np.empty((w, 2), dtype=np.int32)
+        points[:, 0] = np.arange(w)
+        points[:, 1] = h - 1 - profile_normalized       # truncated like int()
+        if w > 1:
+            cv2.polylines(enhanced_star_region_bgr, [points], False, yellow, 1)
 
         return enhanced_star_region_bgr
     
 
-    def analyze_snr(self, img, snr_threshold=1.5, detection_threshold_sigma=4, fwhm = 3):
+    def analyze_snr(self, img, snr_threshold=1.5, detection_threshold_sigma=4, fwhm = 3, progress=None):
+        # progress: optional callback(fraction) between the stages, may raise to abort the analysis
+        if progress is None:
+            progress = lambda fraction: None
         
         print(f"analyze_snr start")
         #ensure frame is black and white
@@ -212,6 +293,7 @@ class Analyzer:
         # === BACKGROUND STATISTICS ===
         mean, median, std = sigma_clipped_stats(image, sigma=3.0)
         #print(f"Background: mean={mean:.2f}, median={median:.2f}, std={std:.2f}")
+        progress(0.2)
 
         smoothed = gaussian_filter(image, sigma=gaussian_sigma)
         #sigma_clip = SigmaClip(sigma=3.)
@@ -220,6 +302,8 @@ class Analyzer:
         #std = np.std(smoothed - bkg)
         #print(f"std={std:.2f}")
 
+        progress(0.3)
+
         # === STAR DETECTION ===
         daofind = DAOStarFinder(fwhm=fwhm, threshold=detection_threshold_sigma * std)
         sources = daofind(smoothed - bkg)
@@ -227,15 +311,14 @@ class Analyzer:
 
         if sources is None or len(sources) == 0:
             print("No stars found!")
-            exit()
+            return []
 
-        # === PHOTOMETRY ===
-        results = []
+        progress(0.7)
 
-        for row in sources:
-            snr_info = self.estimate_star_snr(image, (row['xcentroid'], row['ycentroid']))
-            if snr_info is not None and snr_info['snr'] > snr_threshold:
-                results.append(snr_info)
+        # === PHOTOMETRY ===
+        positions = list(zip(sources['xcentroid'], sources['ycentroid']))
+        results = [snr_info for snr_info in self.estimate_stars_snr(image, positions)
+                   if snr_info is not None and snr_info['snr'] > snr_threshold]
 
         for star in results:
             print(f"Star at ({star['x']:.2f}, {star['y']:.2f}): SNR={star['snr']:.2f}, Signal={star['signal']:.2f}, Background={star['background']:.2f}, Noise={star['noise']:.2f}")
@@ -245,42 +328,67 @@ class Analyzer:
         
     # === SNR ESTIMATION ===
     def estimate_star_snr(self,image, position, cutout_size=30, smooth_sigma=1.0, threshold_sigma=3.0):
-        
+        return self.estimate_stars_snr(image, [position], cutout_size, smooth_sigma, threshold_sigma)[0]
+
+    def estimate_stars_snr(self, image, positions, cutout_size=30, smooth_sigma=1.0, threshold_sigma=3.0):
+        # SNR of all stars at once: the cutouts are stacked into one (stars, size, size) array that is
+        # smoothed with a single filter call, background statistics, masks, signal and noise are per
+        # cutout along the first axis. Returns one result (or None for edge and empty cutouts) per position.
         height, width = image.shape
-        x, y = int(position[0]), int(position[1])
         half = cutout_size // 2
+        results = [None] * len(positions)
+        if len(positions) == 0:
+            return results
+
+        xy = np.array([(int(x), int(y)) for x, y in positions], dtype=np.intp).reshape(-1, 2)
+        x, y = xy[:, 0], xy[:, 1]
+        inside = (y - half >= 0) & (y + half < height) & (x - half >= 0) & (x + half < width)   # skip edge stars
+        index = np.flatnonzero(inside)
+        if len(index) == 0:
+            return results
+
+        offsets = np.arange(-half, half + 1)
+        rows = y[index, None, None] + offsets[None, :, None]
+        cols = x[index, None, None] + offsets[None, None, :]
+        cutouts = image[rows, cols].astype(np.float32, copy=False)
+
+        mean, median, std = self._sigma_clipped_stats(cutouts.reshape(len(index), -1), sigma=3.0)
+
+        smoothed = gaussian_filter(cutouts, sigma=(0, smooth_sigma, smooth_sigma))    # no smoothing across stars
+        star_mask = smoothed > (median + threshold_sigma * std)[:, None, None]
+
+        n_pix = star_mask.sum(axis=(1, 2))
+        star_sum = np.where(star_mask, cutouts, 0).sum(axis=(1, 2), dtype=np.float64)
+        signal = star_sum - n_pix * median
+        with np.errstate(invalid='ignore', divide='ignore'):
+            noise = np.sqrt(star_sum + n_pix * std ** 2)
+            snr = np.where(noise <= 0, 0.0, signal / noise)
+
+        for i, k in enumerate(index):
+            if n_pix[i] == 0:
+                continue
+            results[k] = {
+                'x': float(x[k]),
+                'y': float(y[k]),
+                'xrel': float(x[k]/width),
+                'yrel': float(y[k]/height),
+                'signal': float(signal[i]),
+                'noise': float(noise[i]),
+                'background': float(mean[i]),
+                'snr': float(snr[i]),
+                'n_pixels': int(n_pix[i])
+            }
+        return results
 
-        if y - half < 0 or y + half >= image.shape[0] or x - half < 0 or x + half >= image.shape[1]:
-            return None  # skip edge stars
-
-        cutout = image[y - half:y + half + 1, x - half:x + half + 1]
-        mean, median, std = sigma_clipped_stats(cutout, sigma=3.0)
-
-        smoothed = gaussian_filter(cutout, sigma=smooth_sigma)
-        star_mask = smoothed > (median + threshold_sigma * std)
-
-        if not np.any(star_mask):
-            return None
-
-        star_pixels = cutout[star_mask]
-        n_pix = star_pixels.size
-
-        signal = np.sum(star_pixels - median)
-        noise = np.sqrt(np.sum(star_pixels) + n_pix * std ** 2)
-
-        if noise <= 0:
-            snr = 0
-        else:
-            snr = signal / noise
-
-        return {
-            'x': float(x),
-            'y': float(y),
-            'xrel': float(x/width),
-            'yrel': float(y/height),
-            'signal': float(signal),
-            'noise': float(noise),
-            'background': float(mean),
-            'snr': float(snr),
-            'n_pixels': int(n_pix)
-        }
+    @staticmethod
+    def _sigma_clipped_stats(data, sigma=3.0, maxiters=5):
+        # astropy's sigma_clipped_stats (median centered, std deviation) for each row of data at once
+        data = data.astype(np.float64)
+        for _ in range(maxiters):
+            median = np.nanmedian(data, axis=1, keepdims=True)
+            std = np.nanstd(data, axis=1, keepdims=True)
+            clipped = np.abs(data - median) > sigma * std
+            if not clipped.any():
+                break
+            data[clipped] = np.nan
+        return np.nanmean(data, axis=1), np.nanmedian(data, axis=1), np.nanstd(data, axis=1)
@@ -1,14 +1,16 @@
-import cv2
 import numpy as np
 import time
 import math
-import os
 import datetime
 from telescope import Telescope
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
 from v412_ctl import get_v4l2_controls
 from analyzer import Analyzer
 from camera import Camera
+from framering import to_uint16
+from recorder import Recorder
+from bufferpool import BufferPool
+from latency import LatencyStats
 from concurrent.futures import ThreadPoolExecutor
 
 null_correction = { "ra": 0 , "dec": 0, "ra_px": 0, "dec_px": 0, "ra_arcsec": 0, "dec_arcsec": 0 , "ra_speed": 0, "dec_speed": 0}
@@ -46,14 +48,14 @@ class PIDController:
 
 class Autoguider:
 
-    def __init__(self):
+    def __init__(self, camera=None):
         self.executor = ThreadPoolExecutor(max_workers=4)  # Create a thread pool with 4 workers
         self.pending_tasks = 0  # Counter for pending tasks
         self.task_lock = Lock()  # Lock to ensure thread-safe updates to the counter
 
         self.analyzer = Analyzer()
         try:
-            self.camera = Camera()
+            self.camera = camera if camera is not None else Camera()
         except Exception as e:
             print(f"Camera not available")
             self.camera = None
@@ -70,6 +72,9 @@ class Autoguider:
         self.threshold = None               # Last threshold image
         self.last_frame_time = 0            # Last frame capture  time
         self.last_loop_time = 0             # Last loop time
+        self.stale_frames = 0               # Frames skipped because the camera reused their ring slot while in use
+        self.latency = LatencyStats()       # Histograms: frame_age, detect, correction (exposure end to mount command)
+        self.last_trace = None              # Metadata record of the last guided frame, see guide_scope()
         self.last_status = ""               # Last status message
         self.tracked_centroids = []         # Reference points we are tracking
         self.current_centroids = []         # Last position of tracked stars
@@ -78,6 +83,8 @@ class Autoguider:
         # last error and correction needed
         self.last_correction = null_correction
         self.centroid_image = None
+        self.diagnostics_timeout = 5.0      # Threshold and profile images are made while requested within this many seconds
+        self._diagnostics_requested = {"threshold": 0.0, "centroid_image": 0.0}    # time.monotonic() of the last request
 
         # tracking settings
         self.max_drift = 10                 # Integer for max_drift (0–50)
@@ -88,14 +95,21 @@ class Autoguider:
         self.guide_interval = 1.0           # Time period for tracking in seconds
         self.guide_pulse = 0.4              # Correction length: time between move start and move end (seconds)
         self.max_distance = 10             # Maximum distance to search for stars (pixels)
+        self.windowed_detection = True      # Tracking searches only windows around the stars, see Analyzer.detect_stars
+        self.roi_margin = 32                # Camera ROI window around a star beyond max_distance (pixels)
         
-        self.save_frames = False            # Save each frame to disk
+        self.save_frames = False            # Record guide frames to disk
+        self.save_frames_every = 10         # Record every n-th guide frame
         self.output_dir = ""
+        self.recorder = Recorder()          # Writes recorded frames in the background (SER / FITS)
 
         self.running = False
         self.lock = Lock()  # Thread lock for frame and threshold
+        self.pool = BufferPool("autoguider")   # Threshold images, see acquire_threshold()
+        self._threshold_buf = None          # Pool buffer behind self.threshold
 
-        self.data_ready = False     # set to true when new processing data available for monitoring
+        self.result_seq = 0                 # incremented each time new processing data is available for monitoring
+        self.result_cond = Condition()      # notified on each new result, see wait_for_result()
 
         # Initialize PID controllers (persistent across calls)
         self.ra_pid = PIDController(Kp=2.0, Ki=0.5, Kd=0.5, dt=1.0)  # Tune these!
@@ -108,22 +122,64 @@ class Autoguider:
             log_file.write(f"{timestamp}, {log_entry}\n")
 
 
-    def detect_stars(self, frame, search_near_centroids, max_distance=None):
+    def request_diagnostics(self, kind):
+        # Called by viewers of "threshold" or "centroid_image" on every update they fetch
+        self._diagnostics_requested[kind] = time.monotonic()
+
+    def diagnostics_wanted(self):
+        now = time.monotonic()
+        return any(now - t < self.diagnostics_timeout for t in self._diagnostics_requested.values())
+
+    def detect_stars(self, frame, search_near_centroids, max_distance=None, trace=None, windowed=False):
         if max_distance is None:
             max_distance = self.max_distance
+        diagnostics = self.diagnostics_wanted()     # without viewers only the centroids are computed
         if frame is None:
-            frame = self.camera.frame
+            frame = self.camera.data
+        buf = self.pool.acquire(frame.shape[:2], np.uint8) if frame is not None else None
         with self.lock:
             centroids, detail, thresh, focus_metric = self.analyzer.detect_stars(frame, 
                                                                  search_near=search_near_centroids, 
                                                                  gray_threshold = self.gray_threshold,
                                                                  star_size=self.star_size,
-                                                                 max_distance=max_distance)
+                                                                 max_distance=max_distance,
+                                                                 thresh_out=buf.array if buf is not None else None,
+                                                                 trace=trace,
+                                                                 windowed=windowed,
+                                                                 diagnostics=diagnostics)
             self.centroid_image = detail
             self.threshold = thresh
+            if buf is not None and thresh is not buf.array:
+                buf.release()   # not written in place, thresh is a fresh array
+                buf = None
+            previous, self._threshold_buf = self._threshold_buf, buf
+            if previous is not None:
+                previous.release()  # back to the pool unless a viewer still holds it
             self.focus_metric = focus_metric
             return centroids
 
+    def acquire_threshold(self):
+        # Current threshold image for viewers; release() the result once done with .array
+        with self.lock:
+            return self._threshold_buf.retain() if self._threshold_buf is not None else None
+
+    def publish_result(self):
+        with self.result_cond:
+            self.result_seq += 1
+            self.result_cond.notify_all()
+
+    def wait_for_result(self, after_seq=0, timeout=None):
+        # Blocks until a guide cycle newer than after_seq has completed; returns its sequence number or None on timeout
+        with self.result_cond:
+            if not self.result_cond.wait_for(lambda: self.result_seq > after_seq, timeout=timeout):
+                return None
+            return self.result_seq
+
+    @property
+    def frame_pixel_scale(self):
+        # pixel_scale is per native sensor pixel, centroids are in (possibly binned) frame pixels
+        return self.pixel_scale * (self.camera.binning if self.camera is not None else 1)
+
     def rotate_vector(self, dx, dy):
         """Rotate (dx, dy) vector by rotation_angle (degrees) counterclockwise."""
         angle_rad = math.radians(self.rotation_angle)
@@ -178,6 +234,13 @@ class Autoguider:
             self.write_track_log(self.last_status)
             return False
 
+    def set_camera(self, camera):
+        # guide with another camera instance; tracked positions belong to the old one
+        self.remove_all_tracked_stars()
+        if self.camera is not None and self.camera is not camera:
+            self.camera.set_roi((), 0)      # the old camera goes back to full frames
+        self.camera = camera
+
     def remove_all_tracked_stars(self):
         with self.lock:
             self.tracked_centroids = []
@@ -273,15 +336,34 @@ class Autoguider:
         telescope = Telescope()
         telescope.send_start_movement_speed(ra_speed, dec_speed)
 
-    def guide_scope(self, ra_arcsec_error, dec_arcsec_error):
+    def guide_scope(self, ra_arcsec_error, dec_arcsec_error, trace=None):
         # Call the appropriate method based on self.method
         guide_methodf = self.guide_methods.get(self.guide_method)
         if guide_methodf:
+            if trace is not None:
+                trace["correction_sent"] = time.time()
             guide_methodf(ra_arcsec_error, dec_arcsec_error)
+            if trace is not None:
+                self.trace_latency(trace)
         else:
             raise ValueError(f"Unknown guiding method: {self.guide_method}")
 
-    def calculate_drift(self, centroids):
+    def trace_latency(self, trace):
+        # end-to-end latency of a correction: from the end of the exposure to the command sent to the mount
+        self.last_trace = trace
+        exposure_end = trace.get("exposure_end")
+        if exposure_end is None:
+            return
+        latency = trace["correction_sent"] - exposure_end
+        self.latency.record("frame_age", trace["received"] - exposure_end)
+        self.latency.record("detect", trace.get("detect_time"))
+        self.latency.record("correction", latency)
+        self.write_track_log(f"LATENCY frame:{trace.get('sequence')}, exposure end to correction:{latency * 1000:.0f}ms, "
+                             f"from exposure start:{(trace['correction_sent'] - trace.get('exposure_start', exposure_end)) * 1000:.0f}ms, "
+                             f"integrated:{trace.get('integration_count')}, decode:{(trace.get('decode_time') or 0) * 1000:.1f}ms, "
+                             f"process:{trace.get('processing_time', 0) * 1000:.1f}ms, detect:{trace.get('detect_time', 0) * 1000:.1f}ms")
+
+    def calculate_drift(self, centroids, trace=None):
         # Initialize array to store dx, dy vectors
         if len(self.tracked_centroids)==0 or len(centroids)==0 or len(self.tracked_centroids)!=len(centroids):
             return False
@@ -320,7 +402,7 @@ class Autoguider:
         dy = round(float(final_mean_centroid[1]), 4)
         dx_rot, dy_rot = self.rotate_vector(dx, dy)
         telescope = Telescope()
-        ra_arcsec, dec_arcsec =self.pixels_to_arcseconds(dx_rot, dy_rot, self.pixel_scale, telescope.dec_deg)
+        ra_arcsec, dec_arcsec =self.pixels_to_arcseconds(dx_rot, dy_rot, self.frame_pixel_scale, telescope.dec_deg)
         self.last_correction = {
             "ra_px": dx_rot, "dec_px": dy_rot,
             "ra_arcsec": ra_arcsec, "dec_arcsec": dec_arcsec,
@@ -330,6 +412,9 @@ class Autoguider:
         }
         pec = telescope.scope_info["pec"]["progress"]
         self.last_status = f"TRACKING stars at:{centroids}, PEC:{pec}, ra px:{dx_rot:.1f}, dec px:{dy_rot:.1f}, ra arcsec:{ra_arcsec:.1f}, dec arcsec:{dec_arcsec:.1f}"
+        if trace is not None:
+            trace["drift_calculated"] = time.time()
+            self.last_status += f", frame:{trace.get('sequence')}"
         #print(self.last_status)
         self.write_track_log(self.last_status)
         return True
@@ -359,14 +444,17 @@ class Autoguider:
         telescope.send_correction(move_direction,move_time)  # Move scope west for 10s
         print("settling ... ")
         time.sleep(2)   # settling scope
-        frame = self.camera.frame
+        # use a frame captured after the scope settled
+        slot = self.camera.wait_for_frame(self.camera.frame_seq, timeout=10)
+        if slot is None:
+            raise ValueError("No frame received after move")
+        frame = slot.data
         centroids = self.detect_stars(frame, search_near_centroids=[search_near], max_distance=100)  # Detect star
         if len(centroids)==0 or centroids[0] is None:
            raise ValueError("Failed to detect centroid")
         return centroids[0]
 
     def calibrate_angle(self, with_backlash=False):
-        #TODO : wait for new frames!
         telescope = Telescope()
         guiding = self.guiding
         self.guiding = False
@@ -375,6 +463,7 @@ class Autoguider:
         telescope.send_speed('G')
         result = True
         self.calibrating = True
+        self.camera.set_roi([], 0)          # the star moves far during calibration, use full frames
         
         try:
             if len(self.tracked_centroids)==0:
@@ -384,7 +473,7 @@ class Autoguider:
                 telescope.send_backlash_comp_dec(0)
                 telescope.send_backlash_comp_ra(0)
         
-            frame = self.camera.frame
+            frame = self.camera.data
 
             centroids = self.detect_stars(frame, search_near_centroids=[self.tracked_centroids[0]])  # Detect star
             if len(centroids)==0:
@@ -435,14 +524,14 @@ class Autoguider:
                     dx = float(centroid4[0] - centroid2[0])
                     dy = float(centroid4[1] - centroid2[1])
                     dx_rot, dy_rot = self.rotate_vector(dx, dy)
-                    ra_arcsec = round(dx_rot * self.pixel_scale, 0)
+                    ra_arcsec = round(dx_rot * self.frame_pixel_scale, 0)
                     telescope.send_backlash_comp_ra(abs(ra_arcsec))
                     print(f"#################backlash ra {ra_arcsec} arcsec")
                     
                     dx = float(centroid7[0] - centroid5[0])
                     dy = float(centroid7[1] - centroid5[1])
                     dx_rot, dy_rot = self.rotate_vector(dx, dy)
-                    dec_arcsec = round(dy_rot * self.pixel_scale, 0)
+                    dec_arcsec = round(dy_rot * self.frame_pixel_scale, 0)
                     telescope.send_backlash_comp_dec(abs(dec_arcsec))
                     print(f"#################backlash dec {dec_arcsec} arcsec")
             else:
@@ -474,14 +563,13 @@ class Autoguider:
         self.dec_guiding = enable
 
 
-    def save_frame(self, frame):
-        if frame is not None:
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = os.path.join(self.output_dir, f"frame_{timestamp}.jpg")
-            cv2.imwrite(filename, frame)
-            print(f"Saved frame to {filename}")
+    def set_save_frames(self, enable):
+        self.save_frames = enable
+        if enable:
+            self.recorder.output_dir = self.output_dir
+            self.recorder.start()
         else:
-            print("No frame to save.")
+            self.recorder.stop()
 
     def run_autoguider(self):
         
@@ -494,62 +582,90 @@ class Autoguider:
         time.sleep(2)  # Wait for telescope to initialize
         telescope.get_info()
         last_time = time.perf_counter()
-        last_frame = None
+        camera = self.camera
+        last_seq = 0
         last_save_time_counter = 0
 
         while self.running:
-            if time.perf_counter() - last_time >= self.guide_interval:  # Run once per period
-                frame = self.camera.frame
-                if frame is last_frame or frame is None or self.calibrating:
-                    time.sleep(0.01)    # frame not ready or calibrating
-                    continue
-                self.last_loop_time = round(time.perf_counter() - last_time, 2)
-                last_time = time.perf_counter()
-                self.last_frame_time = round(self.camera.last_frame_time, 2)
-                last_frame = frame
+            remaining = self.guide_interval - (time.perf_counter() - last_time)
+            if remaining > 0:
+                time.sleep(min(remaining, 0.5))     # wait for next guide period
+                continue
+            if self.camera is not camera:
+                # switched by set_camera(), sequence numbers start over with the new camera
+                camera = self.camera
+                last_seq = 0
+            slot = camera.wait_for_frame(last_seq, timeout=1.0)
+            if slot is None:
+                continue    # no new frame yet
+            last_seq = slot.seq
+            if self.calibrating:
+                continue
+            frame = slot.data           # full precision for the centroider
+            trace = dict(slot.meta, frame_seq=slot.seq, received=time.time())   # the frame's metadata, follows it to the mount
+            self.last_loop_time = round(time.perf_counter() - last_time, 2)
+            last_time = time.perf_counter()
+            self.last_frame_time = round(camera.last_frame_time, 2)
+
+            # Print tracked_centroids and current_centroids
+            #print(f"Tracked Centroids: {self.tracked_centroids}")
+            #print(f"Current Centroids: {self.current_centroids}")
 
-                # Print tracked_centroids and current_centroids
-                #print(f"Tracked Centroids: {self.tracked_centroids}")
-                #print(f"Current Centroids: {self.current_centroids}")
 
+            if len(self.tracked_centroids)==0:
+                # Acquisition mode: works on a copy, the star it finds is kept
+                frame = np.array(frame)
+                if not camera.frame_valid(last_seq):
+                    self.stale_frames += 1
+                    continue
+                self.add_tracked_star(frame=frame)
+            else:
+                # Tracking mode
+                centroids = self.detect_stars(frame, search_near_centroids=self.current_centroids, trace=trace,
+                                              windowed=self.windowed_detection)
+                if not camera.frame_valid(last_seq):
+                    # detection outlasted the ring slot, the frame may have been overwritten meanwhile
+                    self.stale_frames += 1
+                    continue
 
-                if len(self.tracked_centroids)==0:
-                    # Acquisition mode
-                    self.add_tracked_star(frame=frame)
-                else:
-                    # Tracking mode
-                    centroids = self.detect_stars(frame, search_near_centroids=self.current_centroids)
-
-                    any_centroid = False
-                    for centroid in centroids:
-                        if centroid is not None:
-                            any_centroid = True
-                            break
-
-                    if any_centroid:
-                        self.star_locked = True
-                        if self.calculate_drift(centroids):
-                            # Send correction to telescope
-                            if self.guiding:
-                                self.guide_scope( self.last_correction['ra_arcsec'], self.last_correction['dec_arcsec'])
-                        # remember new currnt centroids; it some were not detected this time, keep the old ones
-                        for i in range(len(centroids)):
-                            if centroids[i] is not None and len(self.current_centroids)>i:
-                                self.current_centroids[i] = centroids[i]
-                    else:
-                        self.star_locked = False
-                        self.last_correction = null_correction
+                any_centroid = False
+                for centroid in centroids:
+                    if centroid is not None:
+                        any_centroid = True
+                        break
+
+                if any_centroid:
+                    self.star_locked = True
+                    if self.calculate_drift(centroids, trace):
+                        # Send correction to telescope
                         if self.guiding:
-                            self.guide_scope(0,0)
-
-                        self.last_status = "LOST TRACKING: Tracked stars not detected."
-                        #print(self.last_status)
-                        self.write_track_log(self.last_status)
-
-                self.data_ready = True
-                last_save_time_counter += 1
-                if self.save_frames and last_save_time_counter>10:
-                    self.save_frame(frame)
-                    last_save_time_counter = 0
-            time.sleep(0.01)  # Small sleep to prevent busy loop
+                            self.guide_scope( self.last_correction['ra_arcsec'], self.last_correction['dec_arcsec'], trace)
+                    # remember new currnt centroids; it some were not detected this time, keep the old ones
+                    for i in range(len(centroids)):
+                        if centroids[i] is not None and len(self.current_centroids)>i:
+                            self.current_centroids[i] = centroids[i]
+                else:
+                    self.star_locked = False
+                    self.last_correction = null_correction
+                    if self.guiding:
+                        self.guide_scope(0,0, trace)
+
+                    self.last_status = "LOST TRACKING: Tracked stars not detected."
+                    #print(self.last_status)
+                    self.write_track_log(self.last_status)
+
+            # windows for the camera ROI mode follow the stars, without tracked stars it sends full frames
+            camera.set_roi(self.current_centroids, self.max_distance + self.roi_margin)
+            self.publish_result()
+            last_save_time_counter += 1
+            if self.save_frames and last_save_time_counter>=self.save_frames_every:
+                # record what the camera published, integrated and calibrated frames as 16 bit
+                timestamp = slot.timestamp
+                data = slot.data
+                frame = data.copy() if data.dtype == np.uint8 else to_uint16(data)
+                if camera.frame_valid(last_seq):
+                    self.recorder.add_frame(frame, timestamp, copy=False)     # queued, never waits for the disk
+                else:
+                    self.stale_frames += 1
+                last_save_time_counter = 0
 
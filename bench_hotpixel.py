@@ -0,0 +1,84 @@
+import time
+import numpy as np
+from hotpixels import HotPixelCorrector
+
+# Benchmark of the vectorized hot pixel correction against the former per-pixel loop
+# usage: python3 bench_hotpixel.py [n_hot_pixels] [width] [height]
+
+bayer_mask = np.array([
+    [0.1, 0.2, 0.1],
+    [0.2,  1.0, 0.2 ],
+    [0.1, 0.2, 0.1]
+], dtype=np.float32)
+
+
+def legacy_apply_hot_pixel_mask(frame, hot_pixels):
+    # Former Camera.apply_hot_pixel_mask, kept for comparison
+    if len(frame.shape) == 3:
+        height, width, colors = frame.shape
+    else:
+        height, width = frame.shape
+        colors = 1
+    for c in range(colors):
+        for y, x in hot_pixels:
+            y1, y2 = max(y - 1, 0), min(y + 2, height)
+            x1, x2 = max(x - 1, 0), min(x + 2, width)
+            if colors>1:
+                central_value = frame[y, x, c]
+                neighborhood = frame[y1:y2, x1:x2, c].astype(np.float32)
+            else:
+                central_value = frame[y, x]
+                neighborhood = frame[y1:y2, x1:x2].astype(np.float32)
+            dy1, dy2 = y - y1, y2 - y - 1
+            dx1, dx2 = x - x1, x2 - x - 1
+            mask_slice = bayer_mask[1 - dy1:2 + dy2, 1 - dx1:2 + dx2]
+            neighborhood -= central_value * mask_slice
+            neighborhood = np.clip(neighborhood, 0, 255)
+            if colors>1:
+                frame[y1:y2, x1:x2, c] = neighborhood.astype(np.uint8)
+                frame[y, x, c] = int(np.median(neighborhood))
+            else:
+                frame[y1:y2, x1:x2] = neighborhood.astype(np.uint8)
+                frame[y, x] = int(np.median(neighborhood))
+
+
+def random_hot_pixels(n, height, width, rng):
+    # isolated pixels (at least 3 apart) so both implementations must agree exactly
+    coords = set()
+    while len(coords) < n:
+        y, x = int(rng.integers(0, height // 3)) * 3, int(rng.integers(0, width // 3)) * 3
+        coords.add((y, x))
+    return np.array(sorted(coords), dtype=np.int32)
+
+
+def timeit(fn, frame, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        work = frame.copy()
+        start = time.perf_counter()
+        fn(work)
+        best = min(best, time.perf_counter() - start)
+    return best, work
+
+
+def main(n=300, width=1280, height=720, repeat=10):
+    rng = np.random.default_rng(1)
+    hot_pixels = random_hot_pixels(n, height, width, rng)
+    corrector = HotPixelCorrector(hot_pixels, bayer_mask)
+
+    for shape in [(height, width, 3), (height, width)]:
+        frame = rng.integers(0, 40, size=shape, dtype=np.uint8)
+        frame[hot_pixels[:, 0], hot_pixels[:, 1]] = 250
+
+        corrector.build(height, width)
+        t_legacy, ref = timeit(lambda f: legacy_apply_hot_pixel_mask(f, hot_pixels), frame, max(1, repeat // 5))
+        t_new, out = timeit(corrector.apply, frame, repeat)
+        print(f"{'x'.join(map(str, shape))} frame, {n} hot pixels: "
+              f"legacy {t_legacy*1000:.2f} ms, vectorized {t_new*1000:.2f} ms, "
+              f"speedup {t_legacy/t_new:.1f}x, identical: {np.array_equal(ref, out)}")
+
+
+if __name__ == "__main__":
+    import sys
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+
+BINNING_FACTORS = (1, 2, 3)
+BINNING_MODES = ("mean", "sum")
+
+
+def binned_shape(shape, factor):
+    """Frame shape after factor x factor binning, incomplete edge blocks are cropped."""
+    return (shape[0] // factor, shape[1] // factor) + tuple(shape[2:])
+
+
+def bin_into(src, out, factor, mode="mean", regions=None):
+    """
+    Bins float32 src into out (binned_shape) without temporaries.
+    cv2.resize with INTER_AREA averages whole factor x factor blocks when the size is an exact
+    multiple, which is many times faster than a NumPy reshape-sum; "sum" scales the average back up.
+    regions are (y0, y1, x0, x1) windows in src pixels aligned to factor, None bins the whole frame.
+    """
+    height, width = out.shape[:2]
+    if regions is None:
+        areas = [(0, height, 0, width)]
+    else:
+        areas = [(y0 // factor, min(height, y1 // factor), x0 // factor, min(width, x1 // factor))
+                 for y0, y1, x0, x1 in regions]
+    for y0, y1, x0, x1 in areas:
+        if y0 >= y1 or x0 >= x1:
+            continue
+        target = out[y0:y1, x0:x1]
+        result = cv2.resize(src[y0 * factor:y1 * factor, x0 * factor:x1 * factor], (x1 - x0, y1 - y0),
+                            dst=target, interpolation=cv2.INTER_AREA)
+        if result is not target:
+            np.copyto(target, result)
+        if mode == "sum":
+            np.multiply(target, factor * factor, out=target)
+    return out
+
+
+def to_native(point, factor):
+    """Converts (x, y) in binned frame pixels to native sensor pixels (pixel centers at integers)."""
+    if point is None or factor == 1:
+        return point
+    return ((point[0] + 0.5) * factor - 0.5, (point[1] + 0.5) * factor - 0.5)
+
+
+def from_native(point, factor):
+    """Converts (x, y) in native sensor pixels to binned frame pixels."""
+    if point is None or factor == 1:
+        return point
+    return ((point[0] + 0.5) / factor - 0.5, (point[1] + 0.5) / factor - 0.5)
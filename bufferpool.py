@@ -0,0 +1,93 @@
+import numpy as np
+from threading import Lock
+
+
+class PooledArray:
+    """
+    A pool buffer with a reference count. The holder of a reference uses .array; retain() adds a
+    reference for another consumer and each holder calls release() once, the last release hands
+    the buffer back to its pool.
+    """
+    __slots__ = ("array", "_pool", "_key", "_refs")
+
+    def __init__(self, pool, key, array):
+        self.array = array
+        self._pool = pool
+        self._key = key
+        self._refs = 1
+
+    def retain(self):
+        with self._pool.lock:
+            if self._refs <= 0:
+                raise RuntimeError("retain() of a released pool buffer")
+            self._refs += 1
+        return self
+
+    def release(self):
+        self._pool._release(self)
+
+
+class BufferPool:
+    """
+    Preallocated arrays per (shape, dtype), handed out with acquire() and filled in place through
+    the out=/dst= parameters of NumPy and OpenCV.
+    allocations counts the arrays the pool had to create; once the pipeline runs in steady state it
+    stays constant and every frame is served from reuses. unpooled counts frames a library returned
+    in a fresh array although a pool buffer was offered (e.g. cv2.imdecode has no dst parameter),
+    and the JPEG bytes the backend reads for MJPEG pass-through.
+    Steady-state allocation is only zero where OpenCV can write into the buffer: color frames decoded
+    by the backend and raw YUYV/GREY frames. Grayscale guiding on MJPEG (luminance decoded with
+    cv2.imdecode) and JPEG pass-through still allocate every frame and show up in unpooled.
+    """
+
+    def __init__(self, name, max_free=8):
+        self.name = name
+        self.max_free = max_free        # free buffers kept per (shape, dtype)
+        self.lock = Lock()
+        self._free = {}
+        self.allocations = 0
+        self.reuses = 0
+        self.outstanding = 0            # buffers currently handed out
+        self.unpooled = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(int(n) for n in shape), np.dtype(dtype))
+        with self.lock:
+            free = self._free.get(key)
+            if free:
+                buf = free.pop()
+                buf._refs = 1
+                self.reuses += 1
+            else:
+                buf = None
+                self.allocations += 1
+            self.outstanding += 1
+        if buf is None:
+            buf = PooledArray(self, key, np.empty(key[0], dtype=key[1]))
+        return buf
+
+    def _release(self, buf):
+        with self.lock:
+            if buf._refs <= 0:
+                raise RuntimeError("pool buffer released more often than retained")
+            buf._refs -= 1
+            if buf._refs > 0:
+                return
+            self.outstanding -= 1
+            free = self._free.setdefault(buf._key, [])
+            if len(free) < self.max_free:
+                free.append(buf)
+
+    def count_unpooled(self):
+        with self.lock:
+            self.unpooled += 1
+
+    def clear(self):
+        # drops the free buffers, e.g. after the frame size changed; handed out buffers stay valid
+        with self.lock:
+            self._free = {}
+
+    def stats(self):
+        with self.lock:
+            return {"allocations": self.allocations, "reuses": self.reuses,
+                    "outstanding": self.outstanding, "unpooled": self.unpooled}
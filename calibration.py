@@ -0,0 +1,149 @@
+import os
+import glob
+import numpy as np
+from regions import region_slices
+
+
+class Calibration:
+    """
+    Master dark and flat frames for the camera pipeline.
+
+    Master darks are keyed by (exposure, gain, width, height, channels), master flats by
+    (width, height, channels). Both are float32 .npy files, memory-mapped when loaded; the
+    flat is stored as its normalized inverse so applying it is a multiplication.
+    select() picks the masters for the current camera settings, apply() calibrates a float32
+    frame in place as (frame - dark) * inv_flat, block by block so every block of rows is
+    read once while it is still in cache.
+    """
+    BLOCK_ROWS = 64
+    MIN_FLAT = 0.05         # flat pixels darker than this (relative to the mean) are left uncorrected
+
+    def __init__(self):
+        self.directory = ""
+        self.dark_key = None            # Key of the active master dark
+        self.flat_key = None            # Key of the active master flat
+        self.loaded_directory = None    # directory the active masters were loaded from
+        self.masters = (None, None)     # Active (dark, inv_flat), swapped as one tuple
+        self.settings = None            # (exposure, gain, shape) of the last select()
+
+    @staticmethod
+    def _shape_key(shape):
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) == 3 else 1
+        return int(width), int(height), int(channels)
+
+    def dark_path(self, key):
+        exposure, gain, width, height, channels = key
+        return os.path.join(self.directory, f"master_dark_e{exposure:g}_g{gain:g}_{width}x{height}x{channels}.npy")
+
+    def flat_path(self, key):
+        width, height, channels = key
+        return os.path.join(self.directory, f"master_flat_{width}x{height}x{channels}.npy")
+
+    @staticmethod
+    def _load(path):
+        try:
+            return np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        except (OSError, ValueError) as e:
+            print(f"Error loading calibration master {path}: {e}")
+            return None
+
+    @staticmethod
+    def _save(path, master):
+        # write next to the target and rename, a loaded master may still be memory-mapped
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, master)
+        os.replace(tmp, path)
+
+    @property
+    def active(self):
+        dark, inv_flat = self.masters
+        return dark is not None or inv_flat is not None
+
+    def select(self, exposure, gain, shape):
+        """Activates the masters matching the camera settings, returns True if any was found."""
+        self.settings = (exposure, gain, shape)
+        shape_key = self._shape_key(shape)
+        dark_key = (float(exposure), float(gain)) + shape_key
+        if dark_key == self.dark_key and shape_key == self.flat_key and self.directory == self.loaded_directory:
+            return self.active
+        dark = self._load(self.dark_path(dark_key))
+        inv_flat = self._load(self.flat_path(shape_key))
+        self.masters = (dark, inv_flat)
+        self.dark_key, self.flat_key = dark_key, shape_key
+        self.loaded_directory = self.directory
+        if self.active:
+            print(f"Calibration for {dark_key}: dark {dark is not None}, flat {inv_flat is not None}")
+        return self.active
+
+    def refresh(self):
+        # reload the masters for the current settings, e.g. after new ones were saved
+        self.dark_key = self.flat_key = None
+        if self.settings is not None:
+            self.select(*self.settings)
+
+    def save_dark(self, master, exposure, gain):
+        key = (float(exposure), float(gain)) + self._shape_key(master.shape)
+        self._save(self.dark_path(key), master.astype(np.float32, copy=False))
+        self.refresh()
+        return self.dark_path(key)
+
+    def save_flat(self, master):
+        """master: averaged flat frames, dark subtracted. Stores the normalized inverse."""
+        master = master.astype(np.float32)
+        mean = master.reshape(-1, master.shape[2]).mean(axis=0) if master.ndim == 3 else master.mean()
+        if np.any(mean <= 0):
+            raise ValueError("Flat frames are black after dark subtraction")
+        np.divide(master, mean, out=master)
+        inv_flat = np.ones_like(master)
+        np.divide(1.0, master, out=inv_flat, where=master > self.MIN_FLAT)
+        path = self.flat_path(self._shape_key(master.shape))
+        self._save(path, inv_flat)
+        self.refresh()
+        return path
+
+    def status(self):
+        dark, inv_flat = self.masters
+        return {"dark": dark is not None, "flat": inv_flat is not None}
+
+    def clear(self):
+        # removes all stored masters
+        for path in glob.glob(os.path.join(glob.escape(self.directory), "master_dark_*.npy")) + \
+                    glob.glob(os.path.join(glob.escape(self.directory), "master_flat_*.npy")):
+            os.remove(path)
+        self.masters = (None, None)
+        self.dark_key = self.flat_key = None
+
+    def subtract_dark(self, frame):
+        """Returns frame (float32) minus the active dark, used while building flats."""
+        dark, _ = self.masters
+        frame = frame.astype(np.float32)
+        if dark is not None and dark.shape == frame.shape:
+            np.subtract(frame, dark, out=frame)
+        return frame
+
+    def apply(self, data, regions=None):
+        """Calibrates float32 data in place, only inside regions if given."""
+        dark, inv_flat = self.masters
+        if dark is not None and dark.shape != data.shape:
+            dark = None
+        if inv_flat is not None and inv_flat.shape != data.shape:
+            inv_flat = None
+        if dark is None and inv_flat is None:
+            return
+        if regions is not None:
+            # windows are small enough to stay in cache as a whole
+            for rows, cols in region_slices(regions):
+                window = data[rows, cols]
+                if dark is not None:
+                    np.subtract(window, dark[rows, cols], out=window)
+                if inv_flat is not None:
+                    np.multiply(window, inv_flat[rows, cols], out=window)
+            return
+        for y in range(0, data.shape[0], self.BLOCK_ROWS):
+            rows = data[y:y + self.BLOCK_ROWS]
+            if dark is not None:
+                np.subtract(rows, dark[y:y + self.BLOCK_ROWS], out=rows)
+            if inv_flat is not None:
+                np.multiply(rows, inv_flat[y:y + self.BLOCK_ROWS], out=rows)
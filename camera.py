@@ -2,34 +2,98 @@ import cv2
 import numpy as np
 import time
 import os
-import json
-from threading import Thread, Lock, RLock
+from threading import Thread, Lock, RLock, Event
+import queue
+from collections import deque
 from v412_ctl import get_v4l2_controls, set_v4l2_control, set_v4l2_controls, extract_v4l2_control_values
+from framering import FrameRing
+from v4l2 import V4L2Capture
+from gstreamer import GStreamerCapture
+from integration import SlidingIntegrator
+from regions import make_regions, region_slices
+from binning import BINNING_FACTORS, BINNING_MODES, binned_shape, bin_into, to_native, from_native
+from calibration import Calibration
+from hotpixels import HotPixelCorrector, save_hot_pixel_mask, load_hot_pixel_mask, remove_hot_pixel_mask
+from bufferpool import BufferPool
+from latency import LatencyStats
 import gc
 
-class Camera:
-    _instance = None
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(Camera, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
+class CameraUnavailableError(RuntimeError):
+    """Raised by capture and control calls while the camera is disconnected or being reconnected."""
+
 
-    def __init__(self):
+class Camera:
+    # One instance per video device: Camera(index) returns the camera already open on that device
+    _instances = {}
+    _instances_lock = Lock()
+
+    def __new__(cls, index=0):
+        with cls._instances_lock:
+            instance = cls._instances.get(index)
+            if instance is None:
+                instance = super(Camera, cls).__new__(cls)
+                cls._instances[index] = instance
+            return instance
+
+    @classmethod
+    def get(cls, index):
+        # camera open on device index, None if there is none
+        with cls._instances_lock:
+            return cls._instances.get(index)
+
+    @classmethod
+    def instances(cls):
+        with cls._instances_lock:
+            return dict(cls._instances)
+
+    def __init__(self, index=0):
         if not hasattr(self, '_initialized'):
             self._initialized = True
             self.running = False
 
-            self.camera_index = 0
-
-            self.frame = None                   # Last captured frame
-            self.last_frame_time = 0
+            self.camera_index = index
+            self.idle_timeout = 10.0            # Capture pauses after this many seconds without consumers, 0 = never
+            self.last_used = time.monotonic()   # Last time a consumer asked for a frame, see touch()
+            self._wanted = Event()              # Set by touch() to resume a paused capture thread
+
+            self.ring = FrameRing(4)            # Published frames, see wait_for_frame()
+            self.last_frame_time = 0            # Time between published frames
+            self.handoff = queue.Queue(maxsize=2)   # Captured frames waiting for the processing thread
+            self.pool = BufferPool("camera")   # Decoded frame buffers, released once processed
+            self.dropped_frames = 0             # Frames dropped because processing could not keep up
+            # Pipeline stage timing (seconds, moving average): capture = blocking read + decode,
+            # process = integration + correction + publish. The slower stage limits fps.
+            self.stage_times = {"capture": 0.0, "process": 0.0}
+            self.latency = LatencyStats()       # Per-frame histograms: decode, process, publish (exposure end to ring)
+            self.capture_count = 0              # Frames captured so far, the "sequence" of the frame metadata
+            self.exposure_time = None           # Manual exposure in seconds, None while on auto exposure
+            self._exposure_starts = deque(maxlen=1)     # exposure_start of the last frames, for integrated frames
+            self._block_count = 0               # Frames accumulated so far in "block" integration
             # camera settings
             self.color = True                   # True for color, False for grayscale
             self.r_channel = 1.0                # Float for R channel (0.0–1.0)
             self.g_channel = 1.0                # Float for G channel (0.0–1.0)
             self.b_channel = 1.0                # Float for B channel (0.0–1.0)
             self.integrate_frames = 5           # no. frames to integrate
+            self.integration_mode = "block"     # "block": publish one average per integrate_frames reads
+                                                # "sliding": publish a running average of the last integrate_frames on every read
+            self.integrator = SlidingIntegrator()
+            self.binning = 1                    # Software binning factor applied after integration (1, 2 or 3)
+            self.binning_mode = "mean"          # "mean" keeps 0..255 units, "sum" adds up the pixels for faint stars
+            self.bin_buffer = None              # Native float32 frame integrated and corrected before binning
+            self.mjpeg_passthrough = True       # Publish the camera's JPEG bytes undecoded when nothing alters the frame
+            self._raw_capture = None            # Raw buffer mode last applied by set_raw_capture()
+            # ROI mode: while guiding only windows around the tracked stars are integrated and corrected,
+            # the rest of the published frame is the last full frame, refreshed every roi_refresh_interval
+            self.roi_mode = False
+            self.roi_refresh_interval = 5.0     # Seconds between full frames in ROI mode
+            self.roi_regions = ()               # Windows (y0, y1, x0, x1) set by the autoguider, see set_roi()
+            self._regions = None                # Windows of the frame being integrated, None = full frame
+            self._roi_background = None         # Last full frame, shown outside the windows
+            self._roi_base = 0                  # Incremented for every new background
+            self._last_full_frame = 0           # time.monotonic() of the last full frame
+            self.calibration = Calibration()    # Master dark / flat, picked by select_calibration()
             self.width = 1280
             self.height = 720
             #self.cam_mode = 'YUYV'              # set 'MJPG' for compressed
@@ -39,18 +103,30 @@ class Camera:
             self.cam_fps = 5
 
             # camera usb reconnect/retry settings
-            self.max_failures = 5               # Number of failures to attept reconnect
+            self.max_failures = 5               # Number of failed reads before the camera is reopened
             self.failure_count = 0              # Current number of failures
-            self.recovery_attempts = 0          # Current number of recovery attempts
-            self.max_recovery_attempts = 3      # Max recovery attempts before we quit
-
-            self.cap = None                     # cv2 object
+            self.recovery_attempts = 0          # Reopen attempts since the camera was lost
+            self.reconnect_delay = 0.5          # First reconnect delay (s), doubled after every failed attempt
+            self.max_reconnect_delay = 30.0     # Upper limit of the reconnect delay (s)
+            self.state = "disconnected"         # "connected", "opening", "reconnecting" or "disconnected"
+            self.connected = Event()            # Set while state is "connected"
+            self._reconnect_t = None
+
+            self.backend = "opencv"             # "opencv": cv2.VideoCapture, "v4l2": direct mmap streaming (v4l2.py),
+                                                # "gstreamer": leaky appsink pipeline (gstreamer.py)
+            self.gst_jpeg_decoder = None        # GStreamer JPEG decoder element, None = software, "auto" = first hardware one found
+            self.cap = None                     # cv2.VideoCapture or V4L2Capture object
+            self.last_capture_info = {}         # Driver timestamp / sequence of the last read, if the backend has them
             self.controls = get_v4l2_controls(self.camera_index) 
             if self.controls is None:
-                raise RuntimeError("Failed to fetch v4l2 controls. Ensure the camera is connected and v4l2-ctl is installed.")
+                with Camera._instances_lock:
+                    Camera._instances.pop(self.camera_index, None)
+                raise RuntimeError("Failed to fetch v4l2 controls. Ensure the camera is connected.")
 
             self.lock = RLock()                  # Thread lock 
+            self.capture_lock = RLock()          # Held while reading from or reconfiguring self.cap, taken before self.lock
             self._capture_t = None        
+            self._process_t = None
             self.realloc_lock = Lock()                  # Thread lock 
             self.alloc_buffers(self.color)
             
@@ -58,6 +134,7 @@ class Camera:
             self.dark_frame_path = "dark_frame_avg.png"
             self.hot_pixel_mask_path = "hot_pixel_mask.npy"
             self.hot_pixels = None
+            self.hot_pixel_corrector = None     # Precomputed correction for self.hot_pixels
 
             # Placeholder Bayer mask (to be determined later)
             # Example: Simple bilinear interpolation weights, center = 1
@@ -70,13 +147,54 @@ class Camera:
     def alloc_buffers(self, color):
         with self.realloc_lock:
             self.color = color
+            self._block_count = 0
             if self.color:
                 self.frame_accumulator = np.zeros((int(self.height), int(self.width), 3), dtype=np.uint16)  # Preallocate, adjust shape
                 self.temp_buffer = np.empty((int(self.height), int(self.width), 3), dtype=np.float32)  # Temp for scaling
             else:
                 self.frame_accumulator = np.zeros((int(self.height), int(self.width)), dtype=np.uint16)  # Preallocate, adjust shape
                 self.temp_buffer = np.empty((int(self.height), int(self.width)), dtype=np.float32)  # Temp for scaling
-
+            self.bin_buffer = np.empty(self.frame_accumulator.shape, dtype=np.float32) if self.binning > 1 else None
+            self.pool.clear()
+            self.ring.alloc(binned_shape(self.frame_accumulator.shape, self.binning),
+                            np.float32 if self.integrate_frames > 1 or self.binning > 1 else np.uint8)
+        self.select_calibration()
+
+    @property
+    def frame(self):
+        # Last published frame as 8-bit image; valid until the ring wraps around
+        self.touch()
+        slot = self.ring.latest()
+        return slot.frame if slot is not None else None
+
+    @property
+    def data(self):
+        # Last published frame at full precision (float32 when integrating), for analysis
+        self.touch()
+        slot = self.ring.latest()
+        return slot.data if slot is not None else None
+
+    @property
+    def frame_seq(self):
+        return self.ring.seq
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        # Blocks until a frame newer than after_seq is published; returns its FrameSlot or None on timeout
+        self.touch()
+        return self.ring.wait_for_frame(after_seq, timeout)
+
+    def frame_valid(self, seq):
+        # a slot from wait_for_frame() still holds frame seq; check after using it, the writer does not wait for readers
+        return self.ring.valid(seq)
+
+    def touch(self):
+        # marks the camera as in use, wakes the capture thread if it was paused
+        self.last_used = time.monotonic()
+        if not self._wanted.is_set():
+            self._wanted.set()
+
+    def is_idle(self):
+        return self.idle_timeout > 0 and time.monotonic() - self.last_used > self.idle_timeout
 
     def is_initialized(self):
         return self.cap and self.cap.isOpened()
@@ -90,7 +208,9 @@ class Camera:
             print(f"Camera not initialized, cannot run:capture")
             return
         self.running = True
-        self._capture_t = Thread(target=self.run_single_thread, name="CaptureThread")
+        self._process_t = Thread(target=self.run_process_thread, name="ProcessThread")
+        self._process_t.start()
+        self._capture_t = Thread(target=self.run_capture_thread, name="CaptureThread")
         self._capture_t.start()
 
 
@@ -99,54 +219,185 @@ class Camera:
             print(f"Camera thread already stopped")
             return
         self.running = False
+        self.ring.wake_all()
+        self._wanted.set()
         self._capture_t.join(timeout=10)
-        #self._process_t.join(timeout=10)
-        if self._capture_t.is_alive():
-        #if self._capture_t.is_alive() or self._process_t.is_alive():
+        self._process_t.join(timeout=10)
+        if self._capture_t.is_alive() or self._process_t.is_alive():
             print("Warning: camera capture thread did not stop in time")
         else:
             print("Camera capture thread stopped")
         self._capture_t = None
-        #self._process_t = None
-
+        self._process_t = None
+        # hand the buffers of frames nobody processed back to the pool
+        while True:
+            try:
+                _, _, _, buf = self.handoff.get_nowait()
+            except queue.Empty:
+                break
+            if buf is not None:
+                buf.release()
+
+
+    def decoded_shape(self, color = None):
+        # shape of the frames decode_frame() returns
+        if color is None:
+            color = self.color
+        shape = (int(self.height), int(self.width))
+        return shape + (3,) if color else shape
 
-    def capture_frame(self, color = None):
-        # get a frame        
+    def capture_frame(self, color = None, decode = True, out = None):
+        # get a frame, None if the read failed; decode=False returns what the backend delivered
+        # out: optional buffer (decoded_shape, uint8) to read or decode into, the result may still be another array
+        # raises CameraUnavailableError while the camera is gone, the reconnect thread brings it back
         if color is None:
             color = self.color
+        # the read can block for the backend timeout, controls only wait for self.lock
+        with self.capture_lock:
+            self.check_available()
+            cap = self.cap
+            ret, frame = cap.read(out) if out is not None else cap.read()
         with self.lock:
-            while True:
-                ret, frame = self.cap.read()
-                if ret:
-                    self.failure_count = 0  # Reset failure counter on success
-                    if color:
-                        return frame
-                    else:
-                        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                else:
-                    self.failure_count += 1
-                    print(f"No frame snapped in capture_frame (Failure #{self.failure_count}).")
-                    if self.failure_count >= self.max_failures:
-                        print(f"Max failures ({self.max_failures}) reached. Attempting recovery...")
-                        self.attempt_recovery()
-                    if self.recovery_attempts >= self.max_recovery_attempts:
-                        print(f"Max recovery attempts ({self.max_recovery_attempts}) reached. Terminating...")
-                        raise ValueError("Camera stopped responding")
+            if not ret:
+                self.failure_count += 1
+                print(f"No frame snapped in capture_frame (Failure #{self.failure_count}).")
+                if self.failure_count >= self.max_failures:
+                    print(f"Max failures ({self.max_failures}) reached. Reconnecting...")
+                    self.start_reconnect()
+                return None
+            self.failure_count = 0  # Reset failure counter on success
+            self.last_capture_info = {
+                "driver_timestamp": getattr(cap, "last_timestamp", None),
+                "driver_sequence": getattr(cap, "last_sequence", None),
+            }
+        if not decode:
+            return frame
+        start = time.perf_counter()
+        frame = self.decode_frame(frame, color, out)
+        self.last_capture_info["decode_time"] = time.perf_counter() - start
+        return frame
+
+    def check_available(self):
+        if self.state in ("disconnected", "reconnecting"):
+            raise CameraUnavailableError(f"Camera {self.camera_index} is {self.state}")
+
+    def _set_state(self, state):
+        self.state = state
+        if state == "connected":
+            self.connected.set()
+        else:
+            self.connected.clear()
+
+    def start_reconnect(self):
+        # Hand the camera over to the reconnect thread; capture and control calls fail fast meanwhile
+        with self.lock:
+            self._set_state("reconnecting")
+            if self._reconnect_t is not None and self._reconnect_t.is_alive():
+                return
+            self._reconnect_t = Thread(target=self.run_reconnect_thread, name="ReconnectThread", daemon=True)
+            self._reconnect_t.start()
+
+    def run_reconnect_thread(self):
+        # Reopen the camera with exponential backoff, the locks are only held while reopening
+        delay = self.reconnect_delay
+        self.recovery_attempts = 0
+        while True:
+            time.sleep(delay)   # Wait for device to settle / re-enumerate
+            with self.capture_lock, self.lock:
+                if self.state != "reconnecting":
+                    return      # select_camera() or set_backend() reopened it meanwhile
+                self.recovery_attempts += 1
+                self.release_camera()
+                if self.init_camera():
+                    print(f"Recovery attempt #{self.recovery_attempts}: Camera reopened successfully.")
+                    self.failure_count = 0
+                    self.recovery_attempts = 0
+                    return
+                self._set_state("reconnecting")
+            delay = min(delay * 2, self.max_reconnect_delay)
+            print(f"Recovery attempt #{self.recovery_attempts}: Failed to reopen camera, next attempt in {delay:.1f}s.")
+
+    @staticmethod
+    def is_compressed(frame):
+        # raw MJPEG bytes come as a flat or 1xN buffer
+        return frame.ndim == 1 or (frame.ndim == 2 and frame.shape[0] == 1)
+
+    def passthrough_active(self):
+        # the JPEG from the camera can be published as is when the pipeline would not change the image
+        return (self.mjpeg_passthrough and self.color and self.integrate_frames == 1 and self.binning == 1
+                and self.hot_pixel_corrector is None and not self.calibration.active
+                and not (self.roi_mode and self.roi_regions))
+
+    def set_mjpeg_passthrough(self, enable):
+        self.mjpeg_passthrough = bool(enable)
+        self.set_raw_capture()
+
+    def decode_frame(self, frame, color, out=None):
+        # Turns whatever the backend delivered into BGR (color) or luminance (grayscale)
+        # conversions write into out when it has the right shape; views and JPEG decoding do not use it
+        if out is not None and out.shape != (frame.shape[:2] + (3,) if color else frame.shape[:2]):
+            out = None
+        if frame.ndim == 3 and frame.shape[2] == 3:
+            # already decoded to BGR by OpenCV
+            return frame if color else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=out)
+        if frame.ndim == 2 and frame.shape[0] > 1 and frame.shape[1] == 2 * int(self.width):
+            frame = frame.reshape(frame.shape[0], -1, 2)
+        if frame.ndim == 3 and frame.shape[2] == 2:
+            # raw YUYV: Y is every other byte, take it as a strided view
+            return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_YUYV, dst=out) if color else frame[:, :, 0]
+        if frame.ndim == 2 and min(frame.shape) > 1:
+            # native grayscale
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=out) if color else frame
+        # raw MJPEG bytes: let libjpeg decode luminance only when color is not needed (cv2.imdecode has no dst)
+        return cv2.imdecode(frame.reshape(-1), cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE)
+
+    def wants_raw_capture(self):
+        # Grayscale guiding gets raw buffers from the driver and decodes only luminance (see decode_frame),
+        # MJPEG pass-through needs the undecoded bytes as well; everything else lets the backend decode
+        return not self.color or self.passthrough_active()
+
+    def set_raw_capture(self):
+        # applied on every mode change and by the capture thread when integration, ROI, binning
+        # or calibration switch pass-through on or off
+        with self.capture_lock, self.lock:
+            raw = self.wants_raw_capture()
+            if self.cap is not None:
+                self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0 if raw else 1)
+                if self.backend == "gstreamer":
+                    # lets the pipeline hand over the luminance plane of a hardware JPEG decoder
+                    self.cap.set(cv2.CAP_PROP_MONOCHROME, 0 if self.color else 1)
+            self._raw_capture = raw
 
     def clear_hot_pixel_mask(self):
         filename = os.path.join(self.output_dir, self.hot_pixel_mask_path)
         if os.path.exists(filename):
-            os.remove(filename)
+            remove_hot_pixel_mask(filename)
             print(f"Removed hot pixel mask file: {filename}")
-        self.hot_pixels = None
+        self.set_hot_pixels(None)
             
+    def average_frames(self, frames):
+        # float32 average of single captured frames in the current color mode
+        avg = None
+        captured = 0
+        while captured < frames:
+            frame = self.capture_frame()
+            if frame is None:
+                continue
+            captured += 1
+            if avg is None:
+                avg = frame.astype(np.float32)
+            else:
+                np.add(avg, frame, out=avg)
+        avg /= frames
+        return avg
+
     def capture_hot_pixel_mask(self, dark_frames_to_avg=10, hot_pixel_threshold=15):
         print("Capturing dark frames...")
-        frames = []
-        for i in range(dark_frames_to_avg):
-            gray = self.capture_frame(False)
-            frames.append(gray.astype(np.float32))
-        avg_dark = np.mean(frames, axis=0)
+        master_dark = self.average_frames(dark_frames_to_avg)
+        exposure, gain, _ = self.calibration_settings()
+        filename = self.calibration.save_dark(master_dark, exposure, gain)
+        print(f"Saved master dark to {filename}")
+        avg_dark = cv2.cvtColor(master_dark, cv2.COLOR_BGR2GRAY) if master_dark.ndim == 3 else master_dark
 
         filename = os.path.join(self.output_dir, self.dark_frame_path)
         cv2.imwrite(filename, avg_dark.astype(np.uint8))
@@ -155,151 +406,330 @@ class Camera:
         # Step 1: Threshold to find potential hot pixels
         median_val = np.median(avg_dark)
         threshold = median_val + hot_pixel_threshold
-        potential_hot_pixels = avg_dark > threshold
-        hot_pixel_coords = np.argwhere(potential_hot_pixels)
-
-        # Step 2: Filter for local maxima in 3x3 neighborhood
-        true_hot_pixels = []
-        height, width = avg_dark.shape
-        for y, x in hot_pixel_coords:
-            # Define 3x3 neighborhood boundaries
-            y1, y2 = max(y - 1, 0), min(y + 2, height)
-            x1, x2 = max(x - 1, 0), min(x + 2, width)
-            neighborhood = avg_dark[y1:y2, x1:x2]
-            # Check if the center pixel is the maximum
-            center_val = avg_dark[y, x]
-            if center_val == np.max(neighborhood):
-                true_hot_pixels.append([y, x])
-
-        # Convert to numpy array
-        self.hot_pixels = np.array(true_hot_pixels, dtype=np.int32) if true_hot_pixels else np.empty((0, 2), dtype=np.int32)
 
-        filename = os.path.join(self.output_dir, self.hot_pixel_mask_path)
-        with open(filename, 'w') as f:
-            json.dump(self.hot_pixels.tolist(), f)
+        # Step 2: Keep local maxima in 3x3 neighborhood: a pixel is a maximum if dilation does not change it
+        local_max = cv2.dilate(avg_dark, np.ones((3, 3), np.uint8))
+        hot = (avg_dark > threshold) & (avg_dark == local_max)
+        self.set_hot_pixels(np.argwhere(hot).astype(np.int32))
 
-        print(f"Saved hot pixel mask to {filename}")
+        if self.hot_pixel_corrector is not None:
+            filename = os.path.join(self.output_dir, self.hot_pixel_mask_path)
+            save_hot_pixel_mask(filename, self.hot_pixel_corrector, int(self.height), int(self.width))
+            print(f"Saved hot pixel mask ({len(self.hot_pixels)} pixels) to {filename}")
+        else:
+            self.clear_hot_pixel_mask()
+            print("No hot pixels found")
+
+    def capture_master_flat(self, flat_frames_to_avg=20):
+        print("Capturing flat frames...")
+        master_flat = self.calibration.subtract_dark(self.average_frames(flat_frames_to_avg))
+        filename = self.calibration.save_flat(master_flat)
+        print(f"Saved master flat to {filename}")
+
+    def clear_calibration(self):
+        self.calibration.clear()
+        print("Removed calibration masters")
+
+    def calibration_settings(self):
+        # (exposure, gain, frame shape) the calibration masters are selected by
+        exposure = self.get_exposure()
+        controls = self.get_direct_controls() or {}
+        gain = controls.get("gain", {}).get("value", 0)
+        shape = (int(self.height), int(self.width), 3) if self.color else (int(self.height), int(self.width))
+        return exposure, gain, shape
+
+    def select_calibration(self):
+        # pick the masters matching the current controls, called whenever they change
+        try:
+            settings = self.calibration_settings()
+        except CameraUnavailableError:
+            return
+        self.calibration.directory = self.output_dir or ""
+        self.calibration.select(*settings)
 
     def load_hot_pixel_mask(self):
         filename = os.path.join(self.output_dir, self.hot_pixel_mask_path)
         if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                self.hot_pixels = np.array(json.load(f), dtype=np.int32)
+            corrector = load_hot_pixel_mask(filename, self.bayer_mask, int(self.height), int(self.width))
+            with self.realloc_lock:
+                self.hot_pixels = corrector.coords
+                self.hot_pixel_corrector = corrector if len(corrector) > 0 else None
             print(f"Loaded hot pixel mask from {filename}")
         else:
-            self.hot_pixels = None
+            self.set_hot_pixels(None)
             print(f"hot pixel mask file not found: {filename}")
 
-    def apply_hot_pixel_mask(self, frame):
-        if self.hot_pixels is None or len(self.hot_pixels) == 0:
-            return
-        
-        if len(frame.shape) == 3:  # Color image
-            height, width, colors = frame.shape
-        else:
-            height, width = frame.shape
-            colors = 1
+    def set_hot_pixels(self, hot_pixels):
+        # Build the correction engine once, apply_hot_pixel_mask() only runs it
+        corrector = None
+        if hot_pixels is not None and len(hot_pixels) > 0:
+            corrector = HotPixelCorrector(hot_pixels, self.bayer_mask)
+            corrector.build(int(self.height), int(self.width))
+        with self.realloc_lock:
+            self.hot_pixels = hot_pixels
+            self.hot_pixel_corrector = corrector
 
-        for c in range(colors):  # for each color channel: R, G, B
-            for y, x in self.hot_pixels:
+    def apply_hot_pixel_mask(self, frame, regions=None):
+        corrector = self.hot_pixel_corrector
+        if corrector is None:
+            return
+        corrector.apply(frame, regions)
 
-                # Define 3x3 neighborhood boundaries
-                y1, y2 = max(y - 1, 0), min(y + 2, height)
-                x1, x2 = max(x - 1, 0), min(x + 2, width)
+    def _update_stage_time(self, stage, duration, alpha=0.1):
+        self.stage_times[stage] += alpha * (duration - self.stage_times[stage])
 
-                # Step 1: Extract the central value and 3x3 neighborhood
-                # Extract the neighborhood
-                if colors>1:
-                    central_value = frame[y, x, c]
-                    neighborhood = frame[y1:y2, x1:x2, c].astype(np.float32)
+    def run_capture_thread(self):
+        # Stage 1: only dequeue and decode frames, hand them to the processing thread
+        while self.running:
+            if self.is_idle():
+                # nobody reads frames: stop pulling them from the driver until touch()
+                self._wanted.clear()
+                if self.is_idle():
+                    self._wanted.wait(timeout=0.5)
+                continue
+            start = time.perf_counter()
+            passthrough = self.passthrough_active()
+            if self._raw_capture != self.wants_raw_capture():
+                self.set_raw_capture()
+            # pass-through frames stay JPEG bytes, a decode buffer is only needed for the others
+            buf = self.pool.acquire(self.decoded_shape()) if not passthrough else None
+            try:
+                frame = self.capture_frame(decode=not passthrough, out=buf.array if buf is not None else None)
+            except CameraUnavailableError:
+                # nothing to publish until the camera is back, consumers see camera.state
+                if buf is not None:
+                    buf.release()
+                self.connected.wait(timeout=0.5)
+                continue
+            if frame is None:
+                if buf is not None:
+                    buf.release()
+                continue
+            meta = self.last_capture_info
+            if passthrough:
+                if self.is_compressed(frame):
+                    meta["jpeg"] = True     # decoded later, only if someone needs the pixels
                 else:
-                    central_value = frame[y, x]
-                    neighborhood = frame[y1:y2, x1:x2].astype(np.float32)
-
-                # Adjust bayer_mask to match the neighborhood size (in case of edges)
-                dy1, dy2 = y - y1, y2 - y - 1
-                dx1, dx2 = x - x1, x2 - x - 1
-                mask_slice = self.bayer_mask[1 - dy1:2 + dy2, 1 - dx1:2 + dx2]
-
-                # Step 2: Anti-debayer by subtracting central_value * bayer_mask
-                correction = central_value * mask_slice
-                neighborhood -= correction
-
-                # Ensure values stay within valid range (0-255 for uint8)
-                neighborhood = np.clip(neighborhood, 0, 255)
-
-                # Update the neighborhood in the frame
-                # Replace the hot pixel with the median of the corrected neighborhood
-                if colors>1:
-                    frame[y1:y2, x1:x2, c] = neighborhood.astype(np.uint8)
-                    median_val = np.median(neighborhood)
-                    frame[y, x, c] = int(median_val)
+                    # raw capture not switched on yet, decode as usual
+                    buf = self.pool.acquire(self.decoded_shape())
+                    decode_start = time.perf_counter()
+                    frame = self.decode_frame(frame, self.color, buf.array)
+                    meta["decode_time"] = time.perf_counter() - decode_start
+            if buf is None or frame is not buf.array:
+                # a view of the driver buffer, JPEG bytes or a freshly decoded array
+                if frame.flags.owndata:
+                    self.pool.count_unpooled()
+                if buf is not None:
+                    buf.release()
+                buf = None
+            # prefer the kernel buffer timestamp over the time the read returned
+            timestamp = meta["driver_timestamp"] or time.time()
+            self.capture_count += 1
+            meta["sequence"] = self.capture_count
+            meta["exposure_end"] = timestamp
+            meta["exposure_start"] = timestamp - (self.exposure_time or 0)
+            self._update_stage_time("capture", time.perf_counter() - start)
+            try:
+                self.handoff.put_nowait((frame, timestamp, meta, buf))
+            except queue.Full:
+                # processing is behind: drop the oldest frame, guiding wants the newest one
+                try:
+                    _, _, _, dropped = self.handoff.get_nowait()
+                    if dropped is not None:
+                        dropped.release()
+                    self.dropped_frames += 1
+                except queue.Empty:
+                    pass
+                self.handoff.put_nowait((frame, timestamp, meta, buf))
+
+    def run_process_thread(self):
+        # Stage 2: integrate, correct and publish frames
+        last_publish = time.perf_counter()
+        while self.running:
+            try:
+                frame, timestamp, meta, buf = self.handoff.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            start = time.perf_counter()
+            gc.disable()
+            with self.realloc_lock:
+                published = self.process_frame(frame, timestamp, meta)
+            gc.enable()
+            if buf is not None:
+                buf.release()   # process_frame copied the pixels into the ring
+            end = time.perf_counter()
+            self._update_stage_time("process", end - start)
+            if published:
+                self.last_frame_time = end - last_publish
+                last_publish = end
+
+    def process_frame(self, frame, timestamp, meta=None):
+        # Returns True when a new frame was published to the ring
+        start = time.perf_counter()
+        if frame is not None and meta is not None and meta.get("jpeg"):
+            color = self.color
+            self.ring.commit_jpeg(frame.reshape(-1), lambda jpeg: self.decode_frame(jpeg, color), timestamp,
+                                  self._frame_meta(meta, 1, None, start))
+            return True
+        if frame is None or (self.color and len(frame.shape) != 3) or (not self.color and len(frame.shape) != 2):
+            return False
+        if self._exposure_starts.maxlen != self.integrate_frames:
+            self._exposure_starts = deque(self._exposure_starts, maxlen=max(1, self.integrate_frames))
+        self._exposure_starts.append((meta or {}).get("exposure_start", timestamp))
+
+        calibrate = self.calibration.active
+        dtype = np.float32 if self.integrate_frames > 1 or calibrate or self.binning > 1 else frame.dtype
+        if self.integrate_frames == 1 or self.integration_mode == "sliding" or self._block_count == 0:
+            # full frame or windows is decided per published frame, a block keeps its windows
+            self._regions = self._frame_regions(binned_shape(frame.shape, self.binning), dtype)
+        regions = self._regions
+
+        if self.integrate_frames == 1:
+            count = 1
+            out = self._begin_write(frame.shape, dtype, regions)
+            for rows, cols in region_slices(regions):
+                np.copyto(out[rows, cols], frame[rows, cols])
+
+        elif self.integration_mode == "sliding":
+            self.integrator.push(frame, self.integrate_frames, regions)
+            count = self.integrator.count
+            out = self._begin_write(frame.shape, np.float32, regions)
+            self.integrator.mean_into(out, regions)
+
+        else:
+            # Copy first frame, add rest
+            if self.frame_accumulator.shape != frame.shape:
+                self.frame_accumulator = np.zeros(frame.shape, dtype=np.uint16)
+                self._block_count = 0
+                regions = self._regions = None
+            for rows, cols in region_slices(regions):
+                window = self.frame_accumulator[rows, cols]
+                if self._block_count == 0:
+                    window[...] = frame[rows, cols]
                 else:
-                    frame[y1:y2, x1:x2] = neighborhood.astype(np.uint8)
-                    median_val = np.median(neighborhood)
-                    frame[y, x] = int(median_val)
-            
+                    np.add(window, frame[rows, cols], out=window)  # Add in-place
+            self._block_count += 1
+            if self._block_count < self.integrate_frames:
+                return False
+            #multipliers = np.array([self.b_channel, self.g_channel, self.r_channel], dtype=np.float32)
+            #if not np.allclose(multipliers, 1.0):
+                #np.multiply(self.frame_accumulator, multipliers[None, None, :], out=self.temp_buffer)
+                #np.clip(self.temp_buffer, 0, 255, out=self.frame_accumulator)
+
+            # average straight into the next ring slot as float32: one pass, keeps the fractional precision
+            count = self._block_count
+            out = self._begin_write(self.frame_accumulator.shape, np.float32, regions)
+            for rows, cols in region_slices(regions):
+                np.divide(self.frame_accumulator[rows, cols], self._block_count, out=out[rows, cols])
+            self._block_count = 0
+
+        if calibrate:
+            self.calibration.apply(out, regions)
+        self.apply_hot_pixel_mask(out, regions)
+        if self.binning > 1:
+            native = out
+            out = self._begin_slot(binned_shape(native.shape, self.binning), np.float32, regions)
+            bin_into(native, out, self.binning, self.binning_mode, regions)
+        if regions is None:
+            self._store_background(out)
+        self.ring.commit(timestamp, self._frame_meta(meta, count, regions, start))
+        return True
 
-    def run_single_thread(self):
-        self.running = True
-        while self.running:
-            capture_time=0
-            process_time=0
-            start_time = time.perf_counter()
-            frame_count = 0
-            start = 0
-
-            if self.integrate_frames==1:
-                start = time.perf_counter()
-                self.frame = self.capture_frame()
-                self.apply_hot_pixel_mask(self.frame)
-                capture_time+=time.perf_counter() - start
-                start = time.perf_counter()
-                frame_count = 1
-            else:
-                # Copy first frame, add rest
-                for i in range(self.integrate_frames):
-                    start = time.perf_counter()
-                    frame = self.capture_frame()
-                    start2=time.perf_counter()
-                    capture_time+=start2 - start
-                    
-                    gc.disable()
-                    with self.realloc_lock:
-                        if frame is None or (self.color and len(frame.shape) != 3) or (not self.color and len(frame.shape) != 2):
-                            break
-                        if i == 0:
-                            self.frame_accumulator[...] = frame  # Copy first frame
-                        else:
-                            np.add(self.frame_accumulator, frame, out=self.frame_accumulator)  # Add in-place
-                        frame_count += 1
-                        process_time+=time.perf_counter() - start2
-                        gc.enable()
-            
-                if frame_count == 0:
-                    continue
-
-                start = time.perf_counter()
-                gc.disable()
-                with self.realloc_lock:
-                    self.frame_accumulator //= frame_count  # In-place division
-                    #multipliers = np.array([self.b_channel, self.g_channel, self.r_channel], dtype=np.float32)
-                    #if not np.allclose(multipliers, 1.0):
-                        #np.multiply(self.frame_accumulator, multipliers[None, None, :], out=self.temp_buffer)
-                        #np.clip(self.temp_buffer, 0, 255, out=self.frame_accumulator)
-
-                    frame = self.frame_accumulator.astype(np.uint8)
-                    self.apply_hot_pixel_mask(frame)
-                    self.frame=frame
-                gc.enable()
-    
-            end_time = time.perf_counter()
-            process_time+=end_time - start
-            self.last_frame_time = end_time - start_time
-            #print(f"Frame time {end_time - start_time:.2f}s")
-            #print(f"Processing time {process_time:.2f}s")
-            #print(f"Capturing time {capture_time:.2f}s")
-            #print("")
+    def _frame_meta(self, meta, count, regions, start):
+        # Metadata record of a published frame (FrameSlot.meta):
+        #   sequence                      capture counter of the newest frame in it
+        #   exposure_start, exposure_end  time.time(); the end is the driver timestamp (or when the read returned),
+        #                                 the start goes back by the exposure time and to the oldest integrated frame
+        #   decode_time, processing_time  seconds spent in decode_frame and process_frame
+        #   integration_count             frames averaged into it
+        #   published                     time.time() of the commit
+        # plus the backend details of capture_frame and "roi" for ROI mode frames
+        meta = dict(meta or {})
+        if count > 1 and len(self._exposure_starts) >= count:
+            meta["exposure_start"] = self._exposure_starts[-count]
+        meta["integration_count"] = count
+        if regions is not None:
+            meta["roi"] = regions
+        meta["processing_time"] = time.perf_counter() - start
+        meta["published"] = time.time()
+        self.latency.record("decode", meta.get("decode_time"))
+        self.latency.record("process", meta["processing_time"])
+        if meta.get("exposure_end") is not None:
+            self.latency.record("publish", meta["published"] - meta["exposure_end"])
+        return meta
+
+    def set_roi_mode(self, enable):
+        self.roi_mode = bool(enable)
+        self._roi_background = None         # start with a full frame
+
+    def set_roi(self, centers, margin):
+        """Sets the ROI windows to +-margin frame pixels around centers (x, y); no centers means full frames."""
+        # windows are built on the binned grid and stored in native pixels, aligned to whole bins
+        b = self.binning
+        regions = make_regions(centers, int(margin), int(self.height) // b, int(self.width) // b)
+        self.roi_regions = tuple((y0 * b, y1 * b, x0 * b, x1 * b) for y0, y1, x0, x1 in regions)
+
+    def _frame_regions(self, shape, dtype):
+        # windows for the next published frame, None when a full frame is due
+        if not self.roi_mode or not self.roi_regions:
+            return None
+        background = self._roi_background
+        if background is None or background.shape != shape or background.dtype != dtype:
+            return None
+        if self.integration_mode == "sliding" and self.integrator.n != self.integrate_frames:
+            return None     # the integrator restarts, fill it with full frames
+        if time.monotonic() - self._last_full_frame >= self.roi_refresh_interval:
+            return None
+        return self.roi_regions
+
+    def _begin_write(self, shape, dtype, regions):
+        # buffer to integrate the next frame into: the ring slot, or the native buffer when binning
+        if self.binning > 1:
+            if self.bin_buffer is None or self.bin_buffer.shape != shape:
+                self.bin_buffer = np.empty(shape, dtype=np.float32)
+            return self.bin_buffer
+        return self._begin_slot(shape, dtype, regions)
+
+    def _begin_slot(self, shape, dtype, regions):
+        # in ROI mode a slot gets the current background once, after that only its windows are written
+        slot = self.ring.next_slot()
+        out = slot.ensure(shape, dtype)
+        if regions is not None and slot.base != self._roi_base:
+            np.copyto(out, self._roi_background)
+            slot.base = self._roi_base
+        return out
+
+    def _store_background(self, out):
+        # a full frame while windows are set becomes the background of the following ROI frames
+        if not self.roi_mode or not self.roi_regions:
+            return
+        if self._roi_background is None or self._roi_background.shape != out.shape or self._roi_background.dtype != out.dtype:
+            self._roi_background = np.empty_like(out)
+        np.copyto(self._roi_background, out)
+        self._roi_base += 1
+        self.ring.next_slot().base = self._roi_base
+        self._last_full_frame = time.monotonic()
+
+    def set_binning(self, factor, mode=None):
+        factor = int(factor)
+        if factor not in BINNING_FACTORS:
+            raise ValueError(f"Unsupported binning: {factor}")
+        if mode is not None and mode not in BINNING_MODES:
+            raise ValueError(f"Unknown binning mode: {mode}")
+        with self.realloc_lock:
+            self.binning = factor
+            if mode is not None:
+                self.binning_mode = mode
+            self.roi_regions = ()               # windows were in the old frame coordinates
+        self.alloc_buffers(self.color)
+
+    def to_native(self, point):
+        # (x, y) in published frame pixels -> native sensor pixels
+        return to_native(point, self.binning)
+
+    def from_native(self, point):
+        # (x, y) in native sensor pixels -> published frame pixels
+        return from_native(point, self.binning)
 
     def apply_gamma_correction(self, image, gamma=1.5):
         inv_gamma = 1.0 / gamma
@@ -307,7 +737,8 @@ class Camera:
         return cv2.LUT(image, lut)
 
     def setfps(self, fps):
-        with self.lock:
+        with self.capture_lock, self.lock:
+            self.check_available()
             self.cap.set(cv2.CAP_PROP_FPS, fps)
             self.actual_fps = self.cap.get(cv2.CAP_PROP_FPS)
             print(f"Set FPS to {fps}, actual FPS: {self.actual_fps}")
@@ -315,9 +746,16 @@ class Camera:
 
     def set_color(self, color):
         self.alloc_buffers(color)
+        self.set_raw_capture()
+
+    def set_integration_mode(self, mode):
+        if mode not in ("block", "sliding"):
+            raise ValueError(f"Unknown integration mode: {mode}")
+        self.integration_mode = mode
 
     def set_mode(self, mode):
-        with self.lock:
+        with self.capture_lock, self.lock:
+            self.check_available()
             self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*mode))
             # check mode
             fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))  
@@ -326,7 +764,8 @@ class Camera:
             self.cam_mode = fourcc_str
 
     def set_frame_size(self, w, h):
-        with self.lock:
+        with self.capture_lock, self.lock:
+            self.check_available()
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
             actual_width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
@@ -337,26 +776,59 @@ class Camera:
             self.alloc_buffers(self.color)
 
     def init_camera(self):
-        print(f"Init camera")
-        self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_V4L2)  # Force V4L2 backend
-        #self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 4)
-
-        # Check if camera opened successfully
-        if not self.cap.isOpened():
-            return False            
-        self.set_mode(self.cam_mode)
-        self.set_frame_size(self.width, self.height)
-        if self.cam_fps!=0:     # 0=auto
-            self.setfps(self.cam_fps)
-        return True
+        print(f"Init camera ({self.backend} backend)")
+        with self.capture_lock, self.lock:
+            self._set_state("opening")
+            if self.backend == "v4l2":
+                # zero-copy mmap buffers with kernel timestamps; a view must outlive the frames queued in the
+                # handoff, the one being processed and the one being read, so hold that many plus one spare
+                hold = self.handoff.maxsize + 3
+                self.cap = V4L2Capture(self.camera_index, buffers=hold + 2, hold=hold)
+            elif self.backend == "gstreamer":
+                self.cap = GStreamerCapture(self.camera_index, jpeg_decoder=self.gst_jpeg_decoder)
+            else:
+                self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_V4L2)  # Force V4L2 backend
+            #self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 4)
+
+            # Check if camera opened successfully
+            if not self.cap.isOpened():
+                self._set_state("disconnected")
+                return False
+            self.set_mode(self.cam_mode)
+            self.set_frame_size(self.width, self.height)
+            if self.cam_fps!=0:     # 0=auto
+                self.setfps(self.cam_fps)
+            self.set_raw_capture()
+            self._set_state("connected")
+            return True
 
     def release_camera(self):
         print(f"Init camera")
         if self.cap and self.cap.isOpened():
             self.cap.release()
 
+    def set_backend(self, backend):
+        if backend not in ("opencv", "v4l2", "gstreamer"):
+            raise ValueError(f"Unknown capture backend: {backend}")
+        if backend == self.backend:
+            return
+        with self.capture_lock, self.lock:
+            print(f"Switching capture backend to {backend}")
+            self.release_camera()
+            self.backend = backend
+            self.init_camera()
+            self.alloc_buffers(self.color)
+
     def select_camera(self, index):
-        with self.lock:
+        # moves this instance to another device, the device must not be open in another instance
+        with Camera._instances_lock:
+            other = Camera._instances.get(index)
+            if other is not None and other is not self:
+                raise ValueError(f"Camera {index} is already in use")
+            if Camera._instances.get(self.camera_index) is self:
+                del Camera._instances[self.camera_index]
+            Camera._instances[index] = self
+        with self.capture_lock, self.lock:
             print(f"Selecting camera {index}")
             self.release_camera()
             self.camera_index = index
@@ -366,43 +838,51 @@ class Camera:
 
     def get_exposure(self):
         with self.lock:
+            self.check_available()
             return self.cap.get(cv2.CAP_PROP_EXPOSURE)
     
     def set_exposure(self, exposure):
         with self.lock:
+            self.check_available()
             if(exposure==0):
                 self.cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 3)
+                self.exposure_time = None
             else:
                 self.cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.75)
                 self.cap.set(cv2.CAP_PROP_EXPOSURE, int(exposure))
+                self.exposure_time = int(exposure) / 10000     # V4L2 exposure_absolute is in 100 us units
+        self.select_calibration()
 
     def set_direct_control(self, name, value):
-        return set_v4l2_control(name, value, self.camera_index)
+        self.check_available()
+        result = set_v4l2_control(name, value, self.camera_index)
+        self.select_calibration()
+        return result
     
     def get_direct_controls(self):
+        self.check_available()
         self.controls = get_v4l2_controls(self.camera_index)
         return self.controls
 
     def set_direct_controls(self, controls):
-        return set_v4l2_controls(controls, self.camera_index)
+        self.check_available()
+        result = set_v4l2_controls(controls, self.camera_index)
+        self.select_calibration()
+        return result
 
     def get_direct_control_values(self):
         self.get_direct_controls()
         return extract_v4l2_control_values(self.controls)
 
-    def attempt_recovery(self):
-        self.recovery_attempts += 1
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-            print(f"Recovery attempt #{self.recovery_attempts}: Camera released.")
-        time.sleep(1)  # Wait for device to settle
-        self.init_camera()
-        if self.cap.isOpened():
-            print(f"Recovery attempt #{self.recovery_attempts}: Camera reopened successfully.")
-            self.failure_count = 0  # Reset if recovery succeeds
-            self.recovery_attempts = 0
-        else:
-            print(f"Recovery attempt #{self.recovery_attempts}: Failed to reopen camera.")
+    def close(self):
+        # stops and releases the camera and forgets the instance, Camera(index) opens it anew
+        if self._capture_t is not None:
+            self.stop_capture()
+        with self.capture_lock:
+            self.release_camera()
+        with Camera._instances_lock:
+            if Camera._instances.get(self.camera_index) is self:
+                del Camera._instances[self.camera_index]
 
     def __del__(self):
         self.release_camera()
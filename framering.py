@@ -0,0 +1,170 @@
+import time
+import numpy as np
+from threading import Condition, Lock
+
+
+def to_uint8(data, out):
+    """Converts float32 data in 0..255 units or full range uint16 data to uint8 into out."""
+    if data.dtype == np.uint16:
+        np.right_shift(data, 8, out=out, casting='unsafe')
+    else:
+        np.copyto(out, np.clip(data, 0, 255), casting='unsafe')
+    return out
+
+
+def to_uint16(data, out=None):
+    """Converts float32 data in 0..255 units to full range uint16 (the inverse of to_uint8), copies uint16 data."""
+    if out is None:
+        out = np.empty(data.shape, dtype=np.uint16)
+    if data.dtype == np.uint16:
+        np.copyto(out, data)
+    else:
+        np.multiply(np.clip(data, 0, 255), 257, out=out, casting='unsafe')
+    return out
+
+
+class FrameSlot:
+    """
+    One preallocated frame buffer in the ring, stamped with a sequence number and capture time.
+
+    data is the frame as published: uint8, or float32 (0..255 units) when frames are integrated
+    so the averaging keeps its fractional precision. frame is the 8-bit version for display
+    and encoding; for non-uint8 data it is generated on first access and cached per frame.
+    Frames committed with commit_jpeg() keep the camera's JPEG bytes in jpeg and are only
+    decoded when data or frame is accessed.
+    """
+
+    def __init__(self):
+        self.seq = 0                # Monotonic sequence number, 0 = never written
+        self.timestamp = 0          # Capture time (time.time()) of the newest frame in this slot
+        self.meta = {}              # Backend details of the frame, e.g. driver sequence number
+        self.base = 0               # Camera ROI mode: full frame the pixels outside the windows come from
+        self.jpeg = None            # Compressed bytes as captured (MJPEG pass-through), None for decoded frames
+        self._data = None           # Preallocated image buffer
+        self._jpeg_buf = None       # Preallocated storage behind jpeg
+        self._decode = None         # Pending decoder for jpeg, run on first access of data
+        self._decode_lock = Lock()
+        self._display = None        # 8-bit buffer behind frame when data is not uint8
+        self._display_seq = 0       # seq the display buffer was generated for
+        self._display_lock = Lock()
+
+    def ensure(self, shape, dtype):
+        # (re)allocate only when the frame geometry changes
+        self.jpeg = None
+        self._decode = None
+        if self._data is None or self._data.shape != tuple(shape) or self._data.dtype != dtype:
+            self._data = np.empty(shape, dtype=dtype)
+        return self._data
+
+    def store_jpeg(self, jpeg, decode):
+        # copy the compressed bytes, the backend buffer is reused by the driver
+        size = len(jpeg)
+        if self._jpeg_buf is None or len(self._jpeg_buf) < size:
+            self._jpeg_buf = np.empty(size + size // 2, dtype=np.uint8)
+        self._jpeg_buf[:size] = jpeg
+        with self._decode_lock:
+            self.jpeg = self._jpeg_buf[:size]
+            self._decode = decode
+
+    @property
+    def data(self):
+        if self._decode is not None:
+            with self._decode_lock:
+                if self._decode is not None:
+                    self._data = self._decode(self.jpeg)
+                    self._decode = None
+        return self._data
+
+    @property
+    def frame(self):
+        data = self.data
+        if data is None or data.dtype == np.uint8:
+            return data
+        with self._display_lock:
+            if self._display_seq != self.seq:
+                if self._display is None or self._display.shape != data.shape:
+                    self._display = np.empty(data.shape, dtype=np.uint8)
+                to_uint8(data, self._display)
+                self._display_seq = self.seq
+            return self._display
+
+
+class FrameRing:
+    """
+    Fixed-size ring of frame slots shared between the capture thread (single writer)
+    and any number of consumers.
+
+    The writer fills the next slot in place (begin_write -> fill -> commit); consumers block in
+    wait_for_frame() on a condition variable and wake exactly once per committed frame.
+    A slot returned to a consumer stays valid until the writer wraps around the ring,
+    i.e. for (size - 1) further frames.
+    """
+
+    def __init__(self, size=4):
+        self.size = max(2, int(size))
+        self.slots = [FrameSlot() for _ in range(self.size)]
+        self.seq = 0                        # Sequence number of the latest committed frame
+        self.cond = Condition()
+
+    def alloc(self, shape, dtype=np.uint8):
+        with self.cond:
+            for slot in self.slots:
+                slot.ensure(shape, dtype)
+
+    def next_slot(self):
+        """The slot that will hold the next frame (writer only)."""
+        return self.slots[(self.seq + 1) % self.size]
+
+    def begin_write(self, shape, dtype=np.uint8):
+        """Returns the buffer of the slot that will hold the next frame, for the writer to fill in place."""
+        return self.next_slot().ensure(shape, dtype)
+
+    def commit(self, timestamp=None, meta=None):
+        """Publishes the slot filled after begin_write() and wakes all waiting consumers."""
+        with self.cond:
+            slot = self.next_slot()
+            slot.timestamp = time.time() if timestamp is None else timestamp
+            slot.meta = meta if meta is not None else {}
+            slot.seq = self.seq + 1
+            self.seq = slot.seq
+            self.cond.notify_all()
+        return slot.seq
+
+    def commit_jpeg(self, jpeg, decode, timestamp=None, meta=None):
+        """Publishes compressed bytes; decode(jpeg) produces data only when a consumer asks for it."""
+        slot = self.next_slot()
+        slot.store_jpeg(jpeg, decode)
+        slot.base = 0
+        return self.commit(timestamp, meta)
+
+    def publish(self, frame, timestamp=None, meta=None):
+        """Copies frame into the next slot and commits it."""
+        np.copyto(self.begin_write(frame.shape, frame.dtype), frame)
+        return self.commit(timestamp, meta)
+
+    def valid(self, seq):
+        """True while the slot that frame seq was committed to is not being refilled by the writer."""
+        with self.cond:
+            return 0 < seq and self.seq - seq < self.size - 1
+
+    def latest(self):
+        """Returns the most recently committed slot, or None if nothing was published yet."""
+        with self.cond:
+            if self.seq == 0:
+                return None
+            return self.slots[self.seq % self.size]
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        """
+        Blocks until a frame newer than after_seq is committed.
+        Returns the latest slot, or None on timeout.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq, timeout=timeout):
+                return None
+            return self.slots[self.seq % self.size]
+
+    def wake_all(self):
+        """Wakes all waiters without publishing (used on shutdown)."""
+        with self.cond:
+            self.cond.notify_all()
@@ -1,13 +1,25 @@
+import sys
 import cv2
-cap = cv2.VideoCapture("v4l2src device=/dev/video0 ! video/x-raw,format=YUY2,width=1920,height=1080,framerate=5/1 ! videoconvert ! appsink", cv2.CAP_GSTREAMER)
+from gstreamer import GStreamerCapture
+
+# Captures 10 frames through the GStreamer backend; without arguments videotestsrc is used, so it runs headless
+# python3 gcaptest.py [test|/dev/videoN] [MJPG|YUYV|GREY]
+device = sys.argv[1] if len(sys.argv) > 1 else "test"
+mode = sys.argv[2] if len(sys.argv) > 2 else "YUYV"
+cap = GStreamerCapture(0, device=device)
 if not cap.isOpened():
     print("Error: Webcam failed to open")
     exit()
+cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*mode))
+cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
+cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+cap.set(cv2.CAP_PROP_FPS, 5)
+print(cap.build_pipeline())
 for i in range(10):
     ret, frame = cap.read()
     if not ret:
         print(f"Error: Failed to capture frame {i}")
         break
     cv2.imwrite(f"frame_{i}.jpg", frame)
-    print(f"Captured frame {i}")
-cap.release()
\ No newline at end of file
+    print(f"Captured frame {i} at {cap.last_timestamp:.3f}")
+cap.release()
@@ -0,0 +1,243 @@
+import os
+import time
+import cv2
+from v4l2 import (ioctl, v4l2_control, VIDIOC_G_CTRL, VIDIOC_S_CTRL, V4L2_CID_EXPOSURE_AUTO,
+                  V4L2_CID_EXPOSURE_ABSOLUTE, V4L2_EXPOSURE_MANUAL, V4L2_EXPOSURE_APERTURE_PRIORITY)
+
+# Hardware JPEG decoders tried in this order by jpeg_decoder="auto"
+HW_JPEG_DECODERS = ("v4l2jpegdec", "nvjpegdec", "vaapijpegdec", "mppjpegdec")
+
+# GStreamer caps for the camera modes Camera uses (cv2 fourcc strings)
+_RAW_CAPS = {"YUYV": "video/x-raw,format=YUY2", "GREY": "video/x-raw,format=GRAY8"}
+
+
+def fourcc_str(value):
+    return int(value).to_bytes(4, 'little').decode('ascii', errors='replace')
+
+
+def gst_element_available(name):
+    # needs PyGObject, without it only the software decoder is assumed to exist
+    try:
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+    except (ImportError, ValueError):
+        return name == "jpegdec"
+    Gst.init(None)
+    return Gst.ElementFactory.find(name) is not None
+
+
+class GStreamerCapture:
+    """
+    GStreamer capture through OpenCV's appsink integration, a drop-in replacement for
+    cv2.VideoCapture in Camera.
+
+    The appsink is leaky (drop=true max-buffers=1 sync=false), so read() always returns the
+    newest frame and never works through a backlog. What the pipeline delivers follows the
+    Camera conventions of the other backends:
+      CONVERT_RGB=1        decoded in the pipeline to BGR (jpeg_decoder ! videoconvert)
+      CONVERT_RGB=0        raw buffers: JPEG bytes, YUYV as HxWx2 or GRAY8
+      MONOCHROME=1 + MJPG  with a jpeg_decoder the Y plane of the decoded I420/NV12 frame,
+                           luminance without any videoconvert
+    The pipeline is (re)built on the first read() after a property change.
+    Buffer timestamps (running time) are mapped to time.time() in last_timestamp; the offset is
+    the smallest wall-clock minus PTS seen since the pipeline started, i.e. capture time without
+    the delivery latency. device="test" uses videotestsrc, for headless testing.
+    """
+
+    def __init__(self, index, jpeg_decoder=None, device=None):
+        self.index = index
+        self.device = device if device is not None else f"/dev/video{index}"
+        self.jpeg_decoder = jpeg_decoder    # None: software decoding (jpegdec or cv2.imdecode), "auto" or an element name
+        self.mode = "MJPG"
+        self.width = 1280
+        self.height = 720
+        self.fps = 5
+        self.convert_rgb = True
+        self.monochrome = False
+        self.cap = None                     # cv2.VideoCapture running the pipeline
+        self.pipeline = None                # pipeline string of self.cap
+        self.fd = None                      # V4L2 device for exposure controls
+        self.last_timestamp = None
+        self.last_sequence = None
+        self.dropped = 0                    # frames dropped by the appsink are not reported by OpenCV
+        self._offset = None                 # time.time() - buffer PTS, see last_timestamp
+        self._count = 0
+        self._opened = self.device == "test" or os.path.exists(self.device)
+        if not self._opened:
+            print(f"GStreamer: {self.device} not found")
+
+    # --- pipeline ---
+
+    def _decoder(self):
+        if self.jpeg_decoder == "auto":
+            self.jpeg_decoder = next((name for name in HW_JPEG_DECODERS if gst_element_available(name)), "jpegdec")
+            print(f"GStreamer: using {self.jpeg_decoder} for JPEG decoding")
+        return self.jpeg_decoder or "jpegdec"
+
+    def _source(self):
+        size = f"width={int(self.width)},height={int(self.height)},framerate={int(round(self.fps))}/1"
+        if self.device == "test":
+            raw = _RAW_CAPS.get(self.mode, "video/x-raw,format=I420")
+            src = f"videotestsrc is-live=true pattern=ball ! {raw},{size}"
+            return src + (" ! jpegenc" if self.mode == "MJPG" else "")
+        caps = f"image/jpeg,{size}" if self.mode == "MJPG" else f"{_RAW_CAPS.get(self.mode, 'video/x-raw')},{size}"
+        return f"v4l2src device={self.device} do-timestamp=true ! {caps}"
+
+    def build_pipeline(self):
+        """Pipeline string for the current settings."""
+        stages = [self._source()]
+        if self.mode == "MJPG":
+            if self.convert_rgb:
+                stages += [self._decoder(), "videoconvert", "video/x-raw,format=BGR"]
+            elif self.monochrome and self.jpeg_decoder:
+                stages += [self._decoder()]         # I420/NV12 out, read() keeps the Y plane
+            else:
+                stages += ["image/jpeg"]            # bytes, decoded by Camera only if needed
+        elif self.convert_rgb and self.mode != "GREY":
+            stages += ["videoconvert", "video/x-raw,format=BGR"]
+        stages += ["appsink drop=true max-buffers=1 sync=false"]
+        return " ! ".join(stages)
+
+    def _start(self):
+        self.pipeline = self.build_pipeline()
+        self.cap = cv2.VideoCapture(self.pipeline, cv2.CAP_GSTREAMER)
+        self._offset = None
+        self._count = 0
+        if not self.cap.isOpened():
+            print(f"GStreamer: cannot start pipeline: {self.pipeline}")
+            self.cap = None
+            return False
+        return True
+
+    def _stop(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def isOpened(self):
+        return self._opened
+
+    def release(self):
+        self._stop()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._opened = False
+
+    # --- controls, through the V4L2 device next to the pipeline ---
+
+    def _ctrl_fd(self):
+        if self.fd is None and self.device != "test":
+            self.fd = os.open(self.device, os.O_RDWR | os.O_NONBLOCK)
+        return self.fd
+
+    def _get_ctrl(self, cid):
+        ctrl = v4l2_control(id=cid)
+        ioctl(self._ctrl_fd(), VIDIOC_G_CTRL, ctrl)
+        return ctrl.value
+
+    def _set_ctrl(self, cid, value):
+        ioctl(self._ctrl_fd(), VIDIOC_S_CTRL, v4l2_control(id=cid, value=int(value)))
+
+    # --- cv2.VideoCapture compatible properties ---
+
+    def set(self, prop, value):
+        if not self._opened:
+            return False
+        if prop in (cv2.CAP_PROP_EXPOSURE, cv2.CAP_PROP_AUTO_EXPOSURE):
+            if self.device == "test":
+                return False
+            try:
+                if prop == cv2.CAP_PROP_EXPOSURE:
+                    self._set_ctrl(V4L2_CID_EXPOSURE_ABSOLUTE, value)
+                else:
+                    self._set_ctrl(V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_APERTURE_PRIORITY if value == 3 else V4L2_EXPOSURE_MANUAL)
+                return True
+            except OSError as e:
+                print(f"GStreamer: failed to set property {prop} to {value}: {e}")
+                return False
+        if prop == cv2.CAP_PROP_FOURCC:
+            self.mode = fourcc_str(value)
+        elif prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        elif prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+        elif prop == cv2.CAP_PROP_MONOCHROME:
+            self.monochrome = bool(value)
+        else:
+            return False        # BUFFERSIZE etc.: the leaky appsink holds a single buffer
+        self._stop()            # rebuilt with the new settings on the next read()
+        return True
+
+    def get(self, prop):
+        if not self._opened:
+            return 0
+        if prop == cv2.CAP_PROP_FOURCC:
+            return cv2.VideoWriter_fourcc(*self.mode)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_BUFFERSIZE:
+            return 1
+        if prop in (cv2.CAP_PROP_EXPOSURE, cv2.CAP_PROP_AUTO_EXPOSURE) and self.device != "test":
+            try:
+                return self._get_ctrl(V4L2_CID_EXPOSURE_ABSOLUTE if prop == cv2.CAP_PROP_EXPOSURE else V4L2_CID_EXPOSURE_AUTO)
+            except OSError as e:
+                print(f"GStreamer: failed to get property {prop}: {e}")
+        return 0
+
+    # --- streaming ---
+
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        if self.cap is None and not self._start():
+            return False, None
+        ret, frame = self.cap.read(image) if image is not None else self.cap.read()
+        if not ret or frame is None:
+            return False, None
+
+        pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        now = time.time()
+        if self._offset is None or now - pts < self._offset:
+            self._offset = now - pts
+        self.last_timestamp = pts + self._offset
+        self._count += 1
+        self.last_sequence = self._count
+
+        if frame.ndim == 2 and frame.shape[0] == self.height * 3 // 2 and frame.shape[1] == self.width:
+            frame = frame[:self.height]     # I420 / NV12 from a JPEG decoder: luminance plane as a view
+        return True, frame
+
+
+# Test it headless: python3 gstreamer.py [test|/dev/videoN] [MJPG|YUYV|GREY] [jpeg decoder]
+if __name__ == "__main__":
+    import sys
+    device = sys.argv[1] if len(sys.argv) > 1 else "test"
+    mode = sys.argv[2] if len(sys.argv) > 2 else "MJPG"
+    cap = GStreamerCapture(0, jpeg_decoder=sys.argv[3] if len(sys.argv) > 3 else None, device=device)
+    if not cap.isOpened():
+        sys.exit(1)
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*mode))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    cap.set(cv2.CAP_PROP_FPS, 10)
+    for convert_rgb, monochrome in ((1, 0), (0, 0), (0, 1)):
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, convert_rgb)
+        cap.set(cv2.CAP_PROP_MONOCHROME, monochrome)
+        print(cap.build_pipeline())
+        for i in range(5):
+            ret, frame = cap.read()
+            if not ret:
+                print(f"Failed to capture frame {i}")
+                break
+            print(f"frame {i}: seq {cap.last_sequence} ts {cap.last_timestamp:.3f} shape {frame.shape} {frame.dtype}")
+    cap.release()
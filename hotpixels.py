@@ -0,0 +1,156 @@
+import os
+import json
+import glob
+import numpy as np
+from regions import region_mask
+
+# 3x3 neighbourhood offsets in row-major order, index 4 is the center pixel
+NEIGHBOUR_DY = np.array([-1, -1, -1, 0, 0, 0, 1, 1, 1], dtype=np.int64)
+NEIGHBOUR_DX = np.array([-1, 0, 1, -1, 0, 1, -1, 0, 1], dtype=np.int64)
+
+
+class HotPixelCorrector:
+    """
+    Vectorized hot pixel correction.
+
+    For every hot pixel the 3x3 neighbourhood is "anti-debayered" by subtracting
+    center_value * bayer_mask, clipped to 0..255, and the hot pixel is replaced by the
+    median of the corrected neighbourhood.
+    Gather/scatter indices and per-pixel weights are built once per frame size, so a frame
+    is corrected with a handful of NumPy calls regardless of the number of hot pixels.
+    """
+
+    def __init__(self, coords, bayer_mask):
+        self.coords = np.asarray(coords, dtype=np.int32).reshape(-1, 2)
+        self.bayer_mask = np.asarray(bayer_mask, dtype=np.float32)
+        self.shape = None               # (height, width) the indices were built for
+        self._regions = None            # regions of the last apply(), and the hot pixels inside them
+        self._selected = None
+
+    def __len__(self):
+        return len(self.coords)
+
+    def build(self, height, width):
+        y = self.coords[:, 0].astype(np.int64)
+        x = self.coords[:, 1].astype(np.int64)
+        ny = y[:, None] + NEIGHBOUR_DY[None, :]
+        nx = x[:, None] + NEIGHBOUR_DX[None, :]
+        valid = (ny >= 0) & (ny < height) & (nx >= 0) & (nx < width)
+        self.set_index_table(np.where(valid, ny * width + nx, -1), height, width)
+
+    def index_table(self):
+        # (K, 9) flat neighbour indices, -1 marks neighbours outside the frame
+        return np.where(self.valid, self.neighbours, -1)
+
+    def set_index_table(self, table, height, width):
+        valid = table >= 0
+        self.center = np.asarray(table[:, 4], dtype=np.int64)           # (K,) flat index of hot pixels
+        # out-of-frame neighbours gather the center pixel with zero weight, they are never scattered back
+        self.neighbours = np.where(valid, table, self.center[:, None])  # (K, 9)
+        self.weights = np.where(valid, self.bayer_mask.ravel()[None, :], 0).astype(np.float32)
+        self.valid = valid
+        self.scatter = self.neighbours[valid]                           # flat indices written back
+        self.full = valid.all(axis=1)                                   # hot pixels with a complete 3x3 neighbourhood
+        self.edge = ~self.full
+        self.shape = (height, width)
+        self._regions = None
+
+    def selected(self, regions):
+        # indices of the hot pixels inside regions, cached while the regions stay the same
+        if regions != self._regions:
+            inside = region_mask(self.coords[:, 0], self.coords[:, 1], regions)
+            self._selected = np.flatnonzero(inside)
+            self._regions = regions
+        return self._selected
+
+    def apply(self, frame, regions=None):
+        """Corrects frame (HxW or HxWxC uint8 or float32 in 0..255 units, C-contiguous) in place."""
+        if len(self.coords) == 0:
+            return
+        height, width = frame.shape[:2]
+        if self.shape != (height, width):
+            self.build(height, width)
+
+        center, neighbours, weights, valid = self.center, self.neighbours, self.weights, self.valid
+        full, edge, scatter = self.full, self.edge, self.scatter
+        if regions is not None:
+            selected = self.selected(regions)
+            if len(selected) == 0:
+                return
+            center, neighbours, weights, valid = center[selected], neighbours[selected], weights[selected], valid[selected]
+            full, edge = full[selected], edge[selected]
+            scatter = neighbours[valid]
+
+        flat = frame.reshape(height * width, -1)                        # view, one row per pixel
+        center_vals = flat[center].astype(np.float32)                   # (K, C)
+        hood = flat[neighbours].astype(np.float32)                      # (K, 9, C)
+        hood -= center_vals[:, None, :] * weights[:, :, None]
+        np.clip(hood, 0, 255, out=hood)
+
+        medians = np.empty_like(center_vals)
+        medians[full] = np.median(hood[full], axis=1)
+        if edge.any():
+            edge_hood = hood[edge]
+            edge_hood[~valid[edge]] = np.nan
+            medians[edge] = np.nanmedian(edge_hood, axis=1)
+
+        flat[scatter] = hood[valid].astype(frame.dtype)
+        flat[center] = medians.astype(frame.dtype)
+
+
+def index_path(path, height, width):
+    # correction indices depend on the frame size, they are cached next to the mask per resolution
+    return f"{os.path.splitext(path)[0]}_index_{width}x{height}.npy"
+
+
+def remove_hot_pixel_mask(path):
+    os.remove(path)
+    for table_path in glob.glob(f"{glob.escape(os.path.splitext(path)[0])}_index_*x*.npy"):
+        os.remove(table_path)
+
+
+def _save_npy(path, array):
+    # write next to the target and rename, the old file may still be memory-mapped by load_hot_pixel_mask()
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def save_hot_pixel_mask(path, corrector, height, width):
+    """Stores hot pixel coordinates and the correction indices for height x width as binary .npy files."""
+    if corrector.shape != (height, width):
+        corrector.build(height, width)
+    _save_npy(path, np.asarray(corrector.coords))
+    _save_npy(index_path(path, height, width), corrector.index_table())
+
+
+def load_hot_pixel_mask(path, bayer_mask, height, width):
+    """
+    Loads a hot pixel mask saved by save_hot_pixel_mask(), memory-mapping the arrays.
+    Older masks stored as JSON lists are still read and converted to the binary format.
+    Returns a HotPixelCorrector ready for height x width frames.
+    """
+    try:
+        coords = np.load(path, mmap_mode='r')
+        legacy = False
+    except ValueError:
+        with open(path, 'r') as f:
+            coords = np.array(json.load(f), dtype=np.int32).reshape(-1, 2)
+        legacy = True
+
+    corrector = HotPixelCorrector(coords, bayer_mask)
+    if len(corrector) == 0:
+        return corrector
+
+    table_path = index_path(path, height, width)
+    table = np.load(table_path, mmap_mode='r') if os.path.exists(table_path) else None
+    if table is not None and table.shape == (len(corrector), 9):
+        corrector.set_index_table(table, height, width)
+    else:
+        corrector.build(height, width)
+        _save_npy(table_path, corrector.index_table())
+
+    if legacy:
+        save_hot_pixel_mask(path, corrector, height, width)
+    return corrector
@@ -0,0 +1,53 @@
+import numpy as np
+from regions import region_slices
+
+
+class SlidingIntegrator:
+    """
+    Running sum over the last N frames.
+
+    Each pushed frame replaces the oldest one in a ring of N uint8 frames: the oldest is
+    subtracted from the sum and the newest added, so every captured frame yields a fresh
+    integrated frame without re-summing the whole stack.
+    The ring needs N full frames of memory (e.g. N=10 at 1280x720 color is ~28 MB).
+    With regions only those windows are updated; the sum stays the sum of the ring at every
+    pixel, pixels outside the windows just keep older frames.
+    """
+
+    def __init__(self):
+        self.n = 0              # window length
+        self.count = 0          # frames currently in the window (< n while filling up)
+        self.pos = 0            # ring slot to be replaced next
+        self.history = None     # (n, *frame.shape) uint8 ring
+        self.sum = None         # running sum, uint16 while n*255 fits, uint32 otherwise
+
+    def reset(self, n, shape):
+        self.n = max(1, int(n))
+        dtype = np.uint16 if self.n * 255 <= np.iinfo(np.uint16).max else np.uint32
+        self.history = np.zeros((self.n,) + tuple(shape), dtype=np.uint8)
+        self.sum = np.zeros(shape, dtype=dtype)
+        self.count = 0
+        self.pos = 0
+
+    def push(self, frame, n, regions=None):
+        """Adds frame to a window of n frames, returns the number of frames currently integrated."""
+        if self.history is None or n != self.n or frame.shape != self.history.shape[1:]:
+            self.reset(n, frame.shape)
+        full = self.count == self.n
+        for rows, cols in region_slices(regions):
+            oldest = self.history[self.pos][rows, cols]
+            total = self.sum[rows, cols]
+            if full:
+                np.subtract(total, oldest, out=total)
+            np.copyto(oldest, frame[rows, cols])
+            np.add(total, frame[rows, cols], out=total)
+        if not full:
+            self.count += 1
+        self.pos = (self.pos + 1) % self.n
+        return self.count
+
+    def mean_into(self, out, regions=None):
+        """Writes the window average into out without temporaries (float32 keeps the fraction, uint8 truncates)."""
+        for rows, cols in region_slices(regions):
+            np.divide(self.sum[rows, cols], self.count, out=out[rows, cols], casting='unsafe')
+        return out
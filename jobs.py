@@ -0,0 +1,306 @@
+import itertools
+import multiprocessing
+import time
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from threading import Thread, Lock, Condition
+
+# Each job gets one shared memory block: HEADER_SIZE control bytes followed by the frame.
+# The main process sets the cancel byte, the worker sets started and progress (percent).
+HEADER_SIZE = 64
+_CANCEL, _STARTED, _PROGRESS = 0, 1, 2
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it was cancelled, reported as state "cancelled"."""
+
+
+# --- worker processes ---
+
+def _init_worker():
+    # runs once when a worker process starts, so photutils/astropy are imported before the first job
+    try:
+        from analyzer import Analyzer
+        from platesolver import PlateSolver
+        Analyzer()
+        PlateSolver()
+    except Exception as e:
+        print(f"Job worker could not preload the analysis modules: {e}")
+
+
+def _warm():
+    return True
+
+
+def _analyze(frame, params, progress):
+    from analyzer import Analyzer
+    return Analyzer().analyze_snr(frame, params["snr"], params["std"], params["fwhm"], progress=progress)
+
+
+def _plate_solve(frame, params, progress):
+    import cv2
+    from conversions import deg_to_lx200_ra, deg_to_lx200_dec
+    from platesolver import PlateSolver
+    cv2.imwrite(params["path"], frame, [cv2.IMWRITE_PNG_COMPRESSION, 4])  # Save as PNG with mid compression
+    progress(0.05)
+    ra, dec, rot, scale = PlateSolver().solve(params["path"], progress=lambda fraction: progress(0.05 + 0.95 * fraction))
+    return {
+        'status': 'ok',
+        'ra': deg_to_lx200_ra(float(ra)),
+        'dec': deg_to_lx200_dec(float(dec)),
+        'rotation': rot,
+        'scale': scale
+    }
+
+
+JOB_FUNCTIONS = {"analyze": _analyze, "plate_solve": _plate_solve}
+
+
+def _run_job(kind, shm_name, shape, dtype, params):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    header = np.ndarray((HEADER_SIZE,), dtype=np.uint8, buffer=shm.buf)
+    frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=HEADER_SIZE)
+
+    def progress(fraction):
+        # reports progress between the steps of a job, aborts it once cancel() was called
+        if header[_CANCEL]:
+            raise JobCancelled()
+        header[_PROGRESS] = max(0, min(100, int(fraction * 100)))
+
+    header[_STARTED] = 1
+    result = error = None
+    try:
+        progress(0)
+        result = JOB_FUNCTIONS[kind](frame, params, progress)
+    except JobCancelled:
+        error = JobCancelled()
+    except Exception as e:
+        error = RuntimeError(f"{type(e).__name__}: {e}")    # the traceback would keep views of the frame alive
+    del frame, header, progress     # no views may remain when the block is closed
+    shm.close()
+    if error is not None:
+        raise error
+    return result
+
+
+# --- main process ---
+
+class Job:
+    """A background job; state is "queued", "running", "done", "error" or "cancelled"."""
+
+    def __init__(self, job_id, kind, key):
+        self.id = job_id
+        self.kind = kind
+        self.key = key                  # Cache key, e.g. (kind, camera, frame seq, parameters)
+        self.state = "queued"
+        self.progress = 0               # Percent
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.version = 0                # JobRunner.version of the last change, see jobs_since()
+        self.future = None
+        self._shm = None
+        self._header = None             # Control bytes in self._shm
+        self._callbacks = []            # Called with the result once the job is done
+
+    @property
+    def active(self):
+        return self.state in ("queued", "running")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobRunner:
+    """
+    Runs heavy analysis (SNR analysis, plate solving) in a warm process pool, away from the
+    request threads and the guide loop's GIL.
+
+    submit() copies the frame into shared memory and returns a Job immediately; progress and
+    cancellation go through control bytes in front of the frame. A monitor thread polls them
+    and bumps version, so clients can wait_for_update() and fetch jobs_since(). Finished
+    results are cached by key (e.g. camera frame sequence and parameters): submitting the same
+    key again returns the finished or still running job instead of starting a new one.
+    """
+
+    def __init__(self, workers=1, cache_size=16, keep=32):
+        self.workers = workers
+        self.cache_size = cache_size    # finished jobs kept in the result cache
+        self.keep = keep                # jobs listed by jobs_since()
+        self.lock = Lock()
+        self.cond = Condition(self.lock)
+        self.version = 0
+        self.jobs = OrderedDict()       # id -> Job, oldest first
+        self.cache = OrderedDict()      # key -> finished Job, least recently used first
+        self._ids = itertools.count(1)
+        self.executor = None
+        self.running = True
+        self.start_pool()
+        self._monitor_t = Thread(target=self.run_monitor_thread, name="JobMonitorThread", daemon=True)
+        self._monitor_t.start()
+
+    def start_pool(self):
+        # spawn: forking a process that runs camera threads is not safe
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker)
+        for _ in range(self.workers):
+            self.executor.submit(_warm)     # start the workers and their imports now
+
+    def _changed(self, job):
+        # called with self.lock held
+        self.version += 1
+        job.version = self.version
+        self.cond.notify_all()
+
+    def submit(self, kind, frame, params, key=None, on_result=None):
+        """Starts a job on a copy of frame, or returns the cached/running job with the same key."""
+        with self.lock:
+            job = self.cache.get(key) if key is not None else None
+            if job is not None:
+                self.cache.move_to_end(key)
+            elif key is not None:
+                job = next((j for j in self.jobs.values() if j.key == key and j.active), None)
+            if job is not None:
+                if job.active:
+                    if on_result is not None:
+                        job._callbacks.append(on_result)
+                    return job
+        if job is not None:
+            if on_result is not None:
+                on_result(job.result)
+            return job
+
+        frame = np.asarray(frame)
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + frame.nbytes)
+        target = np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf, offset=HEADER_SIZE)
+        np.copyto(target, frame)
+        del target
+        job = Job(next(self._ids), kind, key)
+        job._shm = shm
+        job._header = np.ndarray((HEADER_SIZE,), dtype=np.uint8, buffer=shm.buf)
+        job._header[:] = 0
+        if on_result is not None:
+            job._callbacks.append(on_result)
+        try:
+            job.future = self.executor.submit(_run_job, kind, shm.name, frame.shape, frame.dtype.str, params)
+        except (BrokenProcessPool, RuntimeError) as e:
+            print(f"Job pool unavailable, restarting it: {e}")
+            self.start_pool()
+            job.future = self.executor.submit(_run_job, kind, shm.name, frame.shape, frame.dtype.str, params)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep:
+                old_id = next(iter(self.jobs))
+                if self.jobs[old_id].active:
+                    break
+                del self.jobs[old_id]
+            self._changed(job)
+        job.future.add_done_callback(lambda future, job=job: self._finished(job, future))
+        return job
+
+    def _finished(self, job, future):
+        error = None
+        if future.cancelled():
+            state = "cancelled"
+        else:
+            error = future.exception()
+            state = "done" if error is None else "cancelled" if isinstance(error, JobCancelled) else "error"
+        with self.lock:
+            job.state = state
+            if state == "done":
+                job.result = future.result()
+                job.progress = 100
+                if job.key is not None:
+                    self.cache[job.key] = job
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            elif state == "error":
+                job.error = str(error)
+                print(f"Job {job.id} ({job.kind}) failed: {error}")
+            job.finished = time.time()
+            self._release(job)
+            callbacks, job._callbacks = job._callbacks, []
+            self._changed(job)
+        if isinstance(error, BrokenProcessPool) and self.running:
+            print("Job worker died, restarting the pool")
+            self.start_pool()
+        if state == "done":
+            for callback in callbacks:
+                try:
+                    callback(job.result)
+                except Exception as e:
+                    print(f"Error in job {job.id} result callback: {e}")
+
+    def _release(self, job):
+        # called with self.lock held; the worker has closed its view when the future completes
+        if job._shm is not None:
+            job._header = None
+            job._shm.close()
+            job._shm.unlink()
+            job._shm = None
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job, returns False if it already finished."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            if job._header is not None:
+                job._header[_CANCEL] = 1    # a running job stops at its next progress() call
+        job.future.cancel()                 # a queued job never starts
+        return True
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def run_monitor_thread(self):
+        # publishes state and progress changes of running jobs
+        while self.running:
+            time.sleep(0.2)
+            with self.lock:
+                for job in self.jobs.values():
+                    if not job.active or job._header is None:
+                        continue
+                    state = "running" if job._header[_STARTED] else "queued"
+                    progress = int(job._header[_PROGRESS])
+                    if state != job.state or progress != job.progress:
+                        job.state, job.progress = state, progress
+                        self._changed(job)
+
+    def wait_for_update(self, after_version=0, timeout=None):
+        """Blocks until a job changed after after_version; returns the new version or None on timeout."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.version > after_version or not self.running, timeout=timeout):
+                return None
+            return self.version
+
+    def jobs_since(self, version=0):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values() if job.version > version]
+
+    def shutdown(self):
+        with self.lock:
+            self.running = False
+            active = [job for job in self.jobs.values() if job.active]
+            for job in active:
+                if job._header is not None:
+                    job._header[_CANCEL] = 1
+            self.cond.notify_all()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            for job in active:
+                self._release(job)
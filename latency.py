@@ -0,0 +1,85 @@
+import bisect
+from threading import Lock
+
+# Upper bin edges in milliseconds; the last bin collects everything slower
+LATENCY_EDGES_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Counts latencies (seconds) into fixed millisecond bins, cheap enough to record every frame."""
+
+    def __init__(self, edges_ms=LATENCY_EDGES_MS):
+        self.edges_ms = tuple(edges_ms)
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.edges_ms) + 1)
+            self.count = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+            self.last_ms = None
+
+    def record(self, seconds):
+        if seconds is None:
+            return
+        ms = max(0.0, seconds * 1000.0)
+        with self.lock:
+            self.counts[bisect.bisect_left(self.edges_ms, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self.last_ms = ms
+
+    def percentile(self, p):
+        # upper edge of the bin holding the p-th percentile, None beyond the last edge
+        with self.lock:
+            if self.count == 0:
+                return None
+            target = p / 100.0 * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                seen += n
+                if seen >= target:
+                    return self.edges_ms[i] if i < len(self.edges_ms) else None
+        return None
+
+    def snapshot(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        with self.lock:
+            return {
+                "edges_ms": list(self.edges_ms),
+                "counts": list(self.counts),
+                "count": self.count,
+                "mean_ms": round(self.total_ms / self.count, 2) if self.count else None,
+                "max_ms": round(self.max_ms, 2),
+                "last_ms": round(self.last_ms, 2) if self.last_ms is not None else None,
+                "p50_ms": p50,
+                "p95_ms": p95,
+            }
+
+
+class LatencyStats:
+    """Named latency histograms, created on first use."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def reset(self):
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+
+    def snapshot(self):
+        with self.lock:
+            histograms = dict(self.histograms)
+        return {name: histogram.snapshot() for name, histogram in histograms.items()}
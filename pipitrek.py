@@ -1,9 +1,8 @@
 from flask import Flask, request, redirect, url_for, render_template, Response, jsonify, send_file
-from analyzer import Analyzer
 from autoguider import Autoguider
-from camera import Camera
+from camera import Camera, CameraUnavailableError
 from comm.telescopeserver import TelescopeServer
-from platesolver import PlateSolver
+from jobs import JobRunner
 from threading import Thread, Event
 import time
 import numpy as np
@@ -46,11 +45,50 @@ telescope = None
 camera = None
 telescopeserver = None
 global_server = None
+jobs = None         # JobRunner for /analyze and /plateSolve
 
 video_interval = 0.5 # interval for generating video frames
 frame_timeout = 30 # seconds before timeout
 
 
+@app.errorhandler(CameraUnavailableError)
+def camera_unavailable(e):
+    return jsonify({"status": "error", "message": str(e)}), 503
+
+
+class InvalidCameraIndex(ValueError):
+    """Raised for a camera index in a request that is not a device number."""
+
+
+@app.errorhandler(InvalidCameraIndex)
+def invalid_camera_index(e):
+    return jsonify({"status": "error", "message": str(e)}), 400
+
+
+def camera_index_arg(index):
+    # device index from a request argument or JSON field
+    try:
+        return int(index)
+    except (TypeError, ValueError):
+        raise InvalidCameraIndex(f"Invalid camera index: {index!r}")
+
+
+def setup_camera(cam):
+    # opens cam with the saved settings, output directory, hot pixel mask and calibration masters, and starts it
+    cam.init_camera()
+    all_settings.set_camera_settings(cam)
+    cam.load_hot_pixel_mask()
+    cam.select_calibration()
+    cam.start_capture()
+
+
+def camera_for(index):
+    # camera addressed by a request (device index), the guide camera if none is given
+    if index is None:
+        return camera
+    return Camera.get(camera_index_arg(index))
+
+
 # PAGES
 
 @app.route('/control')
@@ -79,30 +117,36 @@ def draw_info(frame, nframe):
 
 @sock.route('/video_feed_ws')
 def video_feed_ws(ws):
-    last_valid_frame = None
+    # ?camera=<index> streams another open camera instead of the guide camera
+    cam = camera_for(request.args.get('camera', type=int))
+    last_seq = 0
     last_yield = time.time()
     nframe = 0
     try:
-        while camera is not None and camera.running:
+        while cam is not None and cam.running:
             start = time.time()
             if start - last_yield > frame_timeout:
                 print("Timeout from video_feed_ws", flush=True)
                 break            
-            frame = camera.frame
-            if frame is not last_valid_frame and frame is not None and frame.size > 0:
+            slot = cam.wait_for_frame(last_seq, timeout=1.0)
+            if slot is not None:
                 #draw_info(frame, nframe)
                 #print(f"video frame {nframe} sent")
                 nframe += 1
                 last_yield = start
-                last_valid_frame = frame
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                last_seq = slot.seq
+                # MJPEG pass-through: the camera's own JPEG goes out without decoding or re-encoding
+                buffer = slot.jpeg
+                ret = buffer is not None
+                if not ret and slot.frame is not None and slot.frame.size > 0:
+                    ret, buffer = cv2.imencode('.jpg', slot.frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
                 if ret:
                     # Send the frame as a Base64-encoded string
                     frame_data = base64.b64encode(buffer).decode('utf-8')
                     ws.send(frame_data)
                 else:
                     print("Frame encoding failed")
-            time.sleep(max(video_interval - (time.time()-start),0.01))
+                time.sleep(max(video_interval - (time.time()-start),0))   # limit video rate
     except ssl.SSLEOFError as e:
         print(f"SSL EOF error in video_feed_ws: {e}")
     except Exception as e:
@@ -112,7 +156,7 @@ def video_feed_ws(ws):
 
 @sock.route('/thresh_feed_ws')
 def thresh_feed_ws(ws):
-    last_valid_thresh = None
+    last_seq = 0
     last_yield = time.time()
     nframe = 0
     try:
@@ -121,22 +165,26 @@ def thresh_feed_ws(ws):
             if start - last_yield > frame_timeout:
                 print("Timeout from thresh_feed_ws", flush=True)
                 break            
-            thresh = autoguider.threshold
-            if thresh is not last_valid_thresh and thresh is not None :
+            autoguider.request_diagnostics("threshold")
+            seq = autoguider.wait_for_result(last_seq, timeout=1.0)
+            if seq is not None:
+                last_seq = seq      # also without a threshold image (detection without diagnostics), or this spins
+            thresh = autoguider.acquire_threshold() if seq is not None else None
+            if thresh is not None:
                 last_yield = start
-                last_valid_thresh = thresh
                 #thresh_color = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
                 #draw_info(thresh_color, nframe)
                 #print(f"thresh frame {nframe} sent")
                 nframe += 1
-                ret, buffer = cv2.imencode('.jpg', thresh, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                ret, buffer = cv2.imencode('.jpg', thresh.array, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                thresh.release()
                 if ret:
                     # Send the frame as a Base64-encoded string
                     frame_data = base64.b64encode(buffer).decode('utf-8')
                     ws.send(frame_data)
                 else:
                     print("Frame encoding failed")
-            time.sleep(max(video_interval - (time.time()-start),0.01))
+                time.sleep(max(video_interval - (time.time()-start),0))   # limit video rate
     except ssl.SSLEOFError as e:
         print(f"SSL EOF error in thresh_feed_ws: {e}")
     except Exception as e:
@@ -144,14 +192,36 @@ def thresh_feed_ws(ws):
     finally:
         print("Client disconnected from thresh_feed_ws", flush=True)
 
+@sock.route('/jobs_ws')
+def jobs_ws(ws):
+    # pushes every change of a background job (state, progress, result) as a JSON list of jobs
+    last_version = 0
+    try:
+        ws.send(json.dumps(jobs.jobs_since(0)))
+        last_version = jobs.version
+        while jobs.running:
+            version = jobs.wait_for_update(last_version, timeout=1.0)
+            if version is None:
+                continue
+            changed = jobs.jobs_since(last_version)
+            last_version = version
+            if changed:
+                ws.send(json.dumps(changed))
+    except ssl.SSLEOFError as e:
+        print(f"SSL EOF error in jobs_ws: {e}")
+    except Exception as e:  # Catches WebSocketConnectionClosedException
+        pass
+    print("jobs_ws disconnected")
+
 @sock.route('/autoguider_socket')
 def autoguider_socket(ws):
+    last_seq = autoguider.result_seq
     while True:
         try:
-            if autoguider.data_ready:
-                autoguider.data_ready = False
+            seq = autoguider.wait_for_result(last_seq, timeout=1.0)
+            if seq is not None:
+                last_seq = seq
                 ws.send(json.dumps(form_properties()))
-            time.sleep(0.1)
         except ssl.SSLEOFError as e:
             print(f"SSL EOF error in autoguider_socket: {e}")
         except Exception as e:  # Catches WebSocketConnectionClosedException
@@ -501,6 +571,22 @@ def set_hot_pixel_mask():
         camera.capture_hot_pixel_mask()
     return jsonify({"status": "success"}), 200
 
+@app.route('/set_calibration', methods=['POST'])
+def set_calibration():
+    action = request.form.get('calibration')
+    if action == 'dark':
+        camera.capture_hot_pixel_mask()     # also builds the master dark
+    elif action == 'flat':
+        try:
+            camera.capture_master_flat()
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+    elif action == 'clear':
+        camera.clear_calibration()
+    else:
+        return jsonify({"status": "error", "message": f"Unknown calibration action: {action}"}), 400
+    return jsonify({"status": "success"}), 200
+
 @app.route('/get_camera_properties', methods=['GET'])
 def get_camera_properties():    
     if camera is not None:
@@ -552,6 +638,40 @@ def set_camera_properties():
     if integrate_frames is not None:
         camera.integrate_frames = int(integrate_frames)
 
+    integration_mode = request.json.get('integration_mode')
+    if integration_mode is not None:
+        try:
+            camera.set_integration_mode(integration_mode)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+    camera_backend = request.json.get('camera_backend')
+    if camera_backend is not None:
+        try:
+            camera.set_backend(camera_backend)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+    binning = request.json.get('binning')
+    binning_mode = request.json.get('binning_mode')
+    if binning is not None or binning_mode is not None:
+        try:
+            camera.set_binning(binning if binning is not None else camera.binning, binning_mode)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+    mjpeg_passthrough = request.json.get('mjpeg_passthrough')
+    if mjpeg_passthrough is not None:
+        camera.set_mjpeg_passthrough(mjpeg_passthrough)
+
+    roi_mode = request.json.get('roi_mode')
+    if roi_mode is not None:
+        camera.set_roi_mode(roi_mode)
+
+    roi_refresh_interval = request.json.get('roi_refresh_interval')
+    if roi_refresh_interval is not None:
+        camera.roi_refresh_interval = float(roi_refresh_interval)
+
     camera_color = request.json.get('camera_color')
     if camera_color is not None:
         camera.set_color(camera_color)
@@ -562,7 +682,10 @@ def set_camera_properties():
 
     camera_index = request.json.get('camera_index')
     if camera_index is not None:
-        camera.select_camera(int(camera_index))    
+        try:
+            camera.select_camera(int(camera_index))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
     return jsonify({"status": "success"}), 200
 
@@ -571,39 +694,75 @@ def set_camera_properties():
 # AUTOGUIDER
 def form_properties():
     telescope = Telescope()
+    autoguider.request_diagnostics("centroid_image")
     if camera is not None:
         camera_index = camera.camera_index
         width = camera.width
         height = camera.height
-        exposure = camera.get_exposure()
+        camera_state = camera.state
+        try:
+            exposure = camera.get_exposure()
+        except CameraUnavailableError:
+            exposure = 0
         integrate_frames = camera.integrate_frames
+        integration_mode = camera.integration_mode
+        camera_backend = camera.backend
+        roi_mode = camera.roi_mode
+        roi_refresh_interval = camera.roi_refresh_interval
+        binning = camera.binning
+        binning_mode = camera.binning_mode
+        mjpeg_passthrough = camera.mjpeg_passthrough
+        # the UI works in native sensor pixels, the autoguider in binned frame pixels
+        tracked_centroids = [camera.to_native(c) for c in autoguider.tracked_centroids]
+        current_centroids = [camera.to_native(c) for c in autoguider.current_centroids]
         r_channel = camera.r_channel
         g_channel = camera.g_channel
         b_channel = camera.b_channel
         actual_fps = camera.cam_fps
         cam_mode = camera.cam_mode
         camera_color = camera.color
+        stage_times = {stage: round(t, 3) for stage, t in camera.stage_times.items()}
+        dropped_frames = camera.dropped_frames
+        buffer_pools = {"camera": camera.pool.stats()}
+        calibration = camera.calibration.status()
     else:
         camera_index = 0
         width = 1
         height = 1
+        camera_state = "disconnected"
         exposure = 1
         integrate_frames = 1
+        integration_mode = "block"
+        camera_backend = "opencv"
+        roi_mode = False
+        roi_refresh_interval = 5
+        binning = 1
+        binning_mode = "mean"
+        mjpeg_passthrough = False
+        tracked_centroids = autoguider.tracked_centroids
+        current_centroids = autoguider.current_centroids
         r_channel = 1
         g_channel = 1
         b_channel = 1
         actual_fps = 5
         cam_mode = "MJPEG"
         camera_color = True
+        stage_times = {"capture": 0, "process": 0}
+        dropped_frames = 0
+        buffer_pools = {}
+        calibration = {"dark": False, "flat": False}
     
 
     properties = {
         "width": width,
         "height": height,
-        "tracked_centroids": autoguider.tracked_centroids,
-        "current_centroids": autoguider.current_centroids,
+        "tracked_centroids": tracked_centroids,
+        "current_centroids": current_centroids,
         "pec_position": telescope.scope_info["pec"]["progress"],
         "save_frames" : autoguider.save_frames,
+        "save_frames_every" : autoguider.save_frames_every,
+        "recorder": autoguider.recorder.status(),
+        "stale_frames": autoguider.stale_frames,
         "max_drift": autoguider.max_drift,
         "star_size": autoguider.star_size,
         "gray_threshold": autoguider.gray_threshold,
@@ -619,11 +778,20 @@ def form_properties():
         "focus_metric": autoguider.focus_metric,
         "last_loop_time": autoguider.last_loop_time,
         "last_frame_time": autoguider.last_frame_time,
+        "correction_latency_ms": autoguider.latency.snapshot().get("correction", {}).get("last_ms"),
         "last_status": autoguider.last_status,
         "camera_index": camera_index,
+        "camera_state": camera_state,
         "exposure": exposure,
         "exposure_ms": exposure/10,
         "integrate_frames": integrate_frames,
+        "integration_mode": integration_mode,
+        "camera_backend": camera_backend,
+        "roi_mode": roi_mode,
+        "binning": binning,
+        "binning_mode": binning_mode,
+        "mjpeg_passthrough": mjpeg_passthrough,
+        "roi_refresh_interval": roi_refresh_interval,
         "r_channel": r_channel,
         "g_channel": g_channel,
         "b_channel": b_channel,
@@ -631,6 +799,11 @@ def form_properties():
         "resolution": { "width":width, "height":height },
         "video_mode": cam_mode,
         "camera_color": camera_color,
+        "stage_times": stage_times,
+        "dropped_frames": dropped_frames,
+        # allocations stay constant once the pipeline runs, every frame is served from reuses
+        "buffer_pools": dict(buffer_pools, analyzer=autoguider.analyzer.pool.stats(), autoguider=autoguider.pool.stats()),
+        "calibration": calibration,
         "pid_p": autoguider.ra_pid.Kp,
         "pid_i": autoguider.ra_pid.Ki,
         "pid_d": autoguider.ra_pid.Kd
@@ -726,7 +899,25 @@ def set_dec_guiding():
 @app.route('/set_save_frames', methods=['POST'])
 def set_save_frames():
     save_frames = request.form.get('save_frames', type=lambda v: v.lower() == 'true')  # Convert "true"/"false" to boolean
-    autoguider.save_frames = save_frames
+    autoguider.set_save_frames(save_frames)
+    return jsonify({"status": "success"}), 200
+
+@app.route('/set_save_frames_every', methods=['POST'])
+def set_save_frames_every():
+    autoguider.save_frames_every = max(1, request.form.get('save_frames_every', type=int, default=10))
+    return jsonify({"status": "success"}), 200
+
+@app.route('/set_record_format', methods=['POST'])
+def set_record_format():
+    try:
+        autoguider.recorder.set_format(request.form.get('record_format'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success"}), 200
+
+@app.route('/rotate_recording', methods=['POST'])
+def rotate_recording():
+    autoguider.recorder.rotate()
     return jsonify({"status": "success"}), 200
 
 @app.route('/acquire', methods=['POST'])
@@ -741,7 +932,7 @@ def acquire():
     if x is not None and y is not None:
         if not add:
             autoguider.remove_all_tracked_stars()
-        autoguider.add_tracked_star(centroid=(x*camera.width, y*camera.height))
+        autoguider.add_tracked_star(centroid=camera.from_native((x*camera.width, y*camera.height)))
         print(f"Acquisition triggered at ({x*camera.width}, {y*camera.height})")
         return jsonify({'status': 'success', 'message': f"Acquisition triggered at ({x}, {y})"}), 200
     else:
@@ -757,7 +948,7 @@ def remove_tracked_star():
 
     x = request.form.get('x', type=float)
     y = request.form.get('y', type=float)
-    if autoguider.remove_tracked_star(centroid=(x*camera.width, y*camera.height)):
+    if autoguider.remove_tracked_star(centroid=camera.from_native((x*camera.width, y*camera.height))):
         print(f"Star removed at ({x*camera.width}, {y*camera.height})")
         return jsonify({'status': 'success', 'message': f"Tracked star removed at ({x}, {y})"}), 200
     else:
@@ -776,50 +967,125 @@ def calibrate():
 
 
 
+# CAMERAS
+@app.route('/cameras', methods=['GET'])
+def cameras():
+    # attached devices and the cameras currently open on them
+    open_cameras = {index: {"running": cam.running, "state": cam.state, "idle": cam.is_idle(), "guide": cam is camera}
+                    for index, cam in Camera.instances().items()}
+    return jsonify({"devices": list_cameras(), "open": open_cameras}), 200
+
+@app.route('/latency', methods=['GET'])
+def latency():
+    # latency histograms of the camera pipeline and the guide loop, ?reset=1 starts them over
+    cam = camera_for(request.args.get('camera'))
+    if cam is None:
+        return jsonify({"status": "error", "message": "Camera not open"}), 404
+    slot = cam.ring.latest()
+    result = {"camera": cam.latency.snapshot(), "autoguider": autoguider.latency.snapshot() if cam is camera else {},
+              "last_frame": slot.meta if slot is not None else None,
+              "last_guided_frame": autoguider.last_trace if cam is camera else None}
+    if request.args.get('reset'):
+        cam.latency.reset()
+        if cam is camera:
+            autoguider.latency.reset()
+    return jsonify(result), 200
+
+@app.route('/open_camera', methods=['POST'])
+def open_camera():
+    # "guide": true makes the autoguider guide with this camera from now on
+    global camera
+    index = request.json.get('camera_index')
+    if index is None:
+        return jsonify({"status": "error", "message": "camera_index required"}), 400
+    index = camera_index_arg(index)
+    cam = Camera.get(index)
+    if cam is None:
+        try:
+            cam = Camera(index)
+        except RuntimeError as e:
+            return jsonify({"status": "error", "message": str(e)}), 503
+    if not cam.running:
+        setup_camera(cam)
+    if request.json.get('guide') and cam is not camera:
+        autoguider.set_camera(cam)
+        camera = cam
+        return jsonify({"status": "success", "message": f"Camera {index} open, guiding with it"}), 200
+    return jsonify({"status": "success", "message": f"Camera {index} open"}), 200
+
+@app.route('/close_camera', methods=['POST'])
+def close_camera():
+    cam = camera_for(request.json.get('camera_index'))
+    if cam is None:
+        return jsonify({"status": "error", "message": "Camera not open"}), 400
+    if cam is camera:
+        return jsonify({"status": "error", "message": "The guide camera cannot be closed"}), 400
+    cam.close()
+    return jsonify({"status": "success"}), 200
+
+
 # ANALYSIS
+# /analyze and /plateSolve run as background jobs (jobs.py) and answer with the job right away;
+# results follow over /jobs_ws or GET /jobs/<id>. Requests for an already processed frame
+# are answered from the job cache, with the result included.
+
+def job_response(job):
+    return jsonify(job.to_dict()), 200 if job.state == "done" else 202
+
+def latest_slot(cam):
+    # newest published frame of a running camera, None if there is none
+    if cam is None or not cam.running:
+        return None
+    cam.touch()
+    slot = cam.ring.latest()
+    return slot if slot is not None and slot.data is not None and slot.data.size > 0 else None
+
 @app.route('/analyze', methods=['POST'])
 def analyze():   
-    analysis_snr = float(request.json.get('analysis_snr'))
-    analysis_std = float(request.json.get('analysis_std'))
-    analysis_fwhm = float(request.json.get('analysis_fwhm'))
-    analyzer = Analyzer()
-    frame = camera.frame
-    #analyzer.analyze_snr2(frame,snr_threshold)
-    retval= analyzer.analyze_snr(frame,analysis_snr,analysis_std, analysis_fwhm)
-    return jsonify(retval), 200
+    params = {"snr": float(request.json.get('analysis_snr')),
+              "std": float(request.json.get('analysis_std')),
+              "fwhm": float(request.json.get('analysis_fwhm'))}
+    slot = latest_slot(camera)
+    if slot is None:
+        return jsonify({"status": "error", "message": "No valid frame available"}), 400
+    key = ("analyze", camera.camera_index, slot.seq, tuple(sorted(params.items())))
+    # full precision data, copied into the job's shared memory before the ring wraps around
+    return job_response(jobs.submit("analyze", slot.data, params, key=key))
 
 @app.route('/plateSolve', methods=['POST'])
 def plateSolve():   
-    filename = request.json.get('filename')
     capture = request.json.get('capture')
-    if capture and camera is not None and camera.running:
-        frame = camera.frame
-        if frame is not None and frame.size > 0:
-            # Save the frame as an image file
-            save_path = os.path.join(os.getcwd(), 'saved_frame.png')
-            cv2.imwrite(save_path, frame, [cv2.IMWRITE_PNG_COMPRESSION, 4])  # Save as PNG with mid compression
-            print(f"Frame saved to {save_path}")
-        else:
-            return jsonify({"status": "error", "message": "No valid frame available"}), 400
-    else:
+    cam = camera_for(request.json.get('camera'))
+    if not capture or cam is None or not cam.running:
         return jsonify({"status": "error", "message": "Camera is not running"}), 503
-    
-    platesolver = PlateSolver()
-    try:
-        ra, dec, rot, scale = platesolver.solve(filename)
-        raStr = deg_to_lx200_ra(float(ra))
-        decStr = deg_to_lx200_dec(float(dec))
-        retval = {
-            'status': 'ok',
-            'ra' : raStr,
-            'dec' : decStr,
-            'rotation' : rot,
-            'scale' : scale
-        }
-        telescope.slew_request = (raStr, decStr)
-        return jsonify(retval), 200
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 400
+    slot = latest_slot(cam)
+    if slot is None:
+        return jsonify({"status": "error", "message": "No valid frame available"}), 400
+
+    def slew_to_solution(result):
+        telescope.slew_request = (result['ra'], result['dec'])
+
+    # the job saves the frame as PNG and solves it; always the same file, never a path from the request
+    save_path = os.path.join(os.getcwd(), 'saved_frame.png')
+    key = ("plate_solve", cam.camera_index, slot.seq, save_path)
+    return job_response(jobs.submit("plate_solve", slot.frame, {"path": save_path}, key=key, on_result=slew_to_solution))
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(jobs.jobs_since(0)), 200
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"Unknown job {job_id}"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not jobs.cancel(job_id):
+        return jsonify({"status": "error", "message": f"Job {job_id} is not running"}), 404
+    return jsonify({"status": "success", "message": f"Job {job_id} cancelled"}), 200
 
 
 # Shutdown APPLICATION
@@ -854,6 +1120,7 @@ def cleanup():
         print("Stopping autoguider..")
         all_settings.update_autoguider_settings(autoguider)
         autoguider.running = False
+        autoguider.recorder.stop(timeout=10)
         autoguider_thread.join(timeout=10)
         if autoguider_thread.is_alive():
             print("Warning: Autoguider thread did not stop in time")
@@ -877,6 +1144,14 @@ def cleanup():
             camera.release_camera()
             all_settings.update_camera_settings(camera)
             print("Camera stopped.")
+        for cam in Camera.instances().values():
+            if cam is not camera:
+                print(f"Stopping camera {cam.camera_index}..")
+                cam.close()
+
+        if jobs is not None:
+            print("Stopping background jobs..")
+            jobs.shutdown()
 
         cv2.destroyAllWindows()
         all_settings.save_settings()
@@ -933,22 +1208,22 @@ if __name__ == '__main__':
     print("Setting up autoguider camera..")
     try:
         camera = Camera()
-        camera.init_camera()
-        all_settings.set_camera_settings(camera)
-        camera.load_hot_pixel_mask() 
-        camera.start_capture()
+        setup_camera(camera)
         print("camera set up.")
     except Exception as e:
         print(f"Error initializing camera: {e}")
         camera = None
 
     print("Setting up autoguider..")
-    autoguider = Autoguider()
+    autoguider = Autoguider(camera)
     all_settings.set_autoguider_settings(autoguider)
     autoguider_thread = Thread(target=autoguider.run_autoguider)
     autoguider_thread.start()
     print("autoguider set up.")
 
+    print("Starting analysis workers..")
+    jobs = JobRunner()
+
     # TCP telescope server
     telescopeserver = TelescopeServer()
     telescopeserver.start()
@@ -2,6 +2,8 @@
 import subprocess
 import os
 import re
+import time
+import signal
 
 class PlateSolver:
     _instance = None
@@ -16,12 +18,14 @@ class PlateSolver:
             self._initialized = True
 
 
-    def solve(self, image_path, downsample=2, scale_low=50, scale_high=110, timeout=60):
+    def solve(self, image_path, downsample=2, scale_low=50, scale_high=110, timeout=60, progress=None):
         """
         Solves an image using astrometry.net and returns (RA, Dec, rotation in degrees).
         
         Parameters:
             image_path (str): Path to the input image (e.g., .png, .jpg, .fits).
+            progress (callable): Optional callback(fraction) while solve-field runs, estimated
+                from the CPU limit. If it raises, solve-field is killed and the exception propagates.
         
         Returns:
             (ra_deg, dec_deg, rotation_deg) if solved, or raises Exception.
@@ -40,20 +44,34 @@ class PlateSolver:
         ]
 
         print("Solving image:", image_path)
-        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        start = time.time()
+        # own process group, so a cancelled solve also stops the astrometry-engine children
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    if progress is not None:
+                        progress(min(0.95, (time.time() - start) / timeout))
+        finally:
+            if process.poll() is None:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.communicate()
 
-        if result.returncode != 0:
-            print(f"Solve failed:\n{result.stderr}")
-            raise RuntimeError(f"Solve failed:\n{result.stderr}")
+        if process.returncode != 0:
+            print(f"Solve failed:\n{stderr}")
+            raise RuntimeError(f"Solve failed:\n{stderr}")
 
         # Check if solve succeeded
-        if "Field 1: solved" not in result.stdout:
+        if "Field 1: solved" not in stdout:
             raise RuntimeError("Image was not solved")
 
         # Parse stdout for center and rotation
-        ra_match = re.search(r'Field center: \(RA,Dec\) = \(([+\-]?\d+\.\d+), ([+\-]?\d+\.\d+)\)', result.stdout)
-        rot_match = re.search(r'Field rotation angle: up is ([+\-]?\d+\.\d+) degrees', result.stdout)
-        scale_match = re.search(r'pixel scale ([\d.]+) arcsec/pix', result.stdout)
+        ra_match = re.search(r'Field center: \(RA,Dec\) = \(([+\-]?\d+\.\d+), ([+\-]?\d+\.\d+)\)', stdout)
+        rot_match = re.search(r'Field rotation angle: up is ([+\-]?\d+\.\d+) degrees', stdout)
+        scale_match = re.search(r'pixel scale ([\d.]+) arcsec/pix', stdout)
 
         if not ra_match or not rot_match or not scale_match:
             raise RuntimeError("Failed to parse RA/Dec/rotation/scale from output")
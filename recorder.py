@@ -0,0 +1,264 @@
+import os
+import time
+import queue
+import struct
+import datetime
+import numpy as np
+from threading import Thread
+
+
+# .NET ticks (100 ns since 0001-01-01) used by SER timestamps
+_TICKS_PER_SECOND = 10_000_000
+_TICKS_UNIX_EPOCH = 621355968000000000
+
+def ser_ticks(timestamp):
+    return _TICKS_UNIX_EPOCH + int(round(timestamp * _TICKS_PER_SECOND))
+
+
+class SerWriter:
+    """
+    SER v3 video file: 178 byte header, raw frames, then one UTC timestamp per frame.
+    The frame count in the header and the trailer are written on close().
+    """
+    HEADER = struct.Struct('<14s7i40s40s40sqq')
+    MONO = 0
+    BGR = 101
+
+    def __init__(self, filename, shape, dtype, timestamp):
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.timestamps = []
+        self.start = timestamp
+        self.file = open(filename, 'wb')
+        self.file.write(self._header())        # placeholder until the frame count is known
+
+    def _header(self):
+        height, width = self.shape[:2]
+        color = self.BGR if len(self.shape) == 3 else self.MONO
+        local_offset = datetime.datetime.fromtimestamp(self.start).astimezone().utcoffset().total_seconds()
+        return self.HEADER.pack(b'LUCAM-RECORDER', 0, color,
+                                0,              # "little endian" flag, 0 is what most readers expect for LE data
+                                width, height, self.dtype.itemsize * 8, len(self.timestamps),
+                                b'', b'', b'',
+                                ser_ticks(self.start + local_offset), ser_ticks(self.start))
+
+    def write(self, frame, timestamp):
+        self.file.write(np.ascontiguousarray(frame, dtype=self.dtype.newbyteorder('<')).data)
+        self.timestamps.append(ser_ticks(timestamp))
+
+    def close(self):
+        self.file.write(np.array(self.timestamps, dtype='<i8').tobytes())
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+
+
+class FitsWriter:
+    """
+    FITS cube (NAXIS3 = frames, color frames as R,G,B planes in NAXIS3 and frames in NAXIS4).
+    Rows are stored bottom-up as FITS viewers expect. The header is rewritten with the frame
+    count on close(); per-frame timestamps are only kept by the SER format.
+    """
+    BLOCK = 2880
+
+    def __init__(self, filename, shape, dtype, timestamp):
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.start = timestamp
+        self.file = open(filename, 'wb')
+        self.file.write(self._header())
+
+    @staticmethod
+    def _card(key, value, comment=""):
+        if isinstance(value, bool):
+            value = f"{'T' if value else 'F':>20}"
+        elif isinstance(value, str):
+            value = f"'{value:<8}'".ljust(20)
+        else:
+            value = f"{value:>20}"
+        card = f"{key:<8}= {value}" + (f" / {comment}" if comment else "")
+        return card[:80].ljust(80)
+
+    def _header(self):
+        height, width = self.shape[:2]
+        bitpix = 8 if self.dtype.itemsize == 1 else 16
+        axes = [width, height] + ([3] if len(self.shape) == 3 else []) + [self.count]
+        cards = [self._card("SIMPLE", True), self._card("BITPIX", bitpix), self._card("NAXIS", len(axes))]
+        cards += [self._card(f"NAXIS{i + 1}", n) for i, n in enumerate(axes)]
+        if bitpix == 16:
+            cards += [self._card("BZERO", 32768), self._card("BSCALE", 1)]
+        date = datetime.datetime.fromtimestamp(self.start, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        cards += [self._card("DATE-OBS", date, "UTC start of recording"),
+                  self._card("CREATOR", "pipitrek"),
+                  "END".ljust(80)]
+        header = "".join(cards)
+        return header.ljust(-(-len(header) // self.BLOCK) * self.BLOCK).encode('ascii')
+
+    def write(self, frame, timestamp):
+        data = frame[::-1]
+        if data.ndim == 3:
+            data = data[:, :, ::-1].transpose(2, 0, 1)      # BGR -> R, G, B planes
+        if self.dtype.itemsize == 2:
+            data = (data.astype(np.int32) - 32768).astype('>i2')
+        self.file.write(np.ascontiguousarray(data).data)
+        self.count += 1
+
+    def close(self):
+        size = self.file.tell()
+        self.file.write(b'\0' * (-size % self.BLOCK))
+        self.file.seek(0)
+        self.file.write(self._header())         # same length, only NAXISn changed
+        self.file.close()
+
+
+class Recorder:
+    """
+    Asynchronous frame recorder.
+
+    add_frame() only copies the frame into a bounded queue and never blocks; a writer thread
+    appends queued frames to a SER or FITS file. When the disk cannot keep up the queue fills
+    and new frames are dropped and counted in dropped_frames.
+    A new file is started on rotate() and whenever the frame size or type changes.
+    """
+    formats = {"ser": SerWriter, "fits": FitsWriter}
+    STOP_TIMEOUT = 2.0      # Seconds stop() waits for room in a full queue before dropping the queued frames
+
+    def __init__(self, max_queue=16):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.format = "ser"
+        self.output_dir = ""
+        self.recording = False
+        self.filename = None            # File currently written
+        self.frames_written = 0         # Frames in the current file
+        self.dropped_frames = 0         # Frames lost because the queue was full or a write failed
+        self._rotate = False
+        self._thread = None
+
+    def set_format(self, fmt):
+        if fmt not in self.formats:
+            raise ValueError(f"Unknown recording format: {fmt}")
+        self.format = fmt
+        self._rotate = True
+
+    def start(self):
+        if self.recording:
+            return
+        self.dropped_frames = 0
+        self.recording = True
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self.run_writer_thread, name="RecorderThread", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        # the writer closes the file after flushing the queue; pass a timeout to wait for it
+        if not self.recording:
+            return
+        self.recording = False
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()       # nobody left to write them
+            return
+        try:
+            self.queue.put(None, timeout=self.STOP_TIMEOUT)
+        except queue.Full:
+            # the writer is stuck on the disk: give up the queued frames, add_frame() no longer queues new ones
+            self._drain()
+            self.queue.put_nowait(None)
+        if timeout is not None:
+            self._thread.join(timeout)
+
+    def _drain(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self.dropped_frames += 1
+
+    def rotate(self):
+        # close the current file and continue in a new one
+        self._rotate = True
+
+    def add_frame(self, frame, timestamp=None, copy=True):
+        """Queues a copy of frame (frame itself if copy is False) for writing without blocking, returns False if it was dropped."""
+        if not self.recording or frame is None:
+            return False
+        try:
+            self.queue.put_nowait((frame.copy() if copy else frame, time.time() if timestamp is None else timestamp))
+        except queue.Full:
+            self.dropped_frames += 1
+            return False
+        return True
+
+    def status(self):
+        return {
+            "recording": self.recording,
+            "format": self.format,
+            "file": os.path.basename(self.filename) if self.filename else "",
+            "frames": self.frames_written,
+            "dropped": self.dropped_frames,
+            "queued": self.queue.qsize(),
+        }
+
+    def _open(self, frame, timestamp):
+        # milliseconds in the name, and a counter if that is taken: a rotation within the same
+        # second must not overwrite the file just closed
+        stamp = datetime.datetime.fromtimestamp(timestamp)
+        name = stamp.strftime("capture_%Y-%m-%d_%H-%M-%S") + f"-{stamp.microsecond // 1000:03d}"
+        filename = os.path.join(self.output_dir or "", f"{name}.{self.format}")
+        count = 1
+        while os.path.exists(filename):
+            filename = os.path.join(self.output_dir or "", f"{name}_{count}.{self.format}")
+            count += 1
+        writer = self.formats[self.format](filename, frame.shape, frame.dtype, timestamp)
+        self.filename = filename
+        self.frames_written = 0
+        print(f"Recording to {filename}")
+        return writer
+
+    def _close(self, writer):
+        try:
+            writer.close()
+            print(f"Saved {self.frames_written} frames to {writer.filename}")
+        except OSError as e:
+            print(f"Error closing recording {writer.filename}: {e}")
+
+    def run_writer_thread(self):
+        writer = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                if writer is not None:
+                    self._close(writer)
+                    writer = None
+                if not self.recording:
+                    return
+                continue        # restarted before the stop was processed
+            frame, timestamp = item
+            if writer is not None and (self._rotate or writer.shape != frame.shape or writer.dtype != frame.dtype):
+                self._close(writer)
+                writer = None
+            self._rotate = False
+            try:
+                if writer is None:
+                    writer = self._open(frame, timestamp)
+                writer.write(frame, timestamp)
+                self.frames_written += 1
+            except OSError as e:
+                print(f"Error writing recording: {e}")
+                self.dropped_frames += 1
+                if writer is not None:
+                    self._close(writer)
+                    writer = None
+            except Exception as e:
+                # anything else will fail for every frame: stop recording instead of queueing for a dead thread
+                print(f"Recording stopped: {e}")
+                self.recording = False
+                self.dropped_frames += 1
+                if writer is not None:
+                    self._close(writer)
+                self._drain()
+                return
@@ -0,0 +1,52 @@
+import numpy as np
+
+# Regions are (y0, y1, x0, x1) pixel windows, end exclusive. A region list of None stands for
+# the whole frame, so processing code can take the same path with and without windows.
+
+
+def make_regions(centers, margin, height, width):
+    """Square windows of +-margin pixels around (x, y) centers, clipped to the frame and merged where they overlap."""
+    regions = []
+    for center in centers:
+        if center is None:
+            continue
+        x, y = int(round(center[0])), int(round(center[1]))
+        y0, y1 = max(0, y - margin), min(height, y + margin + 1)
+        x0, x1 = max(0, x - margin), min(width, x + margin + 1)
+        if y0 < y1 and x0 < x1:
+            regions.append((y0, y1, x0, x1))
+    return merge_regions(regions)
+
+
+def merge_regions(regions):
+    # overlapping windows are replaced by their bounding box so no pixel is processed twice
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]:
+                    merged[i] = (min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return tuple(sorted(merged))
+
+
+def region_slices(regions):
+    """(rows, columns) slice pairs to index a frame with, one per region."""
+    if regions is None:
+        return [(slice(None), slice(None))]
+    return [(slice(y0, y1), slice(x0, x1)) for y0, y1, x0, x1 in regions]
+
+
+def region_mask(y, x, regions):
+    """Boolean mask of the points (y, x arrays) that lie inside any of the regions."""
+    inside = np.zeros(len(y), dtype=bool)
+    for y0, y1, x0, x1 in regions:
+        inside |= (y >= y0) & (y < y1) & (x >= x0) & (x < x1)
+    return inside
@@ -2,7 +2,7 @@ import json
 import os
 from autoguider import Autoguider
 from telescope import Telescope
-from camera import Camera
+from camera import Camera, CameraUnavailableError
 
 # File path for settings
 SETTINGS_FILE = 'settings.json'
@@ -21,6 +21,8 @@ class Settings:
         self.settings["guide_interval"] = autoguider.guide_interval
         self.settings["guide_pulse"] = autoguider.guide_pulse
         self.settings["dec_guiding"] = autoguider.dec_guiding
+        self.settings["save_frames_every"] = autoguider.save_frames_every
+        self.settings["record_format"] = autoguider.recorder.format
         self.settings["pid"] =  { "ra" : {},"dec": {}}
         self.settings["pid"]["ra"] = { "p":autoguider.ra_pid.Kp, "i": autoguider.ra_pid.Ki, "d": autoguider.ra_pid.Kd }
         self.settings["pid"]["dec"] = { "p":autoguider.ra_pid.Kp, "i": autoguider.ra_pid.Ki, "d": autoguider.ra_pid.Kd }
@@ -28,6 +30,14 @@ class Settings:
 
     def update_camera_settings(self, camera: Camera):
         self.settings["integrate_frames"] = camera.integrate_frames
+        self.settings["integration_mode"] = camera.integration_mode
+        self.settings["camera_backend"] = camera.backend
+        self.settings["gst_jpeg_decoder"] = camera.gst_jpeg_decoder
+        self.settings["roi_mode"] = camera.roi_mode
+        self.settings["binning"] = camera.binning
+        self.settings["binning_mode"] = camera.binning_mode
+        self.settings["mjpeg_passthrough"] = camera.mjpeg_passthrough
+        self.settings["roi_refresh_interval"] = camera.roi_refresh_interval
         self.settings["r_channel"] = camera.r_channel
         self.settings["g_channel"] = camera.g_channel
         self.settings["b_channel"] = camera.b_channel
@@ -35,7 +45,10 @@ class Settings:
         self.settings["width"] = camera.width
         self.settings["height"] = camera.height
         self.settings["cam_mode"] = camera.cam_mode
-        self.settings["camera_controls"] = camera.get_direct_control_values()
+        try:
+            self.settings["camera_controls"] = camera.get_direct_control_values()
+        except CameraUnavailableError:
+            pass    # keep the controls stored last time
         self.settings["camera_color"] = camera.color
 
     def update_telescope_settings(self, telescope:Telescope):        
@@ -55,6 +68,8 @@ class Settings:
             autoguider.guide_interval = float(self.settings.get("guide_interval", 1.0))
             autoguider.dec_guiding = bool(self.settings.get("dec_guiding", False))
             autoguider.output_dir = self.settings.get("output_dir")
+            autoguider.save_frames_every = int(self.settings.get("save_frames_every", 10))
+            autoguider.recorder.set_format(self.settings.get("record_format", "ser"))
 
             pid_settings = self.settings.get("pid")
             if pid_settings is not None:
@@ -79,8 +94,15 @@ class Settings:
 
             # Integer settings with default values
             camera.integrate_frames = int(self.settings.get("integrate_frames", 10))  # Default to 10
+            camera.set_integration_mode(self.settings.get("integration_mode", "block"))
+            camera.set_roi_mode(self.settings.get("roi_mode", False))
+            camera.set_binning(self.settings.get("binning", 1), self.settings.get("binning_mode", "mean"))
+            camera.mjpeg_passthrough = bool(self.settings.get("mjpeg_passthrough", True))
+            camera.roi_refresh_interval = float(self.settings.get("roi_refresh_interval", 5.0))
 
             # Method calls for exposure, gain, and fps with default values
+            camera.gst_jpeg_decoder = self.settings.get("gst_jpeg_decoder")
+            camera.set_backend(self.settings.get("camera_backend", "opencv"))
             camera.set_mode(self.settings.get("cam_mode", "MJPG"))
             camera.set_frame_size(int(self.settings.get("width", 1280)), int(self.settings.get("height", 720)))
             camera.setfps(float(self.settings.get("cam_fps", 30.0)))  # Default to 30.0
@@ -92,6 +114,8 @@ class Settings:
             print(f"Error converting property value: {e}")
         except AttributeError as e:
             print(f"Error setting camera attribute/method: {e}")
+        except CameraUnavailableError as e:
+            print(f"Camera settings not applied: {e}")
 
     def set_telescope_settings(self, telescope:Telescope):
         """Set telescope properties from a dictionary."""
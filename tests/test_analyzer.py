@@ -0,0 +1,146 @@
+import cv2
+import numpy as np
+import pytest
+
+analyzer = pytest.importorskip("analyzer", exc_type=ImportError)     # needs photutils, astropy, scikit-image and scipy
+Analyzer = analyzer.Analyzer
+
+
+def legacy_match(contours, near, star_size, max_distance):
+    # former per-contour loop of Analyzer._detect_star: nearest contour by mean point, larger than star_size
+    distance_data = []
+    for index, c in enumerate(contours):
+        mean_pos = np.mean(c, axis=0)[0]
+        distance_data.append((np.linalg.norm(mean_pos - np.array(near)), index))
+    distance_data.sort(key=lambda x: x[0])
+    for distance, index in distance_data:
+        if cv2.contourArea(contours[index]) > star_size and distance < max_distance:
+            return index
+    return None
+
+
+def star_field(rng, count=25, size=(120, 160)):
+    image = np.zeros(size, np.uint8)
+    for _ in range(count):
+        x, y = int(rng.integers(5, size[1] - 5)), int(rng.integers(5, size[0] - 5))
+        cv2.circle(image, (x, y), int(rng.integers(1, 4)), 255, -1)
+    contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_match_contours_matches_legacy_loop(seed):
+    rng = np.random.default_rng(seed)
+    contours = star_field(rng)
+    _, areas, positions = Analyzer._contour_table(contours)
+    search_near = [(float(rng.uniform(0, 160)), float(rng.uniform(0, 120))) for _ in range(30)] + [None]
+    matches = Analyzer._match_contours(areas, positions, search_near, star_size=4, max_distance=15)
+    for near, match in zip(search_near, matches):
+        if near is None:
+            assert match is None
+        else:
+            assert match == legacy_match(contours, near, 4, 15)
+
+
+def test_contour_table_areas_and_positions():
+    image = np.zeros((40, 40), np.uint8)
+    cv2.rectangle(image, (10, 10), (19, 15), 255, -1)
+    contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    _, areas, positions = Analyzer._contour_table(contours)
+    assert areas[0] == pytest.approx(cv2.contourArea(contours[0]))
+    np.testing.assert_allclose(positions[0], np.mean(contours[0], axis=0)[0])
+
+
+def gaussian_stars(centers, shape=(200, 300), sigma=2.0, peak=220.0):
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    frame = np.full(shape, 10.0, np.float32)
+    for cx, cy in centers:
+        frame += peak * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * sigma ** 2))
+    return frame
+
+
+@pytest.mark.parametrize("color", [False, True])
+def test_windowed_detection_matches_full_frame(color):
+    frame = gaussian_stars([(50.3, 60.7), (220.6, 140.2), (150, 30)])
+    if color:
+        frame = np.repeat(frame[:, :, None], 3, axis=2)
+    search_near = [(52, 58), (218, 143)]
+    full = Analyzer().detect_stars(frame, search_near, gray_threshold=100, star_size=2, max_distance=10)
+    windowed = Analyzer().detect_stars(frame, search_near, gray_threshold=100, star_size=2, max_distance=10,
+                                       windowed=True)
+    assert windowed[0] == full[0]
+    assert windowed[0][0] == pytest.approx((50.3, 60.7), abs=0.1)
+    assert windowed[3] == pytest.approx(full[3])
+    # the threshold image only covers the windows
+    assert windowed[2][30, 150] == 0 and full[2][30, 150] == 255
+
+
+def test_windowed_detection_reports_lost_stars():
+    frame = gaussian_stars([(50, 60)])
+    found = Analyzer().detect_stars(frame, [(52, 58), (250, 150)], gray_threshold=100, max_distance=10, windowed=True)
+    assert found[0][0] is not None and found[0][1] is None
+    # nothing at all in the windows: every star is lost, not an empty result
+    empty = Analyzer().detect_stars(frame, [(250, 150), (200, 20)], gray_threshold=100, max_distance=10, windowed=True)
+    assert empty[0] == [None, None]
+
+
+def test_windowed_detection_without_diagnostics():
+    frame = gaussian_stars([(50, 60)])
+    trace = {}
+    centroids, detail, thresh, focus = Analyzer().detect_stars(frame, [(50, 60)], gray_threshold=100, max_distance=10,
+                                                               windowed=True, diagnostics=False, trace=trace)
+    assert centroids[0] == pytest.approx((50, 60), abs=0.1)
+    assert detail is None and thresh is None and focus > 0
+    assert trace["detect_time"] >= 0
+
+
+def legacy_star_snr(image, position, cutout_size=30, smooth_sigma=1.0, threshold_sigma=3.0):
+    # former per-star Analyzer.estimate_star_snr, the reference for the batched version
+    from astropy.stats import sigma_clipped_stats
+    from scipy.ndimage import gaussian_filter
+    half = cutout_size // 2
+    x, y = int(position[0]), int(position[1])
+    if y - half < 0 or y + half >= image.shape[0] or x - half < 0 or x + half >= image.shape[1]:
+        return None
+    cutout = image[y - half:y + half + 1, x - half:x + half + 1].astype(np.float32)
+    mean, median, std = sigma_clipped_stats(cutout, sigma=3.0)
+    star_mask = gaussian_filter(cutout, sigma=smooth_sigma) > (median + threshold_sigma * std)
+    if not np.any(star_mask):
+        return None
+    star_pixels = cutout[star_mask]
+    signal = np.sum(star_pixels - median)
+    noise = np.sqrt(np.sum(star_pixels) + star_pixels.size * std ** 2)
+    return {'signal': signal, 'noise': noise, 'background': mean, 'snr': signal / noise, 'n_pixels': star_pixels.size}
+
+
+def noisy_star_field(centers, seed=1):
+    frame = gaussian_stars(centers, peak=120.0)
+    return frame + np.random.default_rng(seed).normal(0, 3, frame.shape).astype(np.float32)
+
+
+def test_batched_snr_matches_per_star_estimate():
+    centers = [(50, 60), (220, 140), (150, 100), (5, 5), (290, 195)]
+    image = noisy_star_field(centers)
+    positions = centers + [(100, 170)]          # the last one is empty sky
+    results = Analyzer().estimate_stars_snr(image, positions)
+    assert len(results) == len(positions)
+    for position, result in zip(positions, results):
+        expected = legacy_star_snr(image, position)
+        if expected is None:
+            assert result is None
+            continue
+        assert result['x'] == position[0] and result['y'] == position[1]
+        assert result['n_pixels'] == expected['n_pixels']
+        for key in ('signal', 'noise', 'background', 'snr'):
+            assert result[key] == pytest.approx(float(expected[key]), rel=1e-3)
+    assert results[3] is None and results[4] is None        # edge stars
+
+
+def test_single_star_estimate_uses_the_batch():
+    image = noisy_star_field([(50, 60)])
+    assert Analyzer().estimate_star_snr(image, (50, 60)) == Analyzer().estimate_stars_snr(image, [(50, 60)])[0]
+    assert Analyzer().estimate_stars_snr(image, []) == []
+
+
+def test_analyze_snr_returns_without_stars():
+    assert Analyzer().analyze_snr(np.full((100, 120), 10, np.uint8)) == []
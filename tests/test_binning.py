@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from binning import binned_shape, bin_into, to_native, from_native
+
+
+def block_mean(src, factor):
+    height, width = src.shape[0] // factor, src.shape[1] // factor
+    blocks = src[:height * factor, :width * factor].reshape(height, factor, width, factor, *src.shape[2:])
+    return blocks.mean(axis=(1, 3))
+
+
+@pytest.mark.parametrize("factor", [2, 3])
+@pytest.mark.parametrize("shape", [(12, 18), (13, 20, 3)])
+def test_mean_matches_block_average(factor, shape):
+    src = np.random.default_rng(1).uniform(0, 255, shape).astype(np.float32)
+    out = np.empty(binned_shape(shape, factor), np.float32)
+    bin_into(src, out, factor)
+    np.testing.assert_allclose(out, block_mean(src, factor), rtol=1e-5)
+
+
+def test_sum_adds_up_the_block():
+    src = np.random.default_rng(2).uniform(0, 255, (12, 12)).astype(np.float32)
+    out = np.empty((6, 6), np.float32)
+    bin_into(src, out, 2, "sum")
+    np.testing.assert_allclose(out, block_mean(src, 2) * 4, rtol=1e-5)
+
+
+def test_regions_bin_only_their_windows():
+    src = np.random.default_rng(3).uniform(0, 255, (12, 12)).astype(np.float32)
+    out = np.full((6, 6), -1, np.float32)
+    bin_into(src, out, 2, regions=((2, 6, 4, 10),))
+    np.testing.assert_allclose(out[1:3, 2:5], block_mean(src, 2)[1:3, 2:5], rtol=1e-5)
+    out[1:3, 2:5] = -1
+    assert np.all(out == -1)
+
+
+def test_binned_shape_crops_incomplete_blocks():
+    assert binned_shape((721, 1281, 3), 2) == (360, 640, 3)
+    assert binned_shape((720, 1280), 3) == (240, 426)
+
+
+def test_native_coordinates_round_trip():
+    assert to_native((1.0, 2.0), 1) == (1.0, 2.0)
+    assert to_native((0.0, 0.0), 2) == (0.5, 0.5)
+    assert from_native(to_native((3.25, 7.5), 3), 3) == pytest.approx((3.25, 7.5))
+    assert to_native(None, 2) is None
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from bufferpool import BufferPool
+
+
+def test_released_buffers_are_reused():
+    pool = BufferPool("test")
+    first = pool.acquire((4, 5))
+    array = first.array
+    first.release()
+    second = pool.acquire((4, 5))
+    assert second.array is array
+    assert pool.stats() == {"allocations": 1, "reuses": 1, "outstanding": 1, "unpooled": 0}
+
+
+def test_buffers_are_kept_per_shape_and_dtype():
+    pool = BufferPool("test")
+    a = pool.acquire((4, 5))
+    a.release()
+    b = pool.acquire((4, 5), np.float32)
+    c = pool.acquire((5, 4))
+    assert b.array.dtype == np.float32 and c.array.shape == (5, 4)
+    assert pool.allocations == 3
+
+
+def test_last_release_returns_the_buffer():
+    pool = BufferPool("test")
+    buf = pool.acquire((2, 2))
+    buf.retain()
+    buf.release()
+    assert pool.outstanding == 1
+    buf.release()
+    assert pool.outstanding == 0
+    with pytest.raises(RuntimeError):
+        buf.release()
+    with pytest.raises(RuntimeError):
+        buf.retain()
+
+
+def test_free_list_is_bounded():
+    pool = BufferPool("test", max_free=2)
+    buffers = [pool.acquire((2, 2)) for _ in range(4)]
+    for buf in buffers:
+        buf.release()
+    for _ in range(4):
+        pool.acquire((2, 2))
+    assert pool.allocations == 6 and pool.reuses == 2
+
+
+def test_clear_drops_free_buffers():
+    pool = BufferPool("test")
+    pool.acquire((2, 2)).release()
+    pool.clear()
+    pool.acquire((2, 2))
+    pool.count_unpooled()
+    assert pool.stats() == {"allocations": 2, "reuses": 0, "outstanding": 1, "unpooled": 1}
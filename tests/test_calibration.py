@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from calibration import Calibration
+
+SHAPE = (8, 10, 3)
+
+
+@pytest.fixture
+def calibration(tmp_path):
+    calibration = Calibration()
+    calibration.directory = str(tmp_path)
+    return calibration
+
+
+def test_nothing_active_without_masters(calibration):
+    assert not calibration.select(100, 5, SHAPE)
+    assert calibration.status() == {"dark": False, "flat": False}
+
+
+def test_dark_selected_by_exposure_gain_and_shape(calibration):
+    calibration.save_dark(np.full(SHAPE, 3, np.float32), 100, 5)
+    assert calibration.select(100, 5, SHAPE)
+    assert calibration.status() == {"dark": True, "flat": False}
+    assert not calibration.select(200, 5, SHAPE)
+    assert not calibration.select(100, 6, SHAPE)
+    assert not calibration.select(100, 5, SHAPE[:2])
+    assert calibration.select(100.0, 5.0, SHAPE)
+
+
+def test_flat_only_depends_on_shape(calibration):
+    calibration.save_flat(np.full(SHAPE, 50, np.float32))
+    assert calibration.select(100, 5, SHAPE)
+    assert calibration.select(200, 9, SHAPE)
+    assert calibration.status() == {"dark": False, "flat": True}
+    assert not calibration.select(200, 9, (8, 10))
+
+
+def test_directory_change_reloads_masters(tmp_path):
+    saver = Calibration()
+    saver.directory = str(tmp_path)
+    saver.save_dark(np.zeros(SHAPE, np.float32), 100, 5)
+
+    calibration = Calibration()
+    assert not calibration.select(100, 5, SHAPE)       # before the output directory is known
+    calibration.directory = str(tmp_path)
+    assert calibration.select(100, 5, SHAPE)
+
+
+def test_apply_subtracts_dark_and_divides_by_flat(calibration):
+    rng = np.random.default_rng(1)
+    flat = rng.uniform(40, 60, SHAPE).astype(np.float32)
+    calibration.save_flat(flat)
+    calibration.save_dark(np.full(SHAPE, 2, np.float32), 100, 5)
+    calibration.select(100, 5, SHAPE)
+    frame = rng.uniform(10, 200, SHAPE).astype(np.float32)
+    data = frame.copy()
+    calibration.apply(data)
+    mean = flat.reshape(-1, 3).mean(axis=0)
+    np.testing.assert_allclose(data, (frame - 2) * mean / flat, rtol=1e-5)
+
+
+def test_black_flat_is_rejected(calibration):
+    with pytest.raises(ValueError):
+        calibration.save_flat(np.zeros(SHAPE, np.float32))
+
+
+def test_clear_removes_masters(calibration, tmp_path):
+    calibration.save_dark(np.zeros(SHAPE, np.float32), 100, 5)
+    calibration.save_flat(np.ones(SHAPE, np.float32))
+    calibration.clear()
+    assert not calibration.active
+    assert not list(tmp_path.iterdir())
+
+
+def test_apply_in_regions_leaves_the_rest(calibration):
+    calibration.save_dark(np.full(SHAPE, 2, np.float32), 100, 5)
+    calibration.select(100, 5, SHAPE)
+    data = np.full(SHAPE, 10, np.float32)
+    calibration.apply(data, regions=((0, 4, 0, 5),))
+    assert np.all(data[:4, :5] == 8)
+    assert np.all(data[4:] == 10) and np.all(data[:, 5:] == 10)
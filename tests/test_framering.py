@@ -0,0 +1,93 @@
+import threading
+import numpy as np
+from framering import FrameRing, to_uint8, to_uint16
+
+
+def test_wait_returns_latest_frame():
+    ring = FrameRing(4)
+    assert ring.latest() is None
+    ring.publish(np.full((2, 3), 1, np.uint8), timestamp=10.0, meta={"sequence": 1})
+    ring.publish(np.full((2, 3), 2, np.uint8), timestamp=11.0)
+    slot = ring.wait_for_frame(0, timeout=0)
+    assert slot.seq == 2
+    assert slot.timestamp == 11.0
+    assert np.all(slot.data == 2)
+
+
+def test_wait_times_out_without_new_frame():
+    ring = FrameRing(4)
+    ring.publish(np.zeros((2, 2), np.uint8))
+    assert ring.wait_for_frame(1, timeout=0.01) is None
+
+
+def test_waiter_wakes_on_commit():
+    ring = FrameRing(4)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(ring.wait_for_frame(0, timeout=5)))
+    waiter.start()
+    ring.publish(np.ones((2, 2), np.uint8))
+    waiter.join(5)
+    assert result and result[0].seq == 1
+
+
+def test_slots_wrap_around():
+    ring = FrameRing(3)
+    for value in range(1, 8):
+        ring.publish(np.full((2, 2), value, np.uint8))
+    assert ring.seq == 7
+    assert sorted(slot.seq for slot in ring.slots) == [5, 6, 7]
+    slot = ring.latest()
+    assert slot is ring.slots[7 % 3] and np.all(slot.data == 7)
+
+
+def test_to_uint16_keeps_full_precision():
+    data = np.array([0.0, 1.5, 255.0, 300.0], np.float32)
+    assert to_uint16(data).tolist() == [0, 385, 65535, 65535]
+    raw = np.array([1, 2], np.uint16)
+    assert to_uint16(raw).tolist() == [1, 2] and to_uint16(raw) is not raw
+
+
+def test_valid_until_writer_reuses_slot():
+    ring = FrameRing(4)
+    ring.publish(np.zeros((2, 2), np.uint8))
+    seq = ring.latest().seq
+    assert ring.valid(seq)
+    ring.publish(np.zeros((2, 2), np.uint8))
+    ring.publish(np.zeros((2, 2), np.uint8))
+    assert ring.valid(seq)
+    # size - 1 further commits: the writer fills this slot next
+    ring.publish(np.zeros((2, 2), np.uint8))
+    assert not ring.valid(seq)
+    assert not ring.valid(0)
+
+
+def test_float_frames_have_8bit_view():
+    ring = FrameRing(2)
+    ring.publish(np.array([[0.4, 254.6], [300.0, -3.0]], np.float32))
+    slot = ring.latest()
+    assert slot.data.dtype == np.float32
+    assert slot.frame.dtype == np.uint8
+    assert slot.frame.tolist() == [[0, 254], [255, 0]]
+
+
+def test_to_uint8_uint16_keeps_high_byte():
+    out = np.empty(3, np.uint8)
+    to_uint8(np.array([0, 0x1234, 0xffff], np.uint16), out)
+    assert out.tolist() == [0, 0x12, 0xff]
+
+
+def test_jpeg_slot_decodes_on_access():
+    ring = FrameRing(2)
+    calls = []
+
+    def decode(jpeg):
+        calls.append(bytes(jpeg))
+        return np.full((2, 2), 9, np.uint8)
+
+    ring.commit_jpeg(np.frombuffer(b"\xff\xd8abc", np.uint8), decode)
+    slot = ring.latest()
+    assert bytes(slot.jpeg) == b"\xff\xd8abc"
+    assert calls == []
+    assert np.all(slot.data == 9)
+    assert np.all(slot.data == 9)
+    assert len(calls) == 1
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from hotpixels import HotPixelCorrector, save_hot_pixel_mask, load_hot_pixel_mask, index_path, remove_hot_pixel_mask
+
+HEIGHT, WIDTH = 48, 64
+
+bayer_mask = np.array([
+    [0.1, 0.2, 0.1],
+    [0.2, 1.0, 0.2],
+    [0.1, 0.2, 0.1]
+], dtype=np.float32)
+
+
+def legacy_apply_hot_pixel_mask(frame, hot_pixels):
+    # the former per-pixel loop of Camera.apply_hot_pixel_mask, the reference for the vectorized version
+    if len(frame.shape) == 3:
+        height, width, colors = frame.shape
+    else:
+        height, width = frame.shape
+        colors = 1
+    for c in range(colors):
+        for y, x in hot_pixels:
+            y1, y2 = max(y - 1, 0), min(y + 2, height)
+            x1, x2 = max(x - 1, 0), min(x + 2, width)
+            plane = frame[:, :, c] if colors > 1 else frame
+            central_value = plane[y, x]
+            neighborhood = plane[y1:y2, x1:x2].astype(np.float32)
+            mask_slice = bayer_mask[1 - (y - y1):2 + (y2 - y - 1), 1 - (x - x1):2 + (x2 - x - 1)]
+            neighborhood -= central_value * mask_slice
+            neighborhood = np.clip(neighborhood, 0, 255)
+            plane[y1:y2, x1:x2] = neighborhood.astype(np.uint8)
+            plane[y, x] = int(np.median(neighborhood))
+
+
+def random_hot_pixels(n, height, width, rng):
+    # isolated pixels (at least 3 apart) so the loop and the vectorized version must agree exactly
+    coords = set()
+    while len(coords) < n:
+        coords.add((int(rng.integers(0, height // 3)) * 3, int(rng.integers(0, width // 3)) * 3))
+    return np.array(sorted(coords), dtype=np.int32)
+
+
+def noisy_frame(shape, hot_pixels, rng):
+    frame = rng.integers(0, 40, size=shape, dtype=np.uint8)
+    frame[hot_pixels[:, 0], hot_pixels[:, 1]] = 250
+    return frame
+
+
+@pytest.mark.parametrize("shape", [(HEIGHT, WIDTH, 3), (HEIGHT, WIDTH)])
+def test_matches_legacy_loop(shape):
+    rng = np.random.default_rng(1)
+    hot_pixels = random_hot_pixels(40, HEIGHT, WIDTH, rng)
+    frame = noisy_frame(shape, hot_pixels, rng)
+    expected = frame.copy()
+    legacy_apply_hot_pixel_mask(expected, hot_pixels)
+    HotPixelCorrector(hot_pixels, bayer_mask).apply(frame)
+    np.testing.assert_array_equal(frame, expected)
+
+
+def test_edge_pixels_match_legacy_loop():
+    rng = np.random.default_rng(2)
+    hot_pixels = np.array([[0, 0], [0, 30], [HEIGHT - 1, WIDTH - 1], [20, WIDTH - 1]], dtype=np.int32)
+    frame = noisy_frame((HEIGHT, WIDTH), hot_pixels, rng)
+    expected = frame.copy()
+    legacy_apply_hot_pixel_mask(expected, hot_pixels)
+    HotPixelCorrector(hot_pixels, bayer_mask).apply(frame)
+    np.testing.assert_array_equal(frame, expected)
+
+
+def test_float_frames_are_corrected():
+    rng = np.random.default_rng(4)
+    hot_pixels = random_hot_pixels(20, HEIGHT, WIDTH, rng)
+    frame = noisy_frame((HEIGHT, WIDTH, 3), hot_pixels, rng)
+    expected = frame.copy()
+    legacy_apply_hot_pixel_mask(expected, hot_pixels)
+    data = frame.astype(np.float32)
+    HotPixelCorrector(hot_pixels, bayer_mask).apply(data)
+    np.testing.assert_allclose(data, expected, atol=1)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    hot_pixels = np.array([[5, 6], [20, 30]], dtype=np.int32)
+    path = str(tmp_path / "hot_pixel_mask.npy")
+    corrector = HotPixelCorrector(hot_pixels, bayer_mask)
+    save_hot_pixel_mask(path, corrector, HEIGHT, WIDTH)
+    loaded = load_hot_pixel_mask(path, bayer_mask, HEIGHT, WIDTH)
+    np.testing.assert_array_equal(loaded.coords, hot_pixels)
+    np.testing.assert_array_equal(loaded.index_table(), corrector.index_table())
+
+    # saving again while the old files are memory-mapped replaces them
+    save_hot_pixel_mask(path, HotPixelCorrector(hot_pixels[:1], bayer_mask), HEIGHT, WIDTH)
+    assert len(load_hot_pixel_mask(path, bayer_mask, HEIGHT, WIDTH)) == 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+    remove_hot_pixel_mask(path)
+    assert not list(tmp_path.iterdir())
+
+
+def test_load_converts_legacy_json(tmp_path):
+    path = tmp_path / "hot_pixel_mask.npy"
+    path.write_text("[[5, 6], [20, 30]]")
+    loaded = load_hot_pixel_mask(str(path), bayer_mask, HEIGHT, WIDTH)
+    assert loaded.coords.tolist() == [[5, 6], [20, 30]]
+    assert np.load(str(path)).tolist() == [[5, 6], [20, 30]]
+    assert (tmp_path / index_path(path.name, HEIGHT, WIDTH)).exists()
+
+
+def test_regions_only_touch_hot_pixels_inside():
+    rng = np.random.default_rng(3)
+    hot_pixels = np.array([[10, 10], [30, 50]], dtype=np.int32)
+    frame = noisy_frame((HEIGHT, WIDTH), hot_pixels, rng)
+    original = frame.copy()
+    HotPixelCorrector(hot_pixels, bayer_mask).apply(frame, regions=((0, 20, 0, 20),))
+    assert frame[10, 10] != original[10, 10]
+    np.testing.assert_array_equal(frame[25:, 40:], original[25:, 40:])
@@ -0,0 +1,49 @@
+import numpy as np
+from integration import SlidingIntegrator
+
+
+def random_frames(count, shape, seed=1):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=shape, dtype=np.uint8) for _ in range(count)]
+
+
+def test_mean_of_last_n_frames():
+    frames = random_frames(12, (6, 7, 3))
+    integrator = SlidingIntegrator()
+    out = np.empty((6, 7, 3), np.float32)
+    for i, frame in enumerate(frames):
+        count = integrator.push(frame, 5)
+        window = frames[max(0, i - 4):i + 1]
+        assert count == len(window)
+        integrator.mean_into(out)
+        np.testing.assert_allclose(out, np.mean(window, axis=0), rtol=1e-6)
+
+
+def test_large_windows_use_a_wider_sum():
+    integrator = SlidingIntegrator()
+    integrator.push(np.full((2, 2), 255, np.uint8), 300)
+    assert integrator.sum.dtype == np.uint32
+    integrator.push(np.full((2, 2), 255, np.uint8), 10)
+    assert integrator.sum.dtype == np.uint16
+
+
+def test_restarts_when_window_or_shape_changes():
+    integrator = SlidingIntegrator()
+    for frame in random_frames(3, (4, 4)):
+        integrator.push(frame, 3)
+    assert integrator.push(np.zeros((4, 4), np.uint8), 4) == 1
+    assert integrator.push(np.zeros((5, 4), np.uint8), 4) == 1
+
+
+def test_regions_update_only_their_windows():
+    frames = random_frames(6, (8, 8))
+    regions = ((2, 5, 1, 4),)
+    integrator = SlidingIntegrator()
+    for frame in frames[:3]:
+        integrator.push(frame, 3)
+    for frame in frames[3:]:
+        integrator.push(frame, 3, regions)
+    out = np.empty((8, 8), np.float32)
+    integrator.mean_into(out)
+    np.testing.assert_allclose(out[2:5, 1:4], np.mean(frames[3:], axis=0)[2:5, 1:4], rtol=1e-6)
+    np.testing.assert_allclose(out[6:], np.mean(frames[:3], axis=0)[6:], rtol=1e-6)
@@ -0,0 +1,135 @@
+import time
+import numpy as np
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+import jobs
+from jobs import JobRunner
+
+
+class ThreadJobRunner(JobRunner):
+    # runs the jobs in threads of this process, so the test job kinds below are visible to them
+    def start_pool(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+
+def _sum(frame, params, progress):
+    progress(0.5)
+    return int(frame.sum()) + params.get("add", 0)
+
+
+def _blocking(frame, params, progress):
+    params["started"].set()
+    while not params["release"].wait(0.01):
+        progress(0.5)               # raises JobCancelled once the job was cancelled
+    return int(frame.sum())
+
+
+def _failing(frame, params, progress):
+    raise ValueError("bad frame")
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    monkeypatch.setitem(jobs.JOB_FUNCTIONS, "sum", _sum)
+    monkeypatch.setitem(jobs.JOB_FUNCTIONS, "blocking", _blocking)
+    monkeypatch.setitem(jobs.JOB_FUNCTIONS, "failing", _failing)
+    runner = ThreadJobRunner(workers=1)
+    yield runner
+    runner.shutdown()
+
+
+def wait_finished(runner, job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.active or job.finished is None:
+        assert time.monotonic() < deadline, f"job {job.id} still {job.state}"
+        runner.wait_for_update(runner.version, timeout=0.05)
+    return job
+
+
+def test_submit_runs_the_job_on_a_copy_of_the_frame(runner):
+    frame = np.ones((10, 20), np.uint8)
+    results = []
+    job = runner.submit("sum", frame, {"add": 1}, on_result=results.append)
+    frame[:] = 0                    # submit() copied the frame
+    wait_finished(runner, job)
+    assert job.state == "done" and job.progress == 100
+    assert job.result == 201 and results == [201]
+    assert job._shm is None         # the shared memory block was released
+
+
+def test_same_key_returns_the_cached_job(runner):
+    frame = np.ones((4, 4), np.uint16)
+    job = wait_finished(runner, runner.submit("sum", frame, {}, key=("sum", 1)))
+    results = []
+    again = runner.submit("sum", frame * 2, {}, key=("sum", 1), on_result=results.append)
+    assert again is job and results == [16]
+    other = wait_finished(runner, runner.submit("sum", frame * 2, {}, key=("sum", 2)))
+    assert other is not job and other.result == 32
+
+
+def test_same_key_joins_the_running_job(runner):
+    started, release = Event(), Event()
+    params = {"started": started, "release": release}
+    frame = np.ones((4, 4), np.uint8)
+    results = []
+    job = runner.submit("blocking", frame, params, key="k")
+    assert started.wait(5)
+    assert runner.submit("blocking", frame, params, key="k", on_result=results.append) is job
+    release.set()
+    wait_finished(runner, job)
+    assert job.state == "done" and results == [16]
+
+
+def test_cancel_running_and_queued_jobs(runner):
+    started, release = Event(), Event()
+    frame = np.ones((4, 4), np.uint8)
+    running = runner.submit("blocking", frame, {"started": started, "release": release})
+    assert started.wait(5)
+    queued = runner.submit("sum", frame, {})    # one worker, so this one waits
+    assert runner.cancel(queued.id) and runner.cancel(running.id)
+    wait_finished(runner, running)
+    wait_finished(runner, queued)
+    assert running.state == "cancelled" and queued.state == "cancelled"
+    assert running.result is None and queued.result is None
+    assert not runner.cancel(running.id)        # already finished
+    assert not runner.cancel(12345)
+
+
+def test_failing_job_reports_the_error(runner):
+    job = wait_finished(runner, runner.submit("failing", np.zeros((2, 2), np.uint8), {}, key="f"))
+    assert job.state == "error" and "bad frame" in job.error
+    assert "f" not in runner.cache             # errors are not cached
+
+
+def test_jobs_since_lists_changed_jobs(runner):
+    first = wait_finished(runner, runner.submit("sum", np.ones((2, 2), np.uint8), {}))
+    version = runner.version
+    assert runner.jobs_since(version) == []
+    second = wait_finished(runner, runner.submit("sum", np.ones((3, 3), np.uint8), {}))
+    changed = runner.jobs_since(version)
+    assert [entry["id"] for entry in changed] == [second.id]
+    assert changed[0]["state"] == "done" and changed[0]["result"] == 9
+    assert [entry["id"] for entry in runner.jobs_since(0)] == [first.id, second.id]
+    assert runner.wait_for_update(runner.version, timeout=0.01) is None
+
+
+def test_old_finished_jobs_are_dropped(monkeypatch):
+    monkeypatch.setitem(jobs.JOB_FUNCTIONS, "sum", _sum)
+    runner = ThreadJobRunner(workers=1, cache_size=1, keep=2)
+    try:
+        done = [wait_finished(runner, runner.submit("sum", np.ones((2, 2), np.uint8), {}, key=i)) for i in range(3)]
+        last = wait_finished(runner, runner.submit("sum", np.ones((2, 2), np.uint8), {}, key=3))
+        assert list(runner.jobs) == [done[2].id, last.id]
+        assert list(runner.cache) == [3]
+    finally:
+        runner.shutdown()
+
+
+def test_process_pool_runs_jobs():
+    runner = JobRunner(workers=1)
+    try:
+        job = wait_finished(runner, runner.submit("unknown", np.zeros((2, 2), np.uint8), {}), timeout=60)
+        assert job.state == "error" and "KeyError" in job.error
+    finally:
+        runner.shutdown()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from latency import LatencyHistogram, LatencyStats
+
+
+def test_latencies_fall_into_millisecond_bins():
+    histogram = LatencyHistogram(edges_ms=(10, 100))
+    for seconds in (0.001, 0.010, 0.05, 0.5, None):
+        histogram.record(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot["counts"] == [2, 1, 1]
+    assert snapshot["count"] == 4
+    assert snapshot["max_ms"] == 500.0
+    assert snapshot["last_ms"] == 500.0
+    assert snapshot["mean_ms"] == pytest.approx((1 + 10 + 50 + 500) / 4, abs=0.01)
+
+
+def test_percentiles_are_bin_edges():
+    histogram = LatencyHistogram(edges_ms=(10, 100))
+    assert histogram.percentile(50) is None
+    for _ in range(9):
+        histogram.record(0.005)
+    histogram.record(0.050)
+    assert histogram.percentile(50) == 10
+    assert histogram.percentile(95) == 100
+    histogram.record(5.0)
+    histogram.record(5.0)
+    assert histogram.percentile(95) is None      # beyond the last edge
+
+
+def test_negative_latencies_count_as_zero():
+    histogram = LatencyHistogram(edges_ms=(10,))
+    histogram.record(-0.5)
+    assert histogram.snapshot()["counts"] == [1, 0]
+
+
+def test_stats_create_histograms_on_first_use():
+    stats = LatencyStats()
+    stats.record("decode", 0.002)
+    stats.record("publish", 0.020)
+    stats.record("publish", None)
+    snapshot = stats.snapshot()
+    assert set(snapshot) == {"decode", "publish"}
+    assert snapshot["publish"]["count"] == 1
+    stats.reset()
+    assert stats.snapshot()["decode"]["count"] == 0
+
+
+def test_published_frames_carry_their_trace(monkeypatch):
+    import camera as camera_module
+    monkeypatch.setattr(camera_module, "get_v4l2_controls", lambda index: {})
+    cam = camera_module.Camera(99)
+    try:
+        cam.integrate_frames = 3
+        cam.alloc_buffers(False)
+        frame = np.zeros(cam.decoded_shape(), np.uint8)
+        for i in range(3):
+            meta = {"sequence": i + 1, "exposure_start": 99.5 + i, "exposure_end": 100.0 + i, "decode_time": 0.001}
+            assert cam.process_frame(frame, 100.0 + i, meta) == (i == 2)
+        slot = cam.ring.latest()
+        assert slot.meta["sequence"] == 3
+        assert slot.meta["integration_count"] == 3
+        assert slot.meta["exposure_start"] == 99.5      # the oldest integrated frame
+        assert slot.meta["exposure_end"] == 102.0
+        assert slot.meta["published"] >= slot.meta["exposure_end"]
+        snapshot = cam.latency.snapshot()
+        assert snapshot["decode"]["count"] == snapshot["process"]["count"] == snapshot["publish"]["count"] == 1
+    finally:
+        cam.close()
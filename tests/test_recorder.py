@@ -0,0 +1,106 @@
+import time
+import numpy as np
+import pytest
+from recorder import SerWriter, FitsWriter, Recorder, ser_ticks
+
+START = 1700000000.25
+
+
+def fits_cards(data):
+    header = data[:2880].decode('ascii')
+    cards = {}
+    for i in range(0, len(header), 80):
+        card = header[i:i + 80]
+        if card.startswith("END"):
+            break
+        key, _, value = card.partition("= ")
+        cards[key.strip()] = value.split(" / ")[0].strip()
+    return cards
+
+
+@pytest.mark.parametrize("shape, color", [((4, 6), SerWriter.MONO), ((4, 6, 3), SerWriter.BGR)])
+def test_ser_header_and_trailer(tmp_path, shape, color):
+    path = str(tmp_path / "test.ser")
+    writer = SerWriter(path, shape, np.uint8, START)
+    frames = [np.full(shape, i, np.uint8) for i in range(3)]
+    for i, frame in enumerate(frames):
+        writer.write(frame, START + i)
+    writer.close()
+
+    data = open(path, 'rb').read()
+    fields = SerWriter.HEADER.unpack(data[:SerWriter.HEADER.size])
+    assert SerWriter.HEADER.size == 178
+    assert fields[0] == b'LUCAM-RECORDER'
+    assert fields[2] == color
+    assert fields[4:8] == (6, 4, 8, 3)              # width, height, bit depth, frames
+    assert fields[12] == ser_ticks(START)           # UTC start
+    frame_bytes = int(np.prod(shape))
+    assert len(data) == 178 + 3 * frame_bytes + 3 * 8
+    assert data[178 + frame_bytes] == 1
+    trailer = np.frombuffer(data[178 + 3 * frame_bytes:], dtype='<i8')
+    assert trailer.tolist() == [ser_ticks(START + i) for i in range(3)]
+
+
+def test_ser_ticks_epoch():
+    assert ser_ticks(0) == 621355968000000000
+    assert ser_ticks(1.5) - ser_ticks(0) == 15_000_000
+
+
+def test_fits_color_cube(tmp_path):
+    path = str(tmp_path / "test.fits")
+    writer = FitsWriter(path, (4, 6, 3), np.uint8, START)
+    frame = np.zeros((4, 6, 3), np.uint8)
+    frame[0, 0] = (1, 2, 3)                         # B, G, R of the top left pixel
+    writer.write(frame, START)
+    writer.write(frame, START + 1)
+    writer.close()
+
+    data = open(path, 'rb').read()
+    cards = fits_cards(data)
+    assert cards["SIMPLE"] == "T"
+    assert cards["BITPIX"] == "8"
+    assert [cards["NAXIS"]] + [cards[f"NAXIS{i}"] for i in range(1, 5)] == ["4", "6", "4", "3", "2"]
+    assert cards["DATE-OBS"] == "'2023-11-14T22:13:20.250'"
+    assert len(data) % 2880 == 0
+    pixels = np.frombuffer(data[2880:2880 + 2 * 3 * 24], np.uint8).reshape(2, 3, 4, 6)
+    # rows bottom-up, planes R, G, B
+    assert pixels[0, :, 3, 0].tolist() == [3, 2, 1]
+
+
+def test_fits_16_bit_offset(tmp_path):
+    path = str(tmp_path / "test.fits")
+    writer = FitsWriter(path, (2, 2), np.uint16, START)
+    writer.write(np.array([[0, 1], [65535, 32768]], np.uint16), START)
+    writer.close()
+
+    data = open(path, 'rb').read()
+    cards = fits_cards(data)
+    assert cards["BITPIX"] == "16" and cards["BZERO"] == "32768"
+    values = np.frombuffer(data[2880:2888], '>i2').astype(np.int32) + 32768
+    assert values.reshape(2, 2).tolist() == [[65535, 32768], [0, 1]]
+
+
+def test_recorder_rotation_keeps_both_files(tmp_path):
+    recorder = Recorder()
+    recorder.output_dir = str(tmp_path)
+    recorder.start()
+    now = time.time()
+    recorder.add_frame(np.zeros((4, 6), np.uint8), now)
+    deadline = time.time() + 5
+    while recorder.frames_written == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    recorder.rotate()
+    recorder.add_frame(np.zeros((4, 6), np.uint8), now)
+    recorder.stop(timeout=5)
+    assert len(list(tmp_path.glob("capture_*.ser"))) == 2
+
+
+def test_recorder_stops_on_unexpected_error():
+    recorder = Recorder()
+    recorder.output_dir = 123       # not a path
+    recorder.start()
+    recorder.add_frame(np.zeros((4, 6), np.uint8))
+    recorder._thread.join(5)
+    assert not recorder.recording
+    assert not recorder.add_frame(np.zeros((4, 6), np.uint8))
+    recorder.stop(timeout=1)
@@ -0,0 +1,22 @@
+import numpy as np
+from regions import make_regions, merge_regions, region_slices, region_mask
+
+
+def test_windows_are_clipped_to_the_frame():
+    assert make_regions([(2, 3)], 4, 20, 30) == ((0, 8, 0, 7),)
+    assert make_regions([(29, 19)], 4, 20, 30) == ((15, 20, 25, 30),)
+    assert make_regions([None], 4, 20, 30) == ()
+
+
+def test_overlapping_windows_are_merged():
+    assert merge_regions([(0, 10, 0, 10), (5, 15, 5, 15), (30, 40, 30, 40)]) == ((0, 15, 0, 15), (30, 40, 30, 40))
+    assert merge_regions([(0, 10, 0, 10), (10, 20, 0, 10)]) == ((0, 10, 0, 10), (10, 20, 0, 10))
+
+
+def test_slices_and_mask():
+    frame = np.arange(100).reshape(10, 10)
+    (rows, cols), = region_slices(((2, 4, 5, 7),))
+    assert frame[rows, cols].tolist() == [[25, 26], [35, 36]]
+    assert region_slices(None) == [(slice(None), slice(None))]
+    mask = region_mask(np.array([2, 3, 4]), np.array([5, 9, 5]), ((2, 4, 5, 7),))
+    assert mask.tolist() == [True, False, False]
@@ -1,8 +1,113 @@
 import subprocess
 import re
+import os
+import glob
+import struct
+import ctypes
+from threading import Lock
+from contextlib import contextmanager
+from v4l2 import (ioctl, v4l2_queryctrl, v4l2_querymenu, v4l2_control, v4l2_ext_control, v4l2_ext_controls,
+                  VIDIOC_QUERYCTRL, VIDIOC_QUERYMENU, VIDIOC_G_CTRL, VIDIOC_S_CTRL, VIDIOC_S_EXT_CTRLS,
+                  V4L2_CTRL_TYPE_INTEGER, V4L2_CTRL_TYPE_BOOLEAN, V4L2_CTRL_TYPE_MENU, V4L2_CTRL_TYPE_INTEGER_MENU,
+                  V4L2_CTRL_FLAG_DISABLED, V4L2_CTRL_FLAG_READ_ONLY, V4L2_CTRL_FLAG_NEXT_CTRL, V4L2_CTRL_WHICH_CUR_VAL)
 
 
+class DeviceWatcher:
+    """
+    Tells whether /dev/video* nodes appeared or disappeared since the last call to changed().
+    Uses a non-blocking inotify descriptor on /dev, so a check is a single read() syscall;
+    falls back to comparing directory listings where inotify is not available.
+    """
+    IN_ATTRIB = 0x004           # udev fixes permissions after creating the node
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    EVENT_HEADER = struct.Struct('iIII')    # struct inotify_event: wd, mask, cookie, len
+
+    def __init__(self, path='/dev', prefix='video'):
+        self.path = path
+        self.prefix = prefix
+        self.fd = None
+        self.nodes = None           # listing for the fallback
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = self.IN_ATTRIB | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            if libc.inotify_add_watch(fd, path.encode(), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            print(f"inotify not available ({e}), polling {path} for camera changes")
+            self.nodes = self._list_nodes()
+
+    def _list_nodes(self):
+        return sorted(glob.glob(os.path.join(self.path, self.prefix + '*')))
+
+    def changed(self):
+        if self.fd is None:
+            nodes = self._list_nodes()
+            changed, self.nodes = nodes != self.nodes, nodes
+            return changed
+        changed = False
+        prefix = self.prefix.encode()
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                if data[offset:offset + length].startswith(prefix):
+                    changed = True
+                offset += length
+
+
+# Discovery cache: the device list and static control metadata (ranges, menus) per camera index,
+# dropped whenever video device nodes come or go. Control values are always read live.
+_cache_lock = Lock()
+_watcher = None
+_cameras = None
+_control_meta = {}
+
+def _validate_cache():
+    # call with _cache_lock held
+    global _watcher, _cameras
+    if _watcher is None:
+        _watcher = DeviceWatcher()
+    elif not _watcher.changed():
+        return
+    _cameras = None
+    _control_meta.clear()
+
+def invalidate_cache():
+    with _cache_lock:
+        global _cameras
+        _cameras = None
+        _control_meta.clear()
+
 def list_cameras():
+    """
+    List all connected cameras with their names, indices, and USB ports.
+    The list is cached until a /dev/video* node is added or removed.
+    :return: A list of dictionaries containing camera names, indices, and USB ports.
+    """
+    global _cameras
+    with _cache_lock:
+        _validate_cache()
+        if _cameras is None:
+            cameras = scan_cameras()
+            if not cameras:
+                return cameras      # do not cache failures, v4l2-ctl may just be missing
+            _cameras = cameras
+        return [dict(camera) for camera in _cameras]
+
+def scan_cameras():
     """
     List all connected cameras with their names, indices, and USB ports using v4l2-ctl.
     :return: A list of dictionaries containing camera names, indices, and USB ports.
@@ -49,83 +154,109 @@ def list_cameras():
         print(f"Unexpected error: {e}")
         return []
     
-def get_v4l2_controls(camera_index):
+@contextmanager
+def open_device(camera_index):
+    # controls are accessed through their own descriptor, independent of the capture backend
+    fd = os.open('/dev/video' + str(camera_index), os.O_RDWR | os.O_NONBLOCK)
     try:
-        # Run v4l2-ctl --list-ctrls-menus
-        result = subprocess.run(['v4l2-ctl', '--list-ctrls-menus', '-d', '/dev/video' + str(camera_index)], 
-                               capture_output=True, 
-                               text=True, 
-                               check=True)
-        output = result.stdout
-
-        # Regex patterns with flexible whitespace (tabs/spaces)
-        int_pattern = r"^\s*(\w+)\s+0x[0-9a-f]+\s+\(int\)\s*: min=(-?\d+) max=(-?\d+) step=(\d+) default=(-?\d+) value=(-?\d+)"
-        bool_pattern = r"^\s*(\w+)\s+0x[0-9a-f]+\s+\(bool\)\s*: default=(\d+) value=(\d+)"
-        menu_pattern = r"^\s*(\w+)\s+0x[0-9a-f]+\s+\(menu\)\s*: min=(\d+) max=(\d+) default=(\d+) value=(\d+)(?:\s+\((.*?)\))?"
-        menu_item_pattern = r"^\s+(\d+):\s*(.+)$"  # Match indented items
+        yield fd
+    finally:
+        os.close(fd)
 
-        controls = {}
-        current_menu = None
-
-        # Process lines
-        lines = output.splitlines()
-        for i, line in enumerate(lines):
-            # Skip empty lines or headers
-            if not line.strip() or line.strip() in ['User Controls', 'Camera Controls']:
-                continue
-
-            # Parse integer controls
-            int_match = re.match(int_pattern, line)
-            if int_match:
-                name, min_val, max_val, step, default, value = int_match.groups()
-                controls[name] = {
-                    'type': 'int',
-                    'min': int(min_val),
-                    'max': int(max_val),
-                    'step': int(step),
-                    'default': int(default),
-                    'value': int(value)
-                }
-                current_menu = None
-                continue
+def control_name(name):
+    # same naming as v4l2-ctl: "Exposure Time, Absolute" -> exposure_time_absolute
+    out = ''
+    underscore = False
+    for ch in name:
+        if ch.isalnum():
+            if underscore:
+                out += '_'
+            underscore = False
+            out += ch.lower()
+        elif out:
+            underscore = True
+    return out
 
-            # Parse boolean controls
-            bool_match = re.match(bool_pattern, line)
-            if bool_match:
-                name, default, value = bool_match.groups()
-                controls[name] = {
-                    'type': 'bool',
-                    'min': 0,
-                    'max': 1,
-                    'default': int(default),
-                    'value': int(value)
-                }
-                current_menu = None
-                continue
-
-            # Parse menu controls
-            menu_match = re.match(menu_pattern, line)
-            if menu_match:
-                name, min_val, max_val, default, value, label = menu_match.groups()
-                controls[name] = {
-                    'type': 'menu',
-                    'min': int(min_val),
-                    'max': int(max_val),
-                    'default': int(default),
-                    'value': int(value),
-                    'label': label if label else '',
-                    'options': {}
-                }
-                current_menu = name
-                continue
+def query_controls(fd):
+    """
+    Enumerates the int, bool and menu controls of an open device.
+    :return: A list of (name, v4l2_queryctrl, menu options) tuples in driver order.
+    """
+    controls = []
+    qctrl = v4l2_queryctrl(id=V4L2_CTRL_FLAG_NEXT_CTRL)
+    while True:
+        try:
+            ioctl(fd, VIDIOC_QUERYCTRL, qctrl)
+        except OSError:
+            break       # EINVAL: no more controls
+        current = qctrl
+        qctrl = v4l2_queryctrl(id=current.id | V4L2_CTRL_FLAG_NEXT_CTRL)
+        if current.flags & V4L2_CTRL_FLAG_DISABLED:
+            continue
+        if current.type not in (V4L2_CTRL_TYPE_INTEGER, V4L2_CTRL_TYPE_BOOLEAN, V4L2_CTRL_TYPE_MENU, V4L2_CTRL_TYPE_INTEGER_MENU):
+            continue    # buttons, strings, control class headers, ...
+        options = {}
+        if current.type in (V4L2_CTRL_TYPE_MENU, V4L2_CTRL_TYPE_INTEGER_MENU):
+            for index in range(current.minimum, current.maximum + 1):
+                qmenu = v4l2_querymenu(id=current.id, index=index)
+                try:
+                    ioctl(fd, VIDIOC_QUERYMENU, qmenu)
+                except OSError:
+                    continue    # menus may have holes
+                if current.type == V4L2_CTRL_TYPE_MENU:
+                    options[index] = qmenu.u.name.decode(errors='replace')
+                else:
+                    options[index] = str(qmenu.u.value)
+        controls.append((control_name(current.name.decode(errors='replace')), current, options))
+    return controls
 
-            # Parse menu items
-            item_match = re.match(menu_item_pattern, line)
-            if item_match and current_menu:
-                idx, text = item_match.groups()
-                controls[current_menu]['options'][int(idx)] = text.strip()
-                continue
+def control_metadata(fd, camera_index):
+    # cached query_controls() of the device
+    with _cache_lock:
+        _validate_cache()
+        if camera_index not in _control_meta:
+            _control_meta[camera_index] = query_controls(fd)
+        return _control_meta[camera_index]
 
+def get_v4l2_controls(camera_index):
+    try:
+        controls = {}
+        with open_device(camera_index) as fd:
+            for name, qctrl, options in control_metadata(fd, camera_index):
+                ctrl = v4l2_control(id=qctrl.id)
+                try:
+                    ioctl(fd, VIDIOC_G_CTRL, ctrl)
+                except OSError as e:
+                    # write-only or inactive controls, or a transient EIO: leave this one out, keep the rest
+                    print(f"Skipping v4l2 control {name}: {e}")
+                    continue
+                if qctrl.type == V4L2_CTRL_TYPE_INTEGER:
+                    controls[name] = {
+                        'type': 'int',
+                        'min': qctrl.minimum,
+                        'max': qctrl.maximum,
+                        'step': qctrl.step,
+                        'default': qctrl.default_value,
+                        'value': ctrl.value
+                    }
+                elif qctrl.type == V4L2_CTRL_TYPE_BOOLEAN:
+                    controls[name] = {
+                        'type': 'bool',
+                        'min': 0,
+                        'max': 1,
+                        'default': qctrl.default_value,
+                        'value': ctrl.value
+                    }
+                else:
+                    controls[name] = {
+                        'type': 'menu',
+                        'min': qctrl.minimum,
+                        'max': qctrl.maximum,
+                        'default': qctrl.default_value,
+                        'value': ctrl.value,
+                        'label': options.get(ctrl.value, ''),
+                        'options': dict(options)
+                    }
         return controls
 
     except Exception as e:
@@ -133,6 +264,10 @@ def get_v4l2_controls(camera_index):
         return None
 
 
+def _control_ids(fd, camera_index):
+    # name -> (id, flags)
+    return {name: (qctrl.id, qctrl.flags) for name, qctrl, _ in control_metadata(fd, camera_index)}
+
 def set_v4l2_control(name, value, camera_index):
     """
     Set a V4L2 control to a specified value.
@@ -145,28 +280,70 @@ def set_v4l2_control(name, value, camera_index):
         bool: True if successful, False if failed.
     """
     try:
-        # Construct the v4l2-ctl command
-        cmd = ['v4l2-ctl', '-d', '/dev/video'+str(camera_index), '--set-ctrl', f"{name}={value}"]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        # Check if the command executed without errors
-        if result.returncode == 0:
-            print(f"Set {name} to {value} successfully")
-            return True
-        else:
-            print(f"Failed to set {name} to {value}: {result.stderr}")
-            return False
+        with open_device(camera_index) as fd:
+            ids = _control_ids(fd, camera_index)
+            if name not in ids:
+                print(f"Failed to set {name} to {value}: unknown control")
+                return False
+            ioctl(fd, VIDIOC_S_CTRL, v4l2_control(id=ids[name][0], value=int(value)))
+        print(f"Set {name} to {value} successfully")
+        return True
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error setting {name} to {value}: {e.stderr}")
+    except OSError as e:
+        print(f"Error setting {name} to {value}: {e}")
         return False
     except Exception as e:
         print(f"Unexpected error setting {name} to {value}: {e}")
         return False
 
 def set_v4l2_controls(controls_to_set, camera_index):
-    for name, value in controls_to_set.items():
-        set_v4l2_control(name, value, camera_index)
+    """
+    Set several V4L2 controls with one VIDIOC_S_EXT_CTRLS call, in the given order.
+    If the driver rejects the batch, the controls are set one by one so a single bad value
+    does not prevent the rest from being applied.
+
+    Returns:
+        bool: True if all controls were set.
+    """
+    try:
+        with open_device(camera_index) as fd:
+            ids = _control_ids(fd, camera_index)
+            batch = []
+            for name, value in controls_to_set.items():
+                if name not in ids:
+                    print(f"Skipping unknown control {name}")
+                elif ids[name][1] & V4L2_CTRL_FLAG_READ_ONLY:
+                    continue
+                else:
+                    batch.append((name, ids[name][0], int(value)))
+            if not batch:
+                return True
+
+            array = (v4l2_ext_control * len(batch))()
+            for item, (_, cid, value) in zip(array, batch):
+                item.id = cid
+                item.u.value = value
+            ext = v4l2_ext_controls(which=V4L2_CTRL_WHICH_CUR_VAL, count=len(batch),
+                                    controls=ctypes.cast(array, ctypes.POINTER(v4l2_ext_control)))
+            try:
+                ioctl(fd, VIDIOC_S_EXT_CTRLS, ext)
+                print(f"Set {len(batch)} controls successfully")
+                return True
+            except OSError as e:
+                print(f"Batched control update failed ({e}), setting controls one by one")
+
+            ok = True
+            for name, cid, value in batch:
+                try:
+                    ioctl(fd, VIDIOC_S_CTRL, v4l2_control(id=cid, value=value))
+                except OSError as e:
+                    print(f"Error setting {name} to {value}: {e}")
+                    ok = False
+            return ok
+
+    except Exception as e:
+        print(f"Unexpected error setting controls: {e}")
+        return False
 
 def extract_v4l2_control_values(controls):
     """
@@ -181,7 +358,7 @@ def extract_v4l2_control_values(controls):
 
 # Test it
 if __name__ == "__main__":
-    controls = get_v4l2_controls()
+    controls = get_v4l2_controls(0)
     print(f"Got {len(controls)} controls .. ")
     if controls:
         for name, info in controls.items():
@@ -0,0 +1,548 @@
+import os
+import time
+import errno
+import fcntl
+import mmap
+import select
+import ctypes
+from collections import deque
+from fractions import Fraction
+import numpy as np
+import cv2
+
+# Minimal V4L2 userspace API (linux/videodev2.h) for 64-bit Linux
+
+# ioctl request encoding (asm-generic/ioctl.h)
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+def _IOC(direction, nr, struct):
+    return (direction << 30) | (ctypes.sizeof(struct) << 16) | (ord('V') << 8) | nr
+
+def _IOR(nr, struct):
+    return _IOC(_IOC_READ, nr, struct)
+
+def _IOW(nr, struct):
+    return _IOC(_IOC_WRITE, nr, struct)
+
+def _IOWR(nr, struct):
+    return _IOC(_IOC_READ | _IOC_WRITE, nr, struct)
+
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_MEMORY_MMAP = 1
+V4L2_FIELD_ANY = 0
+
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_STREAMING = 0x04000000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+V4L2_BUF_FLAG_ERROR = 0x00000040
+V4L2_BUF_FLAG_TIMESTAMP_MASK = 0x0000e000
+V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC = 0x00002000
+
+V4L2_CID_CAMERA_CLASS_BASE = 0x009a0900
+V4L2_CID_EXPOSURE_AUTO = V4L2_CID_CAMERA_CLASS_BASE + 1
+V4L2_CID_EXPOSURE_ABSOLUTE = V4L2_CID_CAMERA_CLASS_BASE + 2
+V4L2_EXPOSURE_MANUAL = 1
+V4L2_EXPOSURE_APERTURE_PRIORITY = 3
+
+V4L2_CTRL_TYPE_INTEGER = 1
+V4L2_CTRL_TYPE_BOOLEAN = 2
+V4L2_CTRL_TYPE_MENU = 3
+V4L2_CTRL_TYPE_INTEGER_MENU = 9
+V4L2_CTRL_FLAG_DISABLED = 0x0001
+V4L2_CTRL_FLAG_READ_ONLY = 0x0004
+V4L2_CTRL_FLAG_NEXT_CTRL = 0x80000000
+V4L2_CTRL_WHICH_CUR_VAL = 0
+
+
+def fourcc(code):
+    return code[0] | (code[1] << 8) | (code[2] << 16) | (code[3] << 24) if isinstance(code, bytes) else fourcc(code.encode())
+
+V4L2_PIX_FMT_MJPEG = fourcc('MJPG')
+V4L2_PIX_FMT_YUYV = fourcc('YUYV')
+V4L2_PIX_FMT_GREY = fourcc('GREY')
+
+
+class v4l2_capability(ctypes.Structure):
+    _fields_ = [
+        ('driver', ctypes.c_char * 16),
+        ('card', ctypes.c_char * 32),
+        ('bus_info', ctypes.c_char * 32),
+        ('version', ctypes.c_uint32),
+        ('capabilities', ctypes.c_uint32),
+        ('device_caps', ctypes.c_uint32),
+        ('reserved', ctypes.c_uint32 * 3),
+    ]
+
+class v4l2_pix_format(ctypes.Structure):
+    _fields_ = [
+        ('width', ctypes.c_uint32),
+        ('height', ctypes.c_uint32),
+        ('pixelformat', ctypes.c_uint32),
+        ('field', ctypes.c_uint32),
+        ('bytesperline', ctypes.c_uint32),
+        ('sizeimage', ctypes.c_uint32),
+        ('colorspace', ctypes.c_uint32),
+        ('priv', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('ycbcr_enc', ctypes.c_uint32),
+        ('quantization', ctypes.c_uint32),
+        ('xfer_func', ctypes.c_uint32),
+    ]
+
+class _v4l2_format_union(ctypes.Union):
+    _fields_ = [
+        ('pix', v4l2_pix_format),
+        ('raw_data', ctypes.c_uint8 * 200),
+        ('_align', ctypes.c_void_p),        # struct v4l2_window holds pointers -> 8 byte alignment
+    ]
+
+class v4l2_format(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('fmt', _v4l2_format_union),
+    ]
+
+class v4l2_requestbuffers(ctypes.Structure):
+    _fields_ = [
+        ('count', ctypes.c_uint32),
+        ('type', ctypes.c_uint32),
+        ('memory', ctypes.c_uint32),
+        ('capabilities', ctypes.c_uint32),
+        ('flags', ctypes.c_uint8),
+        ('reserved', ctypes.c_uint8 * 3),
+    ]
+
+class timeval(ctypes.Structure):
+    _fields_ = [
+        ('tv_sec', ctypes.c_long),
+        ('tv_usec', ctypes.c_long),
+    ]
+
+class v4l2_timecode(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('frames', ctypes.c_uint8),
+        ('seconds', ctypes.c_uint8),
+        ('minutes', ctypes.c_uint8),
+        ('hours', ctypes.c_uint8),
+        ('userbits', ctypes.c_uint8 * 4),
+    ]
+
+class _v4l2_buffer_m(ctypes.Union):
+    _fields_ = [
+        ('offset', ctypes.c_uint32),
+        ('userptr', ctypes.c_ulong),
+        ('planes', ctypes.c_void_p),
+        ('fd', ctypes.c_int32),
+    ]
+
+class v4l2_buffer(ctypes.Structure):
+    _fields_ = [
+        ('index', ctypes.c_uint32),
+        ('type', ctypes.c_uint32),
+        ('bytesused', ctypes.c_uint32),
+        ('flags', ctypes.c_uint32),
+        ('field', ctypes.c_uint32),
+        ('timestamp', timeval),
+        ('timecode', v4l2_timecode),
+        ('sequence', ctypes.c_uint32),
+        ('memory', ctypes.c_uint32),
+        ('m', _v4l2_buffer_m),
+        ('length', ctypes.c_uint32),
+        ('reserved2', ctypes.c_uint32),
+        ('request_fd', ctypes.c_int32),
+    ]
+
+class v4l2_fract(ctypes.Structure):
+    _fields_ = [
+        ('numerator', ctypes.c_uint32),
+        ('denominator', ctypes.c_uint32),
+    ]
+
+class v4l2_captureparm(ctypes.Structure):
+    _fields_ = [
+        ('capability', ctypes.c_uint32),
+        ('capturemode', ctypes.c_uint32),
+        ('timeperframe', v4l2_fract),
+        ('extendedmode', ctypes.c_uint32),
+        ('readbuffers', ctypes.c_uint32),
+        ('reserved', ctypes.c_uint32 * 4),
+    ]
+
+class _v4l2_streamparm_union(ctypes.Union):
+    _fields_ = [
+        ('capture', v4l2_captureparm),
+        ('raw_data', ctypes.c_uint8 * 200),
+    ]
+
+class v4l2_streamparm(ctypes.Structure):
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('parm', _v4l2_streamparm_union),
+    ]
+
+class v4l2_control(ctypes.Structure):
+    _fields_ = [
+        ('id', ctypes.c_uint32),
+        ('value', ctypes.c_int32),
+    ]
+
+class v4l2_queryctrl(ctypes.Structure):
+    _fields_ = [
+        ('id', ctypes.c_uint32),
+        ('type', ctypes.c_uint32),
+        ('name', ctypes.c_char * 32),
+        ('minimum', ctypes.c_int32),
+        ('maximum', ctypes.c_int32),
+        ('step', ctypes.c_int32),
+        ('default_value', ctypes.c_int32),
+        ('flags', ctypes.c_uint32),
+        ('reserved', ctypes.c_uint32 * 2),
+    ]
+
+class _v4l2_querymenu_union(ctypes.Union):
+    _pack_ = 1
+    _fields_ = [
+        ('name', ctypes.c_char * 32),
+        ('value', ctypes.c_int64),
+    ]
+
+class v4l2_querymenu(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [
+        ('id', ctypes.c_uint32),
+        ('index', ctypes.c_uint32),
+        ('u', _v4l2_querymenu_union),
+        ('reserved', ctypes.c_uint32),
+    ]
+
+class _v4l2_ext_control_union(ctypes.Union):
+    _pack_ = 1
+    _fields_ = [
+        ('value', ctypes.c_int32),
+        ('value64', ctypes.c_int64),
+        ('ptr', ctypes.c_void_p),
+    ]
+
+class v4l2_ext_control(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [
+        ('id', ctypes.c_uint32),
+        ('size', ctypes.c_uint32),
+        ('reserved2', ctypes.c_uint32),
+        ('u', _v4l2_ext_control_union),
+    ]
+
+class v4l2_ext_controls(ctypes.Structure):
+    _fields_ = [
+        ('which', ctypes.c_uint32),
+        ('count', ctypes.c_uint32),
+        ('error_idx', ctypes.c_uint32),
+        ('request_fd', ctypes.c_int32),
+        ('reserved', ctypes.c_uint32),
+        ('controls', ctypes.POINTER(v4l2_ext_control)),
+    ]
+
+
+VIDIOC_QUERYCAP = _IOR(0, v4l2_capability)
+VIDIOC_G_FMT = _IOWR(4, v4l2_format)
+VIDIOC_S_FMT = _IOWR(5, v4l2_format)
+VIDIOC_REQBUFS = _IOWR(8, v4l2_requestbuffers)
+VIDIOC_QUERYBUF = _IOWR(9, v4l2_buffer)
+VIDIOC_QBUF = _IOWR(15, v4l2_buffer)
+VIDIOC_DQBUF = _IOWR(17, v4l2_buffer)
+VIDIOC_STREAMON = _IOW(18, ctypes.c_int)
+VIDIOC_STREAMOFF = _IOW(19, ctypes.c_int)
+VIDIOC_G_PARM = _IOWR(21, v4l2_streamparm)
+VIDIOC_S_PARM = _IOWR(22, v4l2_streamparm)
+VIDIOC_G_CTRL = _IOWR(27, v4l2_control)
+VIDIOC_S_CTRL = _IOWR(28, v4l2_control)
+VIDIOC_QUERYCTRL = _IOWR(36, v4l2_queryctrl)
+VIDIOC_QUERYMENU = _IOWR(37, v4l2_querymenu)
+VIDIOC_G_EXT_CTRLS = _IOWR(71, v4l2_ext_controls)
+VIDIOC_S_EXT_CTRLS = _IOWR(72, v4l2_ext_controls)
+
+
+def ioctl(fd, request, arg):
+    # retry on EINTR, everything else is raised as OSError
+    while True:
+        try:
+            return fcntl.ioctl(fd, request, arg)
+        except InterruptedError:
+            continue
+
+
+class V4L2Capture:
+    """
+    Direct V4L2 mmap streaming capture, a drop-in replacement for cv2.VideoCapture in Camera.
+
+    read() drains all filled driver buffers, requeues the stale ones and returns the newest
+    as a zero-copy NumPy view of the mmap'ed buffer (raw bytes for MJPEG, HxWx2 for YUYV,
+    HxW for GREY). The view stays valid for `hold` - 1 further reads, after that the buffer
+    goes back to the driver. The kernel timestamp and sequence number of the returned
+    buffer are in last_timestamp (time.time() based) and last_sequence.
+    """
+
+    def __init__(self, index, buffers=6, hold=4, timeout=2.0):
+        self.index = index
+        self.nbuffers = buffers         # Driver buffers requested
+        self.hold = hold                # Dequeued buffers kept alive for consumers
+        self.timeout = timeout          # Seconds to wait for a frame in read()
+        self.fd = None
+        self.buffers = []               # mmap per driver buffer
+        self.held = deque()             # Indices of dequeued buffers not yet requeued
+        self.streaming = False
+        self.fmt = v4l2_pix_format()
+        self.last_timestamp = None
+        self.last_sequence = None
+        self.dropped = 0                # Stale buffers skipped to return the newest one
+        self.open()
+
+    # --- device ---
+
+    def open(self):
+        path = f"/dev/video{self.index}"
+        try:
+            self.fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+            cap = v4l2_capability()
+            ioctl(self.fd, VIDIOC_QUERYCAP, cap)
+        except OSError as e:
+            print(f"V4L2: cannot open {path}: {e}")
+            self._close_fd()
+            return False
+        caps = cap.device_caps if cap.capabilities & V4L2_CAP_DEVICE_CAPS else cap.capabilities
+        if not (caps & V4L2_CAP_VIDEO_CAPTURE) or not (caps & V4L2_CAP_STREAMING):
+            print(f"V4L2: {path} ({cap.card.decode(errors='replace')}) does not support streaming capture")
+            self._close_fd()
+            return False
+        self._get_format()
+        return True
+
+    def isOpened(self):
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is None:
+            return
+        self._stop()
+        self._close_fd()
+
+    def _close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # --- format ---
+
+    def _get_format(self):
+        fmt = v4l2_format(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        ioctl(self.fd, VIDIOC_G_FMT, fmt)
+        self.fmt = fmt.fmt.pix
+
+    def _set_format(self, width=None, height=None, pixelformat=None):
+        self._stop()
+        fmt = v4l2_format(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        ioctl(self.fd, VIDIOC_G_FMT, fmt)
+        if width is not None:
+            fmt.fmt.pix.width = int(width)
+        if height is not None:
+            fmt.fmt.pix.height = int(height)
+        if pixelformat is not None:
+            fmt.fmt.pix.pixelformat = int(pixelformat)
+        fmt.fmt.pix.field = V4L2_FIELD_ANY
+        fmt.fmt.pix.bytesperline = 0
+        ioctl(self.fd, VIDIOC_S_FMT, fmt)  # driver adjusts to the nearest supported format
+        self.fmt = fmt.fmt.pix
+
+    def _get_fps(self):
+        parm = v4l2_streamparm(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        ioctl(self.fd, VIDIOC_G_PARM, parm)
+        tpf = parm.parm.capture.timeperframe
+        return tpf.denominator / tpf.numerator if tpf.numerator else 0
+
+    def _set_fps(self, fps):
+        self._stop()
+        frac = Fraction(1 / float(fps)).limit_denominator(1000)
+        parm = v4l2_streamparm(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        parm.parm.capture.timeperframe.numerator = frac.numerator
+        parm.parm.capture.timeperframe.denominator = frac.denominator
+        ioctl(self.fd, VIDIOC_S_PARM, parm)
+
+    # --- controls ---
+
+    def _get_ctrl(self, cid):
+        ctrl = v4l2_control(id=cid)
+        ioctl(self.fd, VIDIOC_G_CTRL, ctrl)
+        return ctrl.value
+
+    def _set_ctrl(self, cid, value):
+        ctrl = v4l2_control(id=cid, value=int(value))
+        ioctl(self.fd, VIDIOC_S_CTRL, ctrl)
+
+    # --- cv2.VideoCapture compatible properties ---
+
+    def set(self, prop, value):
+        if self.fd is None:
+            return False
+        try:
+            if prop == cv2.CAP_PROP_FOURCC:
+                self._set_format(pixelformat=value)
+            elif prop == cv2.CAP_PROP_FRAME_WIDTH:
+                self._set_format(width=value)
+            elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+                self._set_format(height=value)
+            elif prop == cv2.CAP_PROP_FPS:
+                self._set_fps(value)
+            elif prop == cv2.CAP_PROP_EXPOSURE:
+                self._set_ctrl(V4L2_CID_EXPOSURE_ABSOLUTE, value)
+            elif prop == cv2.CAP_PROP_AUTO_EXPOSURE:
+                # same convention as OpenCV: 3 = auto, anything else = manual
+                self._set_ctrl(V4L2_CID_EXPOSURE_AUTO, V4L2_EXPOSURE_APERTURE_PRIORITY if value == 3 else V4L2_EXPOSURE_MANUAL)
+            elif prop == cv2.CAP_PROP_BUFFERSIZE:
+                self._stop()
+                self.nbuffers = max(2, int(value))
+            else:
+                return False        # CONVERT_RGB etc.: this backend always delivers raw buffers
+            return True
+        except OSError as e:
+            print(f"V4L2: failed to set property {prop} to {value}: {e}")
+            return False
+
+    def get(self, prop):
+        if self.fd is None:
+            return 0
+        try:
+            if prop == cv2.CAP_PROP_FOURCC:
+                return self.fmt.pixelformat
+            if prop == cv2.CAP_PROP_FRAME_WIDTH:
+                return self.fmt.width
+            if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+                return self.fmt.height
+            if prop == cv2.CAP_PROP_FPS:
+                return self._get_fps()
+            if prop == cv2.CAP_PROP_EXPOSURE:
+                return self._get_ctrl(V4L2_CID_EXPOSURE_ABSOLUTE)
+            if prop == cv2.CAP_PROP_AUTO_EXPOSURE:
+                return self._get_ctrl(V4L2_CID_EXPOSURE_AUTO)
+            if prop == cv2.CAP_PROP_BUFFERSIZE:
+                return self.nbuffers
+        except OSError as e:
+            print(f"V4L2: failed to get property {prop}: {e}")
+        return 0
+
+    # --- streaming ---
+
+    def _queue(self, index):
+        buf = v4l2_buffer(index=index, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+        ioctl(self.fd, VIDIOC_QBUF, buf)
+
+    def _start(self):
+        req = v4l2_requestbuffers(count=self.nbuffers, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+        ioctl(self.fd, VIDIOC_REQBUFS, req)
+        if req.count < 2:
+            raise OSError(errno.ENOMEM, "not enough V4L2 buffers")
+        for i in range(req.count):
+            buf = v4l2_buffer(index=i, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+            ioctl(self.fd, VIDIOC_QUERYBUF, buf)
+            self.buffers.append(mmap.mmap(self.fd, buf.length, mmap.MAP_SHARED,
+                                          mmap.PROT_READ | mmap.PROT_WRITE, offset=buf.m.offset))
+            self._queue(i)
+        # keep at least two buffers with the driver so streaming never starves
+        hold = max(1, min(self.hold, req.count - 2))
+        if hold < self.hold:
+            print(f"V4L2: driver granted {req.count} buffers, views stay valid for {hold - 1} reads instead of {self.hold - 1}")
+        self.hold = hold
+        ioctl(self.fd, VIDIOC_STREAMON, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+        self.streaming = True
+
+    def _stop(self):
+        if not self.streaming:
+            return
+        ioctl(self.fd, VIDIOC_STREAMOFF, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+        self.streaming = False
+        self.held.clear()
+        for mm in self.buffers:
+            try:
+                mm.close()
+            except BufferError:
+                pass        # a consumer still holds a view, the mapping goes away with it
+        self.buffers = []
+        req = v4l2_requestbuffers(count=0, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+        try:
+            ioctl(self.fd, VIDIOC_REQBUFS, req)
+        except OSError:
+            pass            # buffers still mapped, freed by the driver on close
+
+    def _view(self, buf):
+        mm = self.buffers[buf.index]
+        fmt = self.fmt
+        if fmt.pixelformat == V4L2_PIX_FMT_YUYV:
+            return np.ndarray((fmt.height, fmt.width, 2), dtype=np.uint8, buffer=mm, strides=(fmt.bytesperline, 2, 1))
+        if fmt.pixelformat == V4L2_PIX_FMT_GREY:
+            return np.ndarray((fmt.height, fmt.width), dtype=np.uint8, buffer=mm, strides=(fmt.bytesperline, 1))
+        return np.frombuffer(mm, dtype=np.uint8, count=buf.bytesused)     # compressed
+
+    def read(self, image=None):
+        if self.fd is None:
+            return False, None
+        try:
+            if not self.streaming:
+                self._start()
+            readable, _, _ = select.select([self.fd], [], [], self.timeout)
+            if not readable:
+                return False, None
+
+            # drain everything the driver has filled, keep only the newest buffer
+            newest = None
+            while True:
+                buf = v4l2_buffer(type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+                try:
+                    ioctl(self.fd, VIDIOC_DQBUF, buf)
+                except BlockingIOError:
+                    break
+                if newest is not None:
+                    self._queue(newest.index)
+                    self.dropped += 1
+                newest = buf
+            if newest is None:
+                return False, None
+            if newest.flags & V4L2_BUF_FLAG_ERROR:
+                self._queue(newest.index)
+                return False, None
+
+            self.held.append(newest.index)
+            while len(self.held) > self.hold:
+                self._queue(self.held.popleft())
+        except OSError as e:
+            print(f"V4L2: capture error: {e}")
+            return False, None
+
+        timestamp = newest.timestamp.tv_sec + newest.timestamp.tv_usec / 1e6
+        if newest.flags & V4L2_BUF_FLAG_TIMESTAMP_MASK == V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC:
+            timestamp = time.time() - (time.monotonic() - timestamp)
+        self.last_timestamp = timestamp
+        self.last_sequence = newest.sequence
+        return True, self._view(newest)
+
+
+# Test it, e.g. against the vivid virtual driver: modprobe vivid; python3 v4l2.py <index>
+if __name__ == "__main__":
+    import sys
+    cap = V4L2Capture(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    if not cap.isOpened():
+        sys.exit(1)
+    cap.set(cv2.CAP_PROP_FOURCC, V4L2_PIX_FMT_YUYV)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    print(f"Format {cap.fmt.width}x{cap.fmt.height} fps {cap.get(cv2.CAP_PROP_FPS)}")
+    for i in range(10):
+        ret, frame = cap.read()
+        if not ret:
+            print(f"Failed to capture frame {i}")
+            break
+        print(f"frame {i}: seq {cap.last_sequence} ts {cap.last_timestamp:.3f} shape {frame.shape} dropped {cap.dropped}")
+    cap.release()